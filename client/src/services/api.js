@@ -8,6 +8,8 @@ const api = axios.create({
   timeout: 30000, // 30 seconds timeout
   headers: {
     'Content-Type': 'application/json',
+    // Lets the server shed requests it could not answer before we give up
+    'X-Request-Timeout-Ms': '30000',
   },
 })
 
@@ -0,0 +1,115 @@
+"""Catalog loading: one pydantic Product per row vs the columnar CatalogStore.
+
+A products.json of the requested size is generated once, then each mode
+loads it in its own subprocess so RSS is measured in isolation. Retained
+RSS is what the loaded catalog still holds after the parsed JSON is
+dropped; peak RSS includes the parse itself, which both modes share.
+
+    python -m benchmarks.catalog_benchmark --sizes 100000,1000000
+"""
+import argparse
+import gc
+import json
+import os
+import subprocess
+import sys
+import tempfile
+import time
+from pathlib import Path
+
+from benchmarks.common import latency_summary, peak_rss_mb, time_calls
+from benchmarks.pipeline_benchmark import make_records
+from models.product import Product
+from services.catalog_store import CatalogStore
+
+MODES = ["models", "columnar"]
+
+
+def current_rss_mb() -> float:
+    """Resident set size right now (Linux); falls back to the peak elsewhere"""
+    try:
+        with open("/proc/self/statm") as f:
+            return round(int(f.read().split()[1]) * os.sysconf("SC_PAGE_SIZE") / (1024 * 1024), 1)
+    except OSError:
+        return peak_rss_mb()
+
+
+def run_mode(mode: str, path: Path, iterations: int) -> dict:
+    gc.collect()
+    baseline = current_rss_mb()
+    start = time.perf_counter()
+    with open(path, "r", encoding="utf-8") as f:
+        records = json.load(f)
+    parsed = time.perf_counter()
+    if mode == "models":
+        catalog = [Product(**record) for record in records]
+        positions = {}
+        for i, product in enumerate(catalog):
+            positions.setdefault(product.id, i)
+        lookup = lambda product_id: catalog[positions[product_id]]
+        page = lambda offset: catalog[offset:offset + 50]
+    else:
+        catalog = CatalogStore(records)
+        lookup = lambda product_id: catalog[catalog.position(product_id)].to_product()
+        page = lambda offset: [row.to_product() for row in catalog[offset:offset + 50]]
+    built = time.perf_counter()
+    del records
+    gc.collect()
+
+    n = len(catalog)
+    rows = iter([(i * 7919) % n for i in range(iterations + 1)] * 2).__next__
+    retained = current_rss_mb() - baseline
+    return {
+        "mode": mode,
+        "products": n,
+        "parse_seconds": round(parsed - start, 3),
+        "build_seconds": round(built - parsed, 3),
+        "retained_rss_mb": round(retained, 1),
+        "retained_mb_per_100k": round(retained * 100_000 / n, 1),
+        "peak_rss_growth_mb": round(peak_rss_mb() - baseline, 1),
+        "lookup": latency_summary(time_calls(lambda: lookup(f"bench-{rows()}"), iterations)),
+        "page_of_50": latency_summary(time_calls(lambda: page(rows() % max(n - 50, 1)), iterations)),
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--sizes", default="100000")
+    parser.add_argument("--iterations", type=int, default=1000)
+    parser.add_argument("--json", action="store_true", help="Emit machine-readable JSON")
+    parser.add_argument("--run", choices=MODES, help=argparse.SUPPRESS)
+    parser.add_argument("--input", help=argparse.SUPPRESS)
+    args = parser.parse_args()
+
+    if args.run:
+        print(json.dumps(run_mode(args.run, Path(args.input), args.iterations)))
+        return
+
+    results = []
+    with tempfile.TemporaryDirectory() as tmp:
+        for size in (int(size) for size in args.sizes.split(",")):
+            path = Path(tmp) / f"products_{size}.json"
+            with open(path, "w", encoding="utf-8") as f:
+                json.dump(make_records(size), f)
+            for mode in MODES:
+                output = subprocess.run(
+                    [sys.executable, "-m", "benchmarks.catalog_benchmark", "--run", mode,
+                     "--input", str(path), "--iterations", str(args.iterations)],
+                    capture_output=True, text=True, check=True, cwd=os.getcwd()
+                ).stdout
+                results.append(json.loads(output))
+            path.unlink()
+
+    if args.json:
+        print(json.dumps(results, indent=2))
+        return
+    print(f"{'mode':<10}{'products':>10}{'parse s':>9}{'build s':>9}{'RSS MB':>9}{'MB/100k':>9}"
+          f"{'peak +MB':>10}{'lookup p50 us':>15}{'page p50 us':>13}")
+    for row in results:
+        print(f"{row['mode']:<10}{row['products']:>10}{row['parse_seconds']:>9}{row['build_seconds']:>9}"
+              f"{row['retained_rss_mb']:>9}{row['retained_mb_per_100k']:>9}{row['peak_rss_growth_mb']:>10}"
+              f"{round(row['lookup']['p50_ms'] * 1000, 1):>15}{round(row['page_of_50']['p50_ms'] * 1000, 1):>13}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,66 @@
+"""Compare two benchmark reports written with ``--out``.
+
+Entries are matched by name plus their parameters (catalog size, format,
+concurrency, ...). Latency changes beyond the threshold are flagged.
+
+    python -m benchmarks.compare results/base.json results/head.json --threshold 10
+"""
+import argparse
+import json
+import sys
+from typing import Any, Dict, Tuple
+
+METRICS = ["p50_ms", "p95_ms", "p99_ms", "throughput_per_sec", "peak_rss_mb"]
+# For these a higher value is an improvement
+HIGHER_IS_BETTER = {"throughput_per_sec"}
+
+
+def entry_key(entry: Dict[str, Any]) -> Tuple:
+    params = {
+        key: value for key, value in entry.items()
+        if key not in METRICS and not isinstance(value, (float, dict)) and key not in ("calls",)
+        and not key.endswith("_ms") and not key.endswith("_seconds")
+    }
+    return tuple(sorted(params.items()))
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("base")
+    parser.add_argument("head")
+    parser.add_argument("--threshold", type=float, default=10.0, help="Percent change to flag")
+    args = parser.parse_args()
+
+    with open(args.base) as f:
+        base = json.load(f)
+    with open(args.head) as f:
+        head = json.load(f)
+    base_entries = {entry_key(entry): entry for entry in base["results"]}
+
+    print(f"base {base['meta'].get('commit')}  head {head['meta'].get('commit')}")
+    regressions = 0
+    for entry in head["results"]:
+        previous = base_entries.get(entry_key(entry))
+        if previous is None:
+            continue
+        label = entry["name"] + "".join(f" {key}={value}" for key, value in entry_key(entry) if key != "name")
+        changes = []
+        for metric in METRICS:
+            if metric not in entry or not previous.get(metric):
+                continue
+            change = 100.0 * (entry[metric] - previous[metric]) / previous[metric]
+            worse = -change if metric in HIGHER_IS_BETTER else change
+            flag = ""
+            if worse > args.threshold:
+                flag = " ⚠️"
+                regressions += metric != "peak_rss_mb" or worse > 2 * args.threshold
+            changes.append(f"{metric} {previous[metric]}→{entry[metric]} ({change:+.1f}%){flag}")
+        if changes:
+            print(f"{label}\n    " + "\n    ".join(changes))
+
+    print(f"{regressions} regression(s) beyond {args.threshold}%")
+    sys.exit(1 if regressions else 0)
+
+
+if __name__ == "__main__":
+    main()
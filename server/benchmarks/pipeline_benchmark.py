@@ -0,0 +1,444 @@
+"""Micro, scale and in-process load benchmarks for the matching pipeline.
+
+    python -m benchmarks.pipeline_benchmark micro --products 10000
+    python -m benchmarks.pipeline_benchmark scale --sizes 1000,10000,100000,1000000
+    python -m benchmarks.pipeline_benchmark load --concurrency 16 --requests 2000
+    python -m benchmarks.pipeline_benchmark workers --workers-list 1,2,4 --targets products,vectors
+    python -m benchmarks.pipeline_benchmark all --out results/$(git rev-parse --short HEAD).json
+
+micro times single operations (query encoding, index search, search plus
+product hydration, the text-based fallback, thumbnailing, catalog paging)
+on a generated catalog. scale repeats the catalog-bound ones at each size,
+one subprocess per size so peak RSS is isolated. load drives
+/api/find-similar and /api/products through the real ASGI app at a fixed
+concurrency. workers starts serve.py with each --workers-list count and
+drives the same targets over HTTP, to show how throughput scales with
+worker processes (the client shares the machine, so use more cores than
+workers). Every entry carries p50/p95/p99 latency, throughput and peak
+RSS; compare two --out files with ``python -m benchmarks.compare``.
+
+Run from server/. Catalogs and indexes are generated with a fixed seed and
+built in a temporary directory, so nothing under data/ is touched except
+by the load test, which starts the app as configured.
+"""
+import argparse
+import asyncio
+import contextlib
+import io
+import json
+import os
+import signal
+import socket
+import subprocess
+import sys
+import tempfile
+import time
+from pathlib import Path
+from typing import Any, Dict, List
+
+import numpy as np
+from PIL import Image
+
+from benchmarks.common import latency_summary, peak_rss_mb, run_metadata, time_calls
+from benchmarks.quantization_benchmark import make_vectors
+from benchmarks.thumbnail_benchmark import make_photo
+from models.product import ProductFilter
+from services.catalog_store import CatalogStore
+
+CATEGORIES = ["Electronics", "Clothing", "Home & Kitchen", "Sports", "Books", "Beauty", "Toys", "Furniture"]
+BRANDS = ["Acme", "Globex", "Initech", "Umbrella", "Stark", "Wayne", "Hooli", "Vandelay"]
+WORDS = [
+    "red", "blue", "black", "white", "leather", "wireless", "running", "shoe", "jacket", "lamp",
+    "chair", "desk", "phone", "laptop", "watch", "bag", "bottle", "speaker", "camera", "headphones",
+    "cotton", "wooden", "steel", "classic", "pro", "mini", "smart", "organic", "vintage", "sport",
+    "kettle", "mug", "sofa", "rug", "novel", "serum", "puzzle", "drone", "tent", "backpack",
+]
+QUERY_FILENAMES = ["red_running_shoe.jpg", "wireless_headphones.jpg", "wooden_desk_lamp.jpg", "leather_bag.jpg"]
+# Query vector size the workers benchmark sends; matches the default sentence model
+MINILM_DIM = 384
+
+
+def make_records(n: int, seed: int = 7) -> List[Dict[str, Any]]:
+    """Deterministic synthetic products.json rows with realistic-looking text fields"""
+    rng = np.random.default_rng(seed)
+    words = rng.integers(0, len(WORDS), (n, 8))
+    categories = rng.integers(0, len(CATEGORIES), n)
+    brands = rng.integers(0, len(BRANDS), n)
+    prices = rng.uniform(5, 2000, n).round(2)
+    return [
+        {
+            "id": f"bench-{i}",
+            "name": " ".join(WORDS[j] for j in words[i, :3]).title(),
+            "category": CATEGORIES[categories[i]],
+            "description": " ".join(WORDS[j] for j in words[i, 3:6]),
+            "image_url": f"https://images.example.com/{i}.jpg",
+            "price": float(prices[i]),
+            "brand": BRANDS[brands[i]],
+            "tags": [WORDS[j] for j in words[i, 6:]],
+            "embedding": None,
+            "created_at": "2025-01-01T00:00:00Z",
+        }
+        for i in range(n)
+    ]
+
+
+def make_catalog(n: int, seed: int = 7) -> CatalogStore:
+    return CatalogStore(make_records(n, seed))
+
+
+def make_similarity_service(products: CatalogStore, work_dir: Path, load_model: bool = False):
+    """A SimilarityService over the given catalog with a synthetic index built in work_dir"""
+    from services.product_service import ProductService
+    from services.similarity_service import SimilarityService
+    from services.vector_store import VectorStore
+
+    service = SimilarityService()
+    service.index_path = work_dir / "faiss_index.bin"
+    service.vector_store = VectorStore(work_dir / "embeddings.f32", service.embedding_dim)
+    service.product_service = ProductService()
+    service.product_service._set_catalog(products)
+
+    rng = np.random.default_rng(42)
+    vectors = make_vectors(len(products), service.embedding_dim, max(16, len(products) // 500), rng)
+    service.vector_store.write(vectors)
+    start = time.perf_counter()
+    service._build_index(vectors)
+    build_seconds = time.perf_counter() - start
+
+    if load_model:
+        try:
+            from sentence_transformers import SentenceTransformer
+            service.model = SentenceTransformer(service.model_name, device='cpu')
+        except Exception as e:
+            print(f"⚠️  Could not load {service.model_name}, skipping encode: {e}", file=sys.stderr)
+    return service, vectors, build_seconds
+
+
+def entry(name: str, samples: List[float], **params) -> Dict[str, Any]:
+    summary = latency_summary(samples)
+    total = sum(samples)
+    return {
+        "name": name,
+        **params,
+        **summary,
+        "throughput_per_sec": round(len(samples) / total, 1) if total else None,
+        "peak_rss_mb": peak_rss_mb(),
+    }
+
+
+def catalog_benchmarks(service, vectors: np.ndarray, iterations: int) -> List[Dict[str, Any]]:
+    """Operations whose cost grows with the catalog"""
+    loop = asyncio.new_event_loop()
+    rng = np.random.default_rng(1)
+    n = len(vectors)
+    queries = vectors[rng.integers(0, n, 64)] + 0.05 * rng.standard_normal((64, vectors.shape[1])).astype(np.float32)
+    cursor = iter(range(10 ** 9))
+
+    def next_query():
+        return queries[next(cursor) % len(queries)].reshape(1, -1).copy()
+
+    def run(coro):
+        return loop.run_until_complete(coro)
+
+    # The text fallback scans every product in Python, so cap its calls on big catalogs
+    slow_iterations = max(3, min(iterations, 1_000_000 // max(n, 1)))
+    results = [
+        entry("index_search", time_calls(lambda: service._search(next_query(), min(40, n)), iterations),
+              products=n, k=min(40, n)),
+        entry("search_and_hydrate", time_calls(
+            lambda: run(service._search_embeddings(next_query(), 0.0, 20, None)), iterations), products=n),
+        entry("search_and_hydrate_category", time_calls(
+            lambda: run(service._search_embeddings(next_query(), 0.0, 20, ProductFilter(category="Books"))), iterations),
+            products=n),
+        # A different price bound each call, so the filter mask is rebuilt rather than cached
+        entry("search_and_hydrate_filtered", time_calls(
+            lambda: run(service._search_embeddings(next_query(), 0.0, 20, ProductFilter(
+                max_price=float(rng.integers(50, 500)), brands=["Acme", "Globex"], tags=["red"]
+            ))), iterations), products=n),
+        entry("text_based_fallback", time_calls(
+            lambda: run(service._get_text_based_results(QUERY_FILENAMES[0], 20, None)), slow_iterations), products=n),
+        entry("get_products_page", time_calls(
+            lambda: run(service.product_service.get_products(limit=50, offset=int(rng.integers(0, n)))), iterations),
+            products=n),
+        entry("get_products_category", time_calls(
+            lambda: run(service.product_service.get_products(category="Books", limit=50)), slow_iterations),
+            products=n),
+        # Pre-encoded JSON; offsets repeat, as a client paging through a grid does
+        entry("get_products_page_json", time_calls(
+            lambda: run(service.product_service.get_products_json(limit=50, offset=int(rng.integers(0, 100)) * 50)),
+            iterations), products=n),
+    ]
+    if service.model is not None:
+        paths = iter(QUERY_FILENAMES * iterations)
+        results.insert(0, entry("encode_query", time_calls(
+            lambda: run(service._compute_text_embedding_from_image(next(paths))), iterations), model=service.model_name))
+    loop.close()
+    return results
+
+
+def thumbnail_benchmarks(work_dir: Path, iterations: int) -> List[Dict[str, Any]]:
+    from services.thumbnailer import render_derivative
+
+    results = []
+    for megapixels in (2, 12):
+        source = work_dir / f"photo_{megapixels}mp.jpg"
+        make_photo(source, megapixels, "JPEG")
+        for image_format in ("JPEG", "WEBP"):
+            target = work_dir / f"thumb.{image_format.lower()}"
+            samples = time_calls(lambda: render_derivative(source, 300, 300, image_format, target), max(3, iterations // 5))
+            results.append(entry("thumbnail", samples, megapixels=megapixels, format=image_format, size=300))
+    return results
+
+
+def run_micro(args) -> List[Dict[str, Any]]:
+    with tempfile.TemporaryDirectory() as tmp:
+        work_dir = Path(tmp)
+        products = make_catalog(args.products)
+        service, vectors, build_seconds = make_similarity_service(products, work_dir, load_model=not args.no_model)
+        results = catalog_benchmarks(service, vectors, args.iterations)
+        results.append({"name": "index_build", "products": len(products), "seconds": round(build_seconds, 3),
+                        "peak_rss_mb": peak_rss_mb()})
+        results.extend(thumbnail_benchmarks(work_dir, args.iterations))
+    return results
+
+
+def run_scale_size(size: int, iterations: int) -> List[Dict[str, Any]]:
+    baseline = peak_rss_mb()
+    with tempfile.TemporaryDirectory() as tmp:
+        start = time.perf_counter()
+        products = make_catalog(size)
+        catalog_seconds = time.perf_counter() - start
+        service, vectors, build_seconds = make_similarity_service(products, Path(tmp))
+        results = catalog_benchmarks(service, vectors, iterations)
+    setup = {"name": "catalog_setup", "products": size, "catalog_seconds": round(catalog_seconds, 3),
+             "index_build_seconds": round(build_seconds, 3), "baseline_rss_mb": baseline}
+    for result in results:
+        result["scale"] = size
+    return [setup | {"peak_rss_mb": peak_rss_mb()}] + results
+
+
+def run_scale(args) -> List[Dict[str, Any]]:
+    results = []
+    for size in (int(size) for size in args.sizes.split(",")):
+        # One process per size so each peak RSS reflects that catalog alone
+        output = subprocess.run(
+            [sys.executable, "-m", "benchmarks.pipeline_benchmark", "scale", "--run-size", str(size),
+             "--iterations", str(args.iterations)],
+            capture_output=True, text=True, check=True
+        ).stdout
+        results.extend(json.loads(output))
+        print(f"✅ scale {size}", file=sys.stderr)
+    return results
+
+
+def query_images() -> List[tuple]:
+    images = []
+    for i, filename in enumerate(QUERY_FILENAMES):
+        buffer = io.BytesIO()
+        Image.new("RGB", (640, 480), (40 * i, 90, 160)).save(buffer, "JPEG", quality=85)
+        images.append((filename, buffer.getvalue()))
+    return images
+
+
+def query_vector_bodies(dim: int) -> List[bytes]:
+    rng = np.random.default_rng(3)
+    return [rng.standard_normal(dim).astype("<f4").tobytes() for _ in range(len(QUERY_FILENAMES))]
+
+
+async def drive(
+    client, target: str, concurrency: int, requests: int, images: List[tuple], vector_bodies: List[bytes]
+) -> Dict[str, Any]:
+    latencies: List[float] = []
+    statuses: Dict[str, int] = {}
+    issued = 0
+
+    async def one(i: int):
+        if target == "find_similar":
+            filename, contents = images[i % len(images)]
+            return await client.post(
+                "/api/find-similar",
+                files={"file": (filename, contents, "image/jpeg")},
+                data={"max_results": "20"}
+            )
+        if target == "vectors":
+            return await client.post(
+                "/api/search/vectors",
+                params={"max_results": 20},
+                content=vector_bodies[i % len(vector_bodies)],
+                headers={"Content-Type": "application/octet-stream"}
+            )
+        return await client.get("/api/products", params={"limit": 50, "offset": (i * 37) % 1000})
+
+    async def worker():
+        nonlocal issued
+        while issued < requests:
+            i = issued
+            issued += 1
+            start = time.perf_counter()
+            response = await one(i)
+            latencies.append(time.perf_counter() - start)
+            statuses[str(response.status_code)] = statuses.get(str(response.status_code), 0) + 1
+
+    start = time.perf_counter()
+    await asyncio.gather(*(worker() for _ in range(concurrency)))
+    wall = time.perf_counter() - start
+    return {
+        "name": f"load_{target}",
+        "concurrency": concurrency,
+        **latency_summary(latencies),
+        "throughput_per_sec": round(len(latencies) / wall, 1),
+        "statuses": statuses,
+        "peak_rss_mb": peak_rss_mb(),
+    }
+
+
+async def run_load_async(args) -> List[Dict[str, Any]]:
+    import httpx
+    import main
+
+    await main.initialize_services()
+    if args.products:
+        # Swap in a generated catalog of the requested size, in memory only
+        products = make_catalog(args.products)
+        work_dir = Path(tempfile.mkdtemp())
+        service, _, _ = make_similarity_service(products, work_dir)
+        main.similarity_service.index = service.index
+        main.similarity_service.vector_store = service.vector_store
+        for product_service in (main.product_service, main.similarity_service.product_service):
+            product_service._set_catalog(products)
+
+    images = query_images()
+    vector_bodies = query_vector_bodies(main.similarity_service.embedding_dim)
+    transport = httpx.ASGITransport(app=main.app)
+    results = []
+    async with httpx.AsyncClient(transport=transport, base_url="http://benchmark", timeout=60.0) as client:
+        for target in args.targets.split(","):
+            # Warm up caches and lazy imports before timing
+            await drive(client, target, 1, min(10, args.requests), images, vector_bodies)
+            result = await drive(client, target, args.concurrency, args.requests, images, vector_bodies)
+            result["products"] = len(main.product_service.products)
+            results.append(result)
+    return results
+
+
+def run_load(args) -> List[Dict[str, Any]]:
+    # Service logs (startup and per-request) go to stderr so --json output stays parseable
+    with contextlib.redirect_stdout(sys.stderr):
+        return asyncio.run(run_load_async(args))
+
+
+def free_port() -> int:
+    with socket.socket() as sock:
+        sock.bind(("127.0.0.1", 0))
+        return sock.getsockname()[1]
+
+
+async def wait_until_healthy(client, process: subprocess.Popen, timeout: float = 300.0):
+    deadline = time.monotonic() + timeout
+    while time.monotonic() < deadline:
+        if process.poll() is not None:
+            raise RuntimeError(f"serve.py exited with status {process.returncode}")
+        try:
+            if (await client.get("/health")).status_code == 200:
+                return
+        except Exception:
+            pass
+        await asyncio.sleep(0.5)
+    raise RuntimeError("serve.py did not become healthy in time")
+
+
+async def run_workers_async(args) -> List[Dict[str, Any]]:
+    import httpx
+
+    images = query_images()
+    vector_bodies = query_vector_bodies(MINILM_DIM)
+    results = []
+    for workers in [int(count) for count in args.workers_list.split(",")]:
+        port = free_port()
+        process = subprocess.Popen(
+            [sys.executable, "serve.py", "--host", "127.0.0.1", "--port", str(port),
+             "--workers", str(workers), "--log-level", "warning"],
+            stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL
+        )
+        try:
+            limits = httpx.Limits(max_connections=args.concurrency, max_keepalive_connections=args.concurrency)
+            async with httpx.AsyncClient(base_url=f"http://127.0.0.1:{port}", limits=limits, timeout=60.0) as client:
+                await wait_until_healthy(client, process)
+                for target in args.targets.split(","):
+                    await drive(client, target, workers, min(10 * workers, args.requests), images, vector_bodies)
+                    result = await drive(client, target, args.concurrency, args.requests, images, vector_bodies)
+                    result["name"] = f"workers_{target}"
+                    result["workers"] = workers
+                    # Only the client's own RSS is visible here
+                    result.pop("peak_rss_mb")
+                    results.append(result)
+        finally:
+            process.send_signal(signal.SIGTERM)
+            try:
+                process.wait(timeout=30)
+            except subprocess.TimeoutExpired:
+                process.kill()
+    return results
+
+
+def run_workers(args) -> List[Dict[str, Any]]:
+    return asyncio.run(run_workers_async(args))
+
+
+def print_table(results: List[Dict[str, Any]]):
+    print(f"{'benchmark':<30}{'products':>10}{'p50 ms':>10}{'p95 ms':>10}{'p99 ms':>10}{'ops/s':>10}{'RSS MB':>9}")
+    for row in results:
+        if "p50_ms" not in row:
+            continue
+        label = row["name"] + (f" {row['format']} {row['megapixels']}MP" if row["name"] == "thumbnail" else "")
+        if "workers" in row:
+            label += f" x{row['workers']}"
+        print(f"{label:<30}{row.get('products', row.get('scale', '')):>10}{row['p50_ms']:>10}{row['p95_ms']:>10}"
+              f"{row['p99_ms']:>10}{row['throughput_per_sec']:>10}{row.get('peak_rss_mb', ''):>9}")
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("part", choices=["micro", "scale", "load", "workers", "all"])
+    parser.add_argument("--products", type=int, default=None,
+                        help="Catalog size for micro (default 10000) and load (default: the configured catalog)")
+    parser.add_argument("--sizes", default="1000,10000,100000", help="Comma-separated catalog sizes for scale")
+    parser.add_argument("--iterations", type=int, default=200)
+    parser.add_argument("--no-model", action="store_true", help="Skip loading the sentence model in micro")
+    parser.add_argument("--concurrency", type=int, default=16)
+    parser.add_argument("--requests", type=int, default=500, help="Requests per load target")
+    parser.add_argument("--targets", default="find_similar,vectors,products")
+    parser.add_argument("--workers-list", default="1,2,4", help="Comma-separated serve.py worker counts for workers")
+    parser.add_argument("--json", action="store_true", help="Print machine-readable JSON instead of a table")
+    parser.add_argument("--out", help="Also write the JSON report to this file")
+    parser.add_argument("--run-size", type=int, help=argparse.SUPPRESS)
+    args = parser.parse_args()
+
+    if args.run_size:
+        print(json.dumps(run_scale_size(args.run_size, args.iterations)))
+        return
+
+    results = []
+    if args.part in ("micro", "all"):
+        micro_args = argparse.Namespace(**{**vars(args), "products": args.products or 10_000})
+        results.extend(run_micro(micro_args))
+    if args.part in ("scale", "all"):
+        results.extend(run_scale(args))
+    if args.part in ("load", "all"):
+        results.extend(run_load(args))
+    if args.part == "workers":
+        results.extend(run_workers(args))
+
+    report = {"meta": run_metadata(), "args": {k: v for k, v in vars(args).items() if k != "run_size"},
+              "results": results}
+    if args.out:
+        Path(args.out).parent.mkdir(parents=True, exist_ok=True)
+        Path(args.out).write_text(json.dumps(report, indent=2))
+    if args.json:
+        print(json.dumps(report, indent=2))
+    else:
+        print_table(results)
+
+
+if __name__ == "__main__":
+    main()
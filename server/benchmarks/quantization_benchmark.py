@@ -0,0 +1,107 @@
+"""Memory vs recall for the INDEX_QUANTIZATION storage options.
+
+Builds each index type over synthetic clustered, L2-normalized 384-d
+vectors (MiniLM-shaped) and reports serialized index size, bytes per
+vector, recall@k against exact float32 search and query latency.
+
+    python -m benchmarks.quantization_benchmark --products 100000
+"""
+import argparse
+import json
+import time
+import numpy as np
+import faiss
+
+from services.vector_store import VectorStore
+from services.similarity_service import QUANTIZATION_TYPES
+
+
+def make_vectors(n: int, dim: int, clusters: int, rng: np.random.Generator) -> np.ndarray:
+    centers = rng.standard_normal((clusters, dim)).astype(np.float32)
+    assignments = rng.integers(0, clusters, n)
+    vectors = centers[assignments] + 0.6 * rng.standard_normal((n, dim)).astype(np.float32)
+    faiss.normalize_L2(vectors)
+    return vectors
+
+
+def build_index(quantization: str, vectors: np.ndarray):
+    dim = vectors.shape[1]
+    qtype = QUANTIZATION_TYPES[quantization]
+    if qtype is None:
+        index = faiss.IndexFlatIP(dim)
+    else:
+        index = faiss.IndexScalarQuantizer(dim, qtype, faiss.METRIC_INNER_PRODUCT)
+        index.train(vectors)
+    index.add(vectors)
+    return index
+
+
+def recall_at_k(truth: np.ndarray, found: np.ndarray) -> float:
+    hits = sum(len(set(t) & set(f)) for t, f in zip(truth, found))
+    return hits / truth.size
+
+
+def rerank(index, store: VectorStore, queries: np.ndarray, k: int, candidates: int) -> np.ndarray:
+    _, candidate_ids = index.search(queries, candidates)
+    found = np.empty((len(queries), k), dtype=np.int64)
+    for row, (query, ids) in enumerate(zip(queries, candidate_ids)):
+        exact = store.get(ids) @ query
+        found[row] = ids[np.argsort(-exact)[:k]]
+    return found
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--products", type=int, default=100_000)
+    parser.add_argument("--queries", type=int, default=1_000)
+    parser.add_argument("--dim", type=int, default=384)
+    parser.add_argument("--k", type=int, default=10)
+    parser.add_argument("--store", default="/tmp/quantization_benchmark.f32")
+    parser.add_argument("--json", action="store_true", help="Emit machine-readable JSON")
+    args = parser.parse_args()
+
+    rng = np.random.default_rng(42)
+    vectors = make_vectors(args.products, args.dim, max(16, args.products // 500), rng)
+    queries = vectors[rng.choice(args.products, args.queries, replace=False)].copy()
+    queries += 0.1 * rng.standard_normal(queries.shape).astype(np.float32)
+    faiss.normalize_L2(queries)
+
+    store = VectorStore(args.store, args.dim)
+    store.write(vectors)
+
+    exact = build_index("none", vectors)
+    _, truth = exact.search(queries, args.k)
+
+    configs = [("none", 0), ("fp16", 0), ("sq8", 0), ("sq8", 4 * args.k), ("sq8", 10 * args.k)]
+    rows = []
+    for quantization, candidates in configs:
+        index = exact if quantization == "none" else build_index(quantization, vectors)
+        index_bytes = faiss.serialize_index(index).nbytes
+        start = time.perf_counter()
+        if candidates:
+            found = rerank(index, store, queries, args.k, candidates)
+        else:
+            _, found = index.search(queries, args.k)
+        elapsed = time.perf_counter() - start
+        rows.append({
+            "quantization": quantization,
+            "rerank_candidates": candidates,
+            "index_mb": round(index_bytes / 1e6, 1),
+            "bytes_per_vector": round(index_bytes / args.products, 1),
+            f"recall@{args.k}": round(recall_at_k(truth, found), 4),
+            "ms_per_query": round(1000 * elapsed / args.queries, 3),
+        })
+
+    if args.json:
+        print(json.dumps({"products": args.products, "dim": args.dim, "results": rows}, indent=2))
+        return
+
+    print(f"{args.products} products, dim {args.dim}, {args.queries} queries")
+    print(f"{'storage':<10}{'rerank':>8}{'index MB':>10}{'B/vec':>8}{'recall@' + str(args.k):>11}{'ms/query':>10}")
+    for row in rows:
+        print(f"{row['quantization']:<10}{row['rerank_candidates']:>8}{row['index_mb']:>10}"
+              f"{row['bytes_per_vector']:>8}{row[f'recall@{args.k}']:>11}{row['ms_per_query']:>10}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,132 @@
+"""Upload thumbnailing: legacy path vs the single-decode draft-mode engine.
+
+Inputs are generated and each mode is run in its own subprocess so peak
+RSS (ru_maxrss, which a child inherits from its parent at fork) is
+measured in isolation. The RSS reported is the growth over the process
+baseline after imports.
+
+    python -m benchmarks.thumbnail_benchmark --megapixels 24 --iterations 10
+"""
+import argparse
+import json
+import os
+import resource
+import subprocess
+import sys
+import tempfile
+import time
+from pathlib import Path
+
+import numpy as np
+from PIL import Image
+
+from services.thumbnailer import ThumbnailSpec, render_thumbnails
+
+MODES = ["legacy", "engine"]
+
+
+def make_photo(path: Path, megapixels: float, image_format: str):
+    """Smooth synthetic photo so JPEG sizes resemble real camera output"""
+    width = int((megapixels * 1e6 * 4 / 3) ** 0.5)
+    height = int(width * 3 / 4)
+    rng = np.random.default_rng(0)
+    small = (rng.random((height // 16, width // 16, 3)) * 255).astype(np.uint8)
+    img = Image.fromarray(small).resize((width, height), Image.Resampling.BILINEAR)
+    if image_format == "PNG":
+        img = img.convert("RGBA")
+        img.save(path, "PNG", compress_level=1)
+    else:
+        img.save(path, "JPEG", quality=92)
+
+
+def legacy(path: Path, out_dir: Path):
+    """The pre-engine ImageService._process_image + _create_thumbnail path"""
+    work = out_dir / f"legacy{path.suffix}"
+    work.write_bytes(path.read_bytes())
+    with Image.open(work) as img:
+        if img.mode != 'RGB':
+            img = img.convert('RGB')
+            img.save(work, 'JPEG', quality=95)
+        thumbnail = img.copy()
+        thumbnail.thumbnail((300, 300), Image.Resampling.LANCZOS)
+        thumbnail.save(out_dir / "legacy_thumb.jpg", 'JPEG', quality=85)
+
+
+def engine(path: Path, out_dir: Path):
+    render_thumbnails(path, [
+        ThumbnailSpec(300, "JPEG", out_dir / "engine_300.jpg"),
+        ThumbnailSpec(300, "WEBP", out_dir / "engine_300.webp"),
+        ThumbnailSpec(150, "WEBP", out_dir / "engine_150.webp"),
+    ])
+
+
+def peak_rss_mb() -> float:
+    # ru_maxrss is KiB on Linux, bytes on macOS
+    scale = 1 if sys.platform == "darwin" else 1024
+    return resource.getrusage(resource.RUSAGE_SELF).ru_maxrss * scale / 1e6
+
+
+def run_mode(mode: str, path: Path, iterations: int) -> dict:
+    runner = legacy if mode == "legacy" else engine
+    baseline = peak_rss_mb()
+    latencies = []
+    with tempfile.TemporaryDirectory() as out_dir:
+        for _ in range(iterations):
+            start = time.perf_counter()
+            runner(path, Path(out_dir))
+            latencies.append((time.perf_counter() - start) * 1000)
+    latencies.sort()
+    return {
+        "mode": mode,
+        "p50_ms": round(latencies[len(latencies) // 2], 1),
+        "min_ms": round(latencies[0], 1),
+        "peak_rss_growth_mb": round(peak_rss_mb() - baseline, 1),
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--megapixels", type=float, default=24)
+    parser.add_argument("--iterations", type=int, default=10)
+    parser.add_argument("--formats", default="JPEG,PNG")
+    parser.add_argument("--json", action="store_true", help="Emit machine-readable JSON")
+    parser.add_argument("--run", choices=MODES, help=argparse.SUPPRESS)
+    parser.add_argument("--input", help=argparse.SUPPRESS)
+    parser.add_argument("--make", help=argparse.SUPPRESS)
+    args = parser.parse_args()
+
+    if args.run:
+        print(json.dumps(run_mode(args.run, Path(args.input), args.iterations)))
+        return
+    if args.make:
+        make_photo(Path(args.input), args.megapixels, args.make)
+        return
+
+    results = []
+    with tempfile.TemporaryDirectory() as input_dir:
+        for image_format in args.formats.split(","):
+            path = Path(input_dir) / f"photo.{'png' if image_format == 'PNG' else 'jpg'}"
+            subprocess.run(
+                [sys.executable, "-m", "benchmarks.thumbnail_benchmark", "--make", image_format,
+                 "--input", str(path), "--megapixels", str(args.megapixels)],
+                check=True, cwd=os.getcwd()
+            )
+            for mode in MODES:
+                output = subprocess.run(
+                    [sys.executable, "-m", "benchmarks.thumbnail_benchmark", "--run", mode,
+                     "--input", str(path), "--iterations", str(args.iterations)],
+                    capture_output=True, text=True, check=True, cwd=os.getcwd()
+                ).stdout
+                results.append({"input": image_format, "megapixels": args.megapixels,
+                                "input_mb": round(path.stat().st_size / 1e6, 1), **json.loads(output)})
+
+    if args.json:
+        print(json.dumps(results, indent=2))
+        return
+    print(f"{'input':<6}{'mode':<8}{'p50 ms':>9}{'min ms':>9}{'peak RSS +MB':>14}")
+    for row in results:
+        print(f"{row['input']:<6}{row['mode']:<8}{row['p50_ms']:>9}{row['min_ms']:>9}{row['peak_rss_growth_mb']:>14}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,59 @@
+"""Bulk near-duplicate search over a large set of 64-bit perceptual hashes.
+
+Input is either a .npy array of uint64 hashes (e.g. produced by another
+pipeline) or, with --catalog, the hashes of the current catalog images.
+Writes every pair within --max-distance bits as an (n, 3) int64 .npy of
+(row_i, row_j, distance), with row_i < row_j.
+
+    python -m jobs.dedup_hashes --hashes hashes.npy --max-distance 6 --out pairs.npy
+    python -m jobs.dedup_hashes --catalog --max-distance 6 --out pairs.npy
+"""
+import argparse
+import asyncio
+import time
+import numpy as np
+
+from services.dedup_service import HammingIndex, MAX_DISTANCE
+
+
+async def catalog_hashes() -> np.ndarray:
+    from services.image_service import ImageService
+    from services.product_service import ProductService
+    from services.dedup_service import DedupService
+
+    product_service = ProductService()
+    await product_service.initialize()
+    dedup_service = DedupService(ImageService(), product_service)
+    await dedup_service.ensure_catalog_hashes()
+    print(f"📂 Catalog hashes: {len(dedup_service.index_urls)} unique image URLs")
+    return dedup_service.index_hashes
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Find all near-duplicate hash pairs")
+    source = parser.add_mutually_exclusive_group(required=True)
+    source.add_argument("--hashes", help="Path to a .npy array of uint64 hashes")
+    source.add_argument("--catalog", action="store_true", help="Hash the current catalog images")
+    parser.add_argument("--max-distance", type=int, default=6, choices=range(MAX_DISTANCE + 1),
+                        metavar=f"0-{MAX_DISTANCE}")
+    parser.add_argument("--batch-size", type=int, default=65536)
+    parser.add_argument("--out", default="data/duplicate_pairs.npy")
+    args = parser.parse_args()
+
+    hashes = np.load(args.hashes) if args.hashes else asyncio.run(catalog_hashes())
+    hashes = np.asarray(hashes, dtype=np.uint64)
+
+    start = time.perf_counter()
+    index = HammingIndex()
+    index.add(hashes)
+    built = time.perf_counter()
+    pairs = index.pairs(hashes, args.max_distance, batch_size=args.batch_size)
+    done = time.perf_counter()
+
+    np.save(args.out, pairs)
+    print(f"✅ {len(hashes)} hashes indexed in {built - start:.2f}s, "
+          f"{len(pairs)} pairs within {args.max_distance} bits found in {done - built:.2f}s -> {args.out}")
+
+
+if __name__ == "__main__":
+    main()
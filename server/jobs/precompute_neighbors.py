@@ -0,0 +1,60 @@
+"""Precompute the top-K neighbour graph for the whole catalog.
+
+Writes data/neighbor_graph/{ids,scores}.npy, which GET /api/products/{id}/similar
+serves from directly while it matches the current index. Products added or
+re-embedded through SimilarityService update the saved graph incrementally;
+re-run this job after a full index rebuild. With --catalog the graph is
+built for a named catalog under CATALOGS_DIR instead.
+
+    python -m jobs.precompute_neighbors --k 20 --workers 4
+    python -m jobs.precompute_neighbors --catalog acme
+"""
+import argparse
+import asyncio
+import os
+import time
+from pathlib import Path
+from typing import Optional
+
+from services.similarity_service import SimilarityService
+
+
+async def run(k: int, block_size: int, workers: int, catalog: Optional[str] = None):
+    data_dir = Path("data")
+    if catalog:
+        data_dir = Path(os.getenv("CATALOGS_DIR", "data/catalogs")) / catalog
+        if not (data_dir / "products.json").exists():
+            print(f"❌ No catalog at {data_dir}")
+            return
+    # A named catalog's products.json must load as-is; never substitute the sample catalog
+    similarity_service = SimilarityService(data_dir, sample_data=not catalog)
+    try:
+        await similarity_service.initialize()
+    except Exception as e:
+        print(f"❌ Could not load catalog at {data_dir}: {e}")
+        return
+    if similarity_service.index is None:
+        print("❌ No similarity index available; nothing to precompute")
+        return
+
+    start = time.perf_counter()
+    rows = similarity_service.precompute_neighbors(k=k, block_size=block_size, workers=workers)
+    elapsed = time.perf_counter() - start
+    print(f"✅ Precomputed {k} neighbours for {rows} products in {elapsed:.2f}s "
+          f"-> {similarity_service.neighbor_graph.path}")
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Precompute top-K neighbours for every product")
+    parser.add_argument("--k", type=int, default=20)
+    parser.add_argument("--block-size", type=int, default=1024,
+                        help="Rows per matrix multiply block; bounds peak memory")
+    parser.add_argument("--workers", type=int, default=None,
+                        help="Threads computing blocks in parallel (default: CPU count)")
+    parser.add_argument("--catalog", help="Named catalog under CATALOGS_DIR (default: the catalog in data/)")
+    args = parser.parse_args()
+    asyncio.run(run(args.k, args.block_size, args.workers, args.catalog))
+
+
+if __name__ == "__main__":
+    main()
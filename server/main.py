@@ -1,32 +1,161 @@
-from fastapi import FastAPI, File, UploadFile, HTTPException, Form
+from fastapi import FastAPI, File, UploadFile, HTTPException, Form, Query, Request, Response, Header, Depends
 from fastapi.middleware.cors import CORSMiddleware
-from fastapi.responses import JSONResponse
-from fastapi.staticfiles import StaticFiles
+from fastapi.responses import JSONResponse, StreamingResponse, FileResponse, PlainTextResponse
+from fastapi.encoders import jsonable_encoder
+from fastapi.routing import APIRoute
 from contextlib import asynccontextmanager
 import uvicorn
 import os
+import secrets
+import base64
+import binascii
 from dotenv import load_dotenv
 from typing import List, Optional
 import asyncio
+import itertools
+import json
+import httpx
+import numpy as np
+from pathlib import Path
 
-from models.product import Product, SimilarityResult
+from models.product import Product, ProductFilter, SimilarityResult, DuplicateMatch, DuplicateGroup
 from services.image_service import ImageService
 from services.similarity_service import SimilarityService
 from services.product_service import ProductService
+from services.dedup_service import DedupService, HashesPending, HASHING_RETRY_AFTER, MAX_DISTANCE
+from services.derivative_cache import DerivativeCache
+from services.upload_janitor import TrackedStaticFiles
+from services.catalog_image_pipeline import CATALOG_IMAGE_DIR
+from services.metrics import metrics, MetricsMiddleware, STAGE_SECONDS
+from services.request_profiler import RequestProfiler, ProfilerMiddleware
+from services.loop_monitor import LoopMonitor, MonitoredThreadPoolExecutor
+from services.admission import AdmissionController, Deadline
+from services.response_cache import CachedBody, etag_matches
+from services.catalog_registry import Catalog, CatalogRegistry
 
 
 # Load environment variables
 load_dotenv()
 
+# Bounds for /api/find-similar/batch
+BATCH_MAX_QUERIES = int(os.getenv("BATCH_MAX_QUERIES", 1000))
+BATCH_CONCURRENCY = int(os.getenv("BATCH_CONCURRENCY", 8))
+# Queries searched together; each chunk's results are streamed as soon as it is searched
+BATCH_SEARCH_CHUNK = int(os.getenv("BATCH_SEARCH_CHUNK", 64))
+# Uploaded bytes accepted per request, on top of the per-file limit
+BATCH_MAX_UPLOAD_BYTES = int(os.getenv("BATCH_MAX_UPLOAD_MB", 100)) * 1024 * 1024
+UPLOAD_READ_CHUNK = 1024 * 1024
+
+# Resized image derivatives served from /img
+IMAGE_MAX_DIMENSION = int(os.getenv("IMAGE_MAX_DIMENSION", 2048))
+# Widths and heights /img renders; requested sizes are rounded up to the next one
+IMAGE_SIZES = [
+    size for size in (int(value) for value in os.getenv("IMAGE_SIZES", "64,128,256,512,768,1024,1536,2048").split(","))
+    if 0 < size <= IMAGE_MAX_DIMENSION
+] + [IMAGE_MAX_DIMENSION]
+IMAGE_CACHE_CONTROL = "public, max-age=31536000, immutable"
+IMAGE_FORMATS = {"jpg": "JPEG", "jpeg": "JPEG", "webp": "WEBP"}
+
+# Threads behind asyncio.to_thread (image decoding, hashing, resizing)
+EXECUTOR_WORKERS = int(os.getenv("EXECUTOR_WORKERS", min(32, (os.cpu_count() or 1) + 4)))
+
+# Concurrency limit, wait queue and time budget for the expensive endpoints
+ADMISSION_MAX_CONCURRENT = int(os.getenv("ADMISSION_MAX_CONCURRENT", 4))
+ADMISSION_MAX_QUEUE = int(os.getenv("ADMISSION_MAX_QUEUE", 16))
+ADMISSION_DEFAULT_BUDGET_MS = int(os.getenv("ADMISSION_DEFAULT_BUDGET_MS", 25000))
+ADMISSION_MAX_BUDGET_MS = int(os.getenv("ADMISSION_MAX_BUDGET_MS", 60000))
+
+# Named catalogs served under /api/{catalog}/..., loaded on demand within a memory budget
+CATALOGS_DIR = os.getenv("CATALOGS_DIR", "data/catalogs")
+CATALOG_MEMORY_MB = int(os.getenv("CATALOG_MEMORY_MB", 1024))
+
+# Admin endpoints are disabled unless a token is configured
+ADMIN_TOKEN = os.getenv("ADMIN_TOKEN", "")
+
+# Hash catalog images for /api/dedup at startup instead of on the first dedup request
+DEDUP_PRECOMPUTE = os.getenv("DEDUP_PRECOMPUTE", "false").lower() == "true"
+
 # Initialize services globally
 image_service = ImageService()
 similarity_service = SimilarityService()
 product_service = ProductService()
+dedup_service = DedupService(image_service, product_service)
+catalogs = CatalogRegistry(
+    Path(CATALOGS_DIR),
+    Catalog(None, product_service, similarity_service),
+    CATALOG_MEMORY_MB * 1024 * 1024
+)
+derivative_cache = DerivativeCache(
+    [image_service.upload_dir, CATALOG_IMAGE_DIR],
+    Path(os.getenv("IMAGE_CACHE_DIR", "data/image_cache")),
+    int(os.getenv("IMAGE_CACHE_MAX_MB", 512)) * 1024 * 1024,
+    # Advertised thumbnail sizes are rendered exactly
+    sizes=IMAGE_SIZES + [size for size, _ in image_service.thumbnail_variants],
+    on_source_used=image_service.janitor.touch,
+    rescan_seconds=float(os.getenv("IMAGE_CACHE_RESCAN_SECONDS", 300))
+)
 
-@asynccontextmanager
-async def lifespan(app: FastAPI):
-    """Initialize services on startup"""
-    print("🚀 Starting Visual Product Matcher API...")
+# Event-loop lag and executor saturation, reported on /health
+loop_monitor = LoopMonitor(
+    interval=float(os.getenv("LOOP_MONITOR_INTERVAL_MS", 100)) / 1000,
+    threshold=float(os.getenv("LOOP_STALL_THRESHOLD_MS", 250)) / 1000
+)
+
+# Sheds similarity and dedup requests that cannot finish in time, see services/admission.py
+admission = AdmissionController(
+    max_concurrent=ADMISSION_MAX_CONCURRENT,
+    max_queue=ADMISSION_MAX_QUEUE,
+    default_budget=ADMISSION_DEFAULT_BUDGET_MS / 1000,
+    max_budget=ADMISSION_MAX_BUDGET_MS / 1000
+)
+
+# Opt-in stack-sampling profiles of slow requests, see /api/admin/profiles
+request_profiler = RequestProfiler(
+    Path(os.getenv("PROFILE_DIR", "data/profiles")),
+    threshold_seconds=float(os.getenv("PROFILE_THRESHOLD_MS", 1000)) / 1000,
+    sample_rate=float(os.getenv("PROFILE_SAMPLE_RATE", 0.0)),
+    interval=float(os.getenv("PROFILE_INTERVAL_MS", 5)) / 1000,
+    max_files=int(os.getenv("PROFILE_MAX_FILES", 50))
+)
+
+# Point-in-time figures read from the services when /metrics is scraped
+metrics.gauge("vpm_index_vectors", "Vectors in the similarity index",
+              fn=lambda: similarity_service.index.ntotal if similarity_service.index is not None else 0)
+metrics.gauge("vpm_catalog_products", "Products in the loaded catalog", fn=lambda: len(product_service.products))
+metrics.gauge("vpm_uploads_bytes", "Bytes held in uploads/", fn=lambda: image_service.janitor.total_bytes)
+metrics.counter("vpm_uploads_reclaimed_bytes_total", "Bytes removed from uploads/ by the janitor",
+                fn=lambda: image_service.janitor.stats["reclaimed_bytes"])
+metrics.gauge("vpm_image_cache_bytes", "Bytes held in the derivative image cache", fn=lambda: derivative_cache.total_bytes)
+metrics.counter("vpm_image_cache_hits_total", "Derivative image cache hits", fn=lambda: derivative_cache.stats["hits"])
+metrics.counter("vpm_image_cache_misses_total", "Derivative image cache misses", fn=lambda: derivative_cache.stats["misses"])
+metrics.counter("vpm_image_cache_evictions_total", "Derivative image cache evictions",
+                fn=lambda: derivative_cache.stats["evictions"])
+metrics.gauge("vpm_response_cache_bytes", "Bytes of pre-encoded catalog responses",
+              fn=lambda: product_service.response_cache.total_bytes)
+metrics.counter("vpm_response_cache_hits_total", "Catalog reads served from pre-encoded JSON",
+                fn=lambda: product_service.response_cache.stats["hits"])
+metrics.counter("vpm_response_cache_misses_total", "Catalog reads that had to encode JSON",
+                fn=lambda: product_service.response_cache.stats["misses"])
+metrics.gauge("vpm_catalogs_loaded", "Named catalogs currently loaded", fn=lambda: len(catalogs.loaded))
+metrics.gauge("vpm_catalogs_bytes", "Approximate RAM held by loaded named catalogs", fn=lambda: catalogs.total_bytes)
+metrics.counter("vpm_catalog_loads_total", "Named catalogs loaded from disk", fn=lambda: catalogs.stats["loads"])
+metrics.counter("vpm_catalog_evictions_total", "Named catalogs evicted to stay in the memory budget",
+                fn=lambda: catalogs.stats["evictions"])
+RESPONSE_CACHE_REVALIDATIONS = metrics.counter(
+    "vpm_response_not_modified_total", "Catalog reads answered 304 for a matching If-None-Match"
+)
+
+services_initialized = False
+
+async def initialize_services():
+    """Load catalog, index and model once per process tree.
+
+    The production launcher (serve.py) calls this before forking workers, so
+    the lifespan hook in each worker finds everything already loaded.
+    """
+    global services_initialized
+    if services_initialized:
+        return
     try:
         await similarity_service.initialize()
         await product_service.initialize()
@@ -34,11 +163,43 @@ async def lifespan(app: FastAPI):
     except Exception as e:
         print(f"❌ Error initializing services: {e}")
         # Continue startup even if services fail to initialize
+    services_initialized = True
+
+async def reload_services(start_shards: bool = True):
+    """Re-read catalog and index from disk and swap them in; start_shards=False for serve.py's parent"""
+    try:
+        await product_service.reload()
+        await similarity_service.reload(start_shards)
+        catalogs.clear()
+        print("✅ Services reloaded successfully!")
+    except Exception as e:
+        print(f"❌ Error reloading services: {e}")
+
+@asynccontextmanager
+async def lifespan(app: FastAPI):
+    """Initialize services on startup"""
+    print("🚀 Starting Visual Product Matcher API...")
+    await initialize_services()
+    # Shard processes talk to this worker's event loop, so each worker starts its own
+    await similarity_service.load_shards()
+    
+    # An explicit default executor so the loop monitor can report its saturation
+    default_executor = MonitoredThreadPoolExecutor("default", EXECUTOR_WORKERS, thread_name_prefix="asyncio")
+    asyncio.get_running_loop().set_default_executor(default_executor)
+    loop_monitor.watch_executor(default_executor)
+    
+    if DEDUP_PRECOMPUTE:
+        dedup_service.start_refresh()
+    janitor_task = asyncio.create_task(image_service.janitor.run())
+    monitor_task = asyncio.create_task(loop_monitor.run())
     
     yield
     
     # Cleanup on shutdown
     print("🔄 Shutting down Visual Product Matcher API...")
+    janitor_task.cancel()
+    monitor_task.cancel()
+    similarity_service.close_shards()
 
 app = FastAPI(
     title="Visual Product Matcher API",
@@ -73,17 +234,74 @@ app.add_middleware(
 )
 
 
+app.add_middleware(MetricsMiddleware)
+
+# Not installed at all unless enabled, so it costs nothing when off
+if os.getenv("PROFILE_REQUESTS", "false").lower() == "true":
+    app.add_middleware(ProfilerMiddleware, profiler=request_profiler)
+
+
 # Mount static files for serving uploaded images
 os.makedirs("uploads", exist_ok=True)
-app.mount("/uploads", StaticFiles(directory="uploads"), name="uploads")
+# Served files count as used for the upload janitor's least-recently-used eviction
+app.mount("/uploads", TrackedStaticFiles(image_service.janitor, directory="uploads"), name="uploads")
 
 @app.get("/")
 async def root():
     return {"message": "Visual Product Matcher API", "status": "running"}
 
 @app.get("/health")
-async def health_check():
-    return {"status": "healthy", "service": "visual-product-matcher"}
+async def health_check(readiness: bool = False):
+    """Liveness plus load figures; with readiness=true an overloaded worker answers 503"""
+    event_loop = loop_monitor.snapshot()
+    overloaded = event_loop["overloaded"]
+    payload = {
+        "status": "overloaded" if overloaded else "healthy",
+        "service": "visual-product-matcher",
+        "event_loop": event_loop,
+        "admission": admission.snapshot(),
+        "shards": similarity_service.shards.snapshot() if similarity_service.shards else None,
+        "catalogs": catalogs.snapshot(),
+        "uploads": image_service.janitor.snapshot(),
+        "dedup": dedup_service.snapshot()
+    }
+    if readiness and overloaded:
+        return JSONResponse(payload, status_code=503)
+    return payload
+
+@app.get("/metrics", include_in_schema=False)
+async def get_metrics():
+    """Prometheus text exposition of this worker's metrics"""
+    return PlainTextResponse(metrics.render(), media_type="text/plain; version=0.0.4")
+
+def require_admin(token: Optional[str]):
+    if not ADMIN_TOKEN:
+        raise HTTPException(status_code=403, detail="Admin endpoints are disabled; set ADMIN_TOKEN")
+    if not token or not secrets.compare_digest(token, ADMIN_TOKEN):
+        raise HTTPException(status_code=401, detail="Invalid admin token")
+
+@app.get("/api/admin/profiles")
+async def list_profiles(x_admin_token: Optional[str] = Header(None)):
+    """Stored slow-request profiles, newest first"""
+    require_admin(x_admin_token)
+    return {"profiles": request_profiler.list_profiles()}
+
+@app.get("/api/admin/profiles/{name}")
+async def get_profile(name: str, x_admin_token: Optional[str] = Header(None)):
+    """One profile in collapsed-stack format, ready for flamegraph.pl or speedscope"""
+    require_admin(x_admin_token)
+    path = request_profiler.profile_path(name)
+    if path is None:
+        raise HTTPException(status_code=404, detail="Profile not found")
+    return FileResponse(path, media_type="text/plain", filename=name)
+
+@app.post("/api/admin/shards")
+async def reshard_index(count: int = Query(..., ge=0, le=64), x_admin_token: Optional[str] = Header(None)):
+    """Change this worker's number of index shard processes (0 or 1 searches in-process)"""
+    require_admin(x_admin_token)
+    moved = await similarity_service.reshard(count)
+    shards = similarity_service.shards
+    return {"moved_rows": moved, "shards": shards.snapshot() if shards else None}
 
 @app.post("/api/upload-image", response_model=dict)
 async def upload_image(file: UploadFile = File(...)):
@@ -118,15 +336,44 @@ async def upload_image_url(image_url: str = Form(...)):
     except Exception as e:
         raise HTTPException(status_code=500, detail=f"Error processing image URL: {str(e)}")
 
+def _product_filter(
+    category_filter: Optional[str],
+    min_price: Optional[float],
+    max_price: Optional[float],
+    brands: Optional[List[str]],
+    tags: Optional[List[str]]
+) -> ProductFilter:
+    """Attribute filters applied inside the similarity search"""
+    if min_price is not None and max_price is not None and min_price > max_price:
+        raise HTTPException(status_code=400, detail="min_price must not be greater than max_price")
+    return ProductFilter(
+        category=category_filter or None,
+        min_price=min_price,
+        max_price=max_price,
+        brands=[brand for brand in brands or [] if brand],
+        tags=[tag for tag in tags or [] if tag]
+    )
+
 @app.post("/api/find-similar", response_model=List[SimilarityResult])
 async def find_similar_products(
     file: Optional[UploadFile] = File(None),
     image_url: Optional[str] = Form(None),
     min_similarity: float = Form(0.0),
     max_results: int = Form(20),
-    category_filter: Optional[str] = Form(None)
+    category_filter: Optional[str] = Form(None),
+    min_price: Optional[float] = Form(None),
+    max_price: Optional[float] = Form(None),
+    brands: Optional[List[str]] = Form(None),
+    tags: Optional[List[str]] = Form(None),
+    catalog: Catalog = Depends(catalogs.resolve),
+    deadline: Deadline = Depends(admission.admit)
 ):
-    """Find visually similar products based on uploaded image or URL"""
+    """Find visually similar products based on uploaded image or URL.
+    
+    Repeat `brands` or `tags` to pass several; a product must match one of
+    the brands and carry all of the tags.
+    """
+    filters = _product_filter(category_filter, min_price, max_price, brands, tags)
     try:
         if not file and not image_url:
             raise HTTPException(status_code=400, detail="Either file or image_url must be provided")
@@ -138,54 +385,450 @@ async def find_similar_products(
             image_data = await image_service.process_image_url(image_url)
         
         # Find similar products
-        similar_products = await similarity_service.find_similar_products(
+        deadline.check("similarity search")
+        similar_products = await catalog.similarity.find_similar_products(
             image_data["image_path"],
             min_similarity=min_similarity,
             max_results=max_results,
-            category_filter=category_filter
+            filters=filters
         )
         
-        return similar_products
+        with STAGE_SECONDS.time("response.serialize"):
+            return JSONResponse(jsonable_encoder(similar_products))
+    except HTTPException:
+        raise
     except Exception as e:
         raise HTTPException(status_code=500, detail=f"Error finding similar products: {str(e)}")
 
+def _ndjson_line(payload: dict) -> bytes:
+    return (json.dumps(jsonable_encoder(payload)) + "\n").encode("utf-8")
+
+async def _read_upload(file: UploadFile, max_bytes: int, budget: int) -> bytes:
+    """Read an upload in chunks, failing with 413 as soon as it passes max_bytes or the remaining request budget"""
+    chunks, size = [], 0
+    while True:
+        chunk = await file.read(UPLOAD_READ_CHUNK)
+        if not chunk:
+            return b"".join(chunks)
+        size += len(chunk)
+        if size > max_bytes:
+            raise HTTPException(
+                status_code=413,
+                detail=f"File {file.filename} is too large. Max size is {max_bytes // (1024 * 1024)}MB"
+            )
+        if size > budget:
+            raise HTTPException(
+                status_code=413,
+                detail=f"Uploads too large. Max is {BATCH_MAX_UPLOAD_BYTES // (1024 * 1024)}MB per request"
+            )
+        chunks.append(chunk)
+
+def _take_chunk(queries: dict) -> dict:
+    """Remove and return up to BATCH_SEARCH_CHUNK queries, oldest first"""
+    chunk = dict(itertools.islice(queries.items(), BATCH_SEARCH_CHUNK))
+    for index in chunk:
+        del queries[index]
+    return chunk
+
+async def _search_batch_chunk(
+    queries: dict,
+    min_similarity: float,
+    max_results: int,
+    filters: ProductFilter,
+    similarity: SimilarityService,
+    deadline: Deadline
+) -> List[bytes]:
+    """Search one chunk of prepared queries; returns an NDJSON line per query"""
+    order = sorted(queries)
+    if deadline.remaining() <= 0:
+        return [_ndjson_line({"index": index, "error": "Request deadline exceeded before similarity search"}) for index in order]
+    try:
+        batch_results = await similarity.find_similar_products_batch(
+            [queries[index] for index in order],
+            min_similarity=min_similarity,
+            max_results=max_results,
+            filters=filters
+        )
+    except Exception as e:
+        return [_ndjson_line({"index": index, "error": f"Error finding similar products: {str(e)}"}) for index in order]
+    return [_ndjson_line({"index": index, "results": results}) for index, results in zip(order, batch_results)]
+
+async def _stream_batch_results(
+    uploads: List[tuple],
+    image_urls: List[str],
+    query_vectors: List[List[float]],
+    min_similarity: float,
+    max_results: int,
+    filters: ProductFilter,
+    similarity: SimilarityService,
+    deadline: Deadline
+):
+    """Prepare batch queries concurrently and search them in chunks as they become ready.
+
+    Query indexes number files first, then URLs, then vectors. Preparation
+    errors are streamed as soon as they happen; results follow each batched
+    search of BATCH_SEARCH_CHUNK queries, so lines arrive out of index order.
+    """
+    semaphore = asyncio.Semaphore(BATCH_CONCURRENCY)
+    # Vectors need no preparation and go in the first chunks
+    queries = {
+        index: np.asarray(vector, dtype=np.float32)
+        for index, vector in enumerate(query_vectors, start=len(uploads) + len(image_urls))
+    }
+    
+    async with httpx.AsyncClient() as client:
+        async def prepare(index: int, source: str, payload):
+            async with semaphore:
+                try:
+                    if source == "file":
+                        contents, filename = payload
+                        image_data = await image_service.process_image_bytes(contents, filename, create_thumbnail=False)
+                    else:
+                        image_data = await image_service.process_image_url(payload, create_thumbnail=False, client=client)
+                    return index, image_data["image_path"], None
+                except HTTPException as e:
+                    return index, None, e.detail
+                except Exception as e:
+                    return index, None, str(e)
+        
+        sources = [("file", upload) for upload in uploads] + [("url", url) for url in image_urls]
+        tasks = [prepare(index, source, payload) for index, (source, payload) in enumerate(sources)]
+        for task in asyncio.as_completed(tasks):
+            while len(queries) >= BATCH_SEARCH_CHUNK:
+                for line in await _search_batch_chunk(_take_chunk(queries), min_similarity, max_results, filters, similarity, deadline):
+                    yield line
+            index, image_path, error = await task
+            if error:
+                yield _ndjson_line({"index": index, "error": error})
+            else:
+                queries[index] = image_path
+    
+    while queries:
+        for line in await _search_batch_chunk(_take_chunk(queries), min_similarity, max_results, filters, similarity, deadline):
+            yield line
+
+@app.post("/api/find-similar/batch")
+async def find_similar_products_batch(
+    files: Optional[List[UploadFile]] = File(None),
+    image_urls: Optional[List[str]] = Form(None),
+    vectors: Optional[str] = Form(None),
+    min_similarity: float = Form(0.0),
+    max_results: int = Form(20),
+    category_filter: Optional[str] = Form(None),
+    min_price: Optional[float] = Form(None),
+    max_price: Optional[float] = Form(None),
+    brands: Optional[List[str]] = Form(None),
+    tags: Optional[List[str]] = Form(None),
+    catalog: Catalog = Depends(catalogs.resolve),
+    deadline: Deadline = Depends(admission.admit)
+):
+    """Find similar products for many images, URLs or precomputed vectors.
+
+    `vectors` is a JSON list of embedding lists. Results are streamed back as
+    NDJSON, one `{"index", "results"}` or `{"index", "error"}` line per query,
+    each chunk of queries as soon as it has been searched.
+    """
+    files = files or []
+    image_urls = image_urls or []
+    filters = _product_filter(category_filter, min_price, max_price, brands, tags)
+    
+    try:
+        query_vectors = json.loads(vectors) if vectors else []
+    except ValueError:
+        raise HTTPException(status_code=400, detail="vectors must be a JSON list of embedding lists")
+    dim = catalog.similarity.embedding_dim
+    if not isinstance(query_vectors, list) or any(
+        not isinstance(vector, list) or len(vector) != dim
+        for vector in query_vectors
+    ):
+        raise HTTPException(status_code=400, detail=f"Each vector must be a list of {dim} floats")
+    
+    total_queries = len(files) + len(image_urls) + len(query_vectors)
+    if total_queries == 0:
+        raise HTTPException(status_code=400, detail="Provide at least one of files, image_urls or vectors")
+    if total_queries > BATCH_MAX_QUERIES:
+        raise HTTPException(status_code=400, detail=f"Too many queries. Max is {BATCH_MAX_QUERIES} per request")
+    
+    # Read uploads up front, since the spooled files are closed once streaming starts;
+    # the caps bound the memory held, and reading stops at the first file over them
+    uploads = []
+    budget = BATCH_MAX_UPLOAD_BYTES
+    for file in files:
+        contents = await _read_upload(file, image_service.max_file_size, budget)
+        budget -= len(contents)
+        uploads.append((contents, file.filename))
+    
+    return StreamingResponse(
+        _stream_batch_results(
+            uploads, image_urls, query_vectors, min_similarity, max_results, filters, catalog.similarity, deadline
+        ),
+        media_type="application/x-ndjson"
+    )
+
+async def _read_body(request: Request, max_bytes: int, detail: str) -> bytes:
+    """Read the request body as it arrives, failing with 413 once it passes max_bytes.
+
+    Content-Length is checked first, but chunked bodies have none, so the
+    cap is enforced on the bytes actually received.
+    """
+    if int(request.headers.get("content-length") or 0) > max_bytes:
+        raise HTTPException(status_code=413, detail=detail)
+    chunks, size = [], 0
+    async for chunk in request.stream():
+        size += len(chunk)
+        if size > max_bytes:
+            raise HTTPException(status_code=413, detail=detail)
+        chunks.append(chunk)
+    return b"".join(chunks)
+
+def _parse_query_vectors(body: bytes, content_type: str, dim: int) -> np.ndarray:
+    """Decode a raw or base64 float32 body into an (n, dim) matrix"""
+    if not content_type.startswith("application/octet-stream"):
+        try:
+            body = base64.b64decode(body, validate=True)
+        except (binascii.Error, ValueError):
+            raise HTTPException(status_code=400, detail="Body must be raw float32 (application/octet-stream) or base64")
+    
+    row_bytes = dim * 4
+    if not body or len(body) % row_bytes:
+        raise HTTPException(
+            status_code=400,
+            detail=f"Body must hold whole little-endian float32 vectors of {dim} values "
+                   f"({row_bytes} bytes each); got {len(body)} bytes"
+        )
+    if len(body) // row_bytes > BATCH_MAX_QUERIES:
+        raise HTTPException(status_code=400, detail=f"Too many vectors. Max is {BATCH_MAX_QUERIES} per request")
+    
+    vectors = np.frombuffer(body, dtype="<f4").reshape(-1, dim)
+    if not np.isfinite(vectors).all():
+        raise HTTPException(status_code=400, detail="Vectors must not contain NaN or infinity")
+    return vectors.astype(np.float32)
+
+@app.post("/api/search/vectors")
+async def search_vectors(
+    request: Request,
+    min_similarity: float = 0.0,
+    max_results: int = 20,
+    category_filter: Optional[str] = None,
+    min_price: Optional[float] = None,
+    max_price: Optional[float] = None,
+    brands: Optional[List[str]] = Query(None),
+    tags: Optional[List[str]] = Query(None),
+    hydrate: bool = False,
+    catalog: Catalog = Depends(catalogs.resolve),
+    deadline: Deadline = Depends(admission.admit)
+):
+    """Search with precomputed embeddings sent as the request body.
+
+    The body holds one or more vectors of `embedding_dim` little-endian
+    float32 values back to back, raw with `Content-Type:
+    application/octet-stream` or base64-encoded otherwise. No image is
+    stored or decoded. Each query returns matching product ids and scores,
+    plus the products themselves with `hydrate=true`.
+    """
+    filters = _product_filter(category_filter, min_price, max_price, brands, tags)
+    if catalog.similarity.index is None:
+        raise HTTPException(status_code=503, detail="Vector search is unavailable until the index is built")
+    
+    # Vectors must match this catalog's index; base64 bodies are 4/3 of the raw size
+    dim = catalog.similarity.embedding_dim
+    max_bytes = BATCH_MAX_QUERIES * dim * 4 * 4 // 3 + 4
+    body = await _read_body(request, max_bytes, f"Too many vectors. Max is {BATCH_MAX_QUERIES} per request")
+    vectors = _parse_query_vectors(body, request.headers.get("content-type", ""), dim)
+    
+    try:
+        deadline.check("similarity search")
+        results = await catalog.similarity.search_vectors(
+            vectors,
+            min_similarity=min_similarity,
+            max_results=max_results,
+            filters=filters,
+            hydrate=hydrate
+        )
+        with STAGE_SECONDS.time("response.serialize"):
+            payload = {"dim": dim, "results": results}
+            return JSONResponse(jsonable_encoder(payload) if hydrate else payload)
+    except HTTPException:
+        raise
+    except Exception as e:
+        raise HTTPException(status_code=500, detail=f"Error searching vectors: {str(e)}")
+
+def _cached_json_response(request: Request, cached: CachedBody) -> Response:
+    """Send a pre-encoded body, or 304 when the client already holds this ETag"""
+    headers = {"ETag": cached.etag, "Cache-Control": "no-cache"}
+    if etag_matches(request.headers.get("if-none-match"), cached.etag):
+        RESPONSE_CACHE_REVALIDATIONS.inc()
+        return Response(status_code=304, headers=headers)
+    return Response(content=cached.body, media_type="application/json", headers=headers)
+
 @app.get("/api/products", response_model=List[Product])
 async def get_products(
+    request: Request,
     category: Optional[str] = None,
     limit: int = 50,
-    offset: int = 0
+    offset: int = 0,
+    catalog: Catalog = Depends(catalogs.resolve)
 ):
     """Get all products with optional filtering"""
     try:
-        products = await product_service.get_products(
+        cached = await catalog.products.get_products_json(
             category=category,
             limit=limit,
             offset=offset
         )
-        return products
+        return _cached_json_response(request, cached)
     except Exception as e:
         raise HTTPException(status_code=500, detail=f"Error fetching products: {str(e)}")
 
 @app.get("/api/products/{product_id}", response_model=Product)
-async def get_product(product_id: str):
+async def get_product(request: Request, product_id: str, catalog: Catalog = Depends(catalogs.resolve)):
     """Get a specific product by ID"""
     try:
-        product = await product_service.get_product_by_id(product_id)
-        if not product:
-            raise HTTPException(status_code=404, detail="Product not found")
-        return product
+        cached = await catalog.products.get_product_json(product_id)
     except Exception as e:
         raise HTTPException(status_code=500, detail=f"Error fetching product: {str(e)}")
+    if cached is None:
+        raise HTTPException(status_code=404, detail="Product not found")
+    return _cached_json_response(request, cached)
+
+@app.get("/api/products/{product_id}/similar", response_model=List[SimilarityResult])
+async def get_similar_to_product(
+    product_id: str,
+    min_similarity: float = 0.0,
+    max_results: int = 20,
+    category_filter: Optional[str] = None,
+    min_price: Optional[float] = None,
+    max_price: Optional[float] = None,
+    brands: Optional[List[str]] = Query(None),
+    tags: Optional[List[str]] = Query(None),
+    catalog: Catalog = Depends(catalogs.resolve),
+    # Usually a neighbour graph lookup, but a missing or short graph falls back to a full index search
+    deadline: Deadline = Depends(admission.admit)
+):
+    """Find products similar to an existing catalog product using its stored embedding"""
+    filters = _product_filter(category_filter, min_price, max_price, brands, tags)
+    deadline.check("similarity search")
+    try:
+        results = await catalog.similarity.find_similar_to_product(
+            product_id,
+            min_similarity=min_similarity,
+            max_results=max_results,
+            filters=filters
+        )
+    except Exception as e:
+        raise HTTPException(status_code=500, detail=f"Error finding similar products: {str(e)}")
+    if results is None:
+        raise HTTPException(status_code=404, detail="Product not found")
+    return results
+
+def _hashes_pending() -> HTTPException:
+    return HTTPException(
+        status_code=503,
+        detail="Catalog images are still being hashed; try again shortly",
+        headers={"Retry-After": str(HASHING_RETRY_AFTER)}
+    )
+
+@app.post("/api/dedup/check", response_model=List[DuplicateMatch])
+async def check_duplicates(
+    file: Optional[UploadFile] = File(None),
+    image_url: Optional[str] = Form(None),
+    max_distance: int = Form(8),
+    deadline: Deadline = Depends(admission.admit)
+):
+    """Find catalog products whose image is a near-duplicate of the given image"""
+    if not file and not image_url:
+        raise HTTPException(status_code=400, detail="Either file or image_url must be provided")
+    if not 0 <= max_distance <= MAX_DISTANCE:
+        raise HTTPException(status_code=400, detail=f"max_distance must be between 0 and {MAX_DISTANCE}")
+    
+    try:
+        if file:
+            contents = await _read_upload(file, image_service.max_file_size, image_service.max_file_size)
+        else:
+            async with httpx.AsyncClient() as client:
+                contents = await image_service.download_image(image_url, client)
+        image_hash = await dedup_service.hash_bytes(contents)
+        deadline.check("duplicate search")
+    except HTTPException:
+        raise
+    except Exception as e:
+        raise HTTPException(status_code=400, detail=f"Error hashing image: {str(e)}")
+    
+    try:
+        return await dedup_service.find_duplicates(image_hash, max_distance)
+    except HashesPending:
+        raise _hashes_pending()
+    except Exception as e:
+        raise HTTPException(status_code=500, detail=f"Error checking duplicates: {str(e)}")
+
+@app.get("/api/dedup/report", response_model=List[DuplicateGroup])
+async def get_duplicate_report(max_distance: int = 6, deadline: Deadline = Depends(admission.admit)):
+    """Group catalog products whose images are identical or near-identical"""
+    if not 0 <= max_distance <= MAX_DISTANCE:
+        raise HTTPException(status_code=400, detail=f"max_distance must be between 0 and {MAX_DISTANCE}")
+    try:
+        return await dedup_service.duplicate_report(max_distance)
+    except HashesPending:
+        raise _hashes_pending()
+    except Exception as e:
+        raise HTTPException(status_code=500, detail=f"Error building duplicate report: {str(e)}")
+
+@app.get("/img/{image_hash}")
+async def get_image_derivative(
+    request: Request,
+    image_hash: str,
+    w: Optional[int] = None,
+    h: Optional[int] = None,
+    fmt: str = "jpg"
+):
+    """Serve a stored image resized to fit w x h, rendered on first request and cached"""
+    image_format = IMAGE_FORMATS.get(fmt.lower())
+    if image_format is None:
+        raise HTTPException(status_code=400, detail=f"fmt must be one of: {', '.join(IMAGE_FORMATS)}")
+    width, height = w or IMAGE_MAX_DIMENSION, h or IMAGE_MAX_DIMENSION
+    if not (1 <= width <= IMAGE_MAX_DIMENSION and 1 <= height <= IMAGE_MAX_DIMENSION):
+        raise HTTPException(status_code=400, detail=f"w and h must be between 1 and {IMAGE_MAX_DIMENSION}")
+    # A bounded set of renditions per image, however many distinct sizes clients ask for
+    width, height = derivative_cache.snap(width), derivative_cache.snap(height)
+    
+    # Derivatives never change for a given URL, so a matching ETag needs no disk access
+    etag = derivative_cache.etag(image_hash, width, height, image_format)
+    headers = {"ETag": etag, "Cache-Control": IMAGE_CACHE_CONTROL}
+    if etag_matches(request.headers.get("if-none-match"), etag):
+        return Response(status_code=304, headers=headers)
+    
+    try:
+        path = await derivative_cache.get(image_hash, width, height, image_format)
+    except Exception as e:
+        raise HTTPException(status_code=500, detail=f"Error rendering image: {str(e)}")
+    if path is None:
+        raise HTTPException(status_code=404, detail="Image not found")
+    return FileResponse(path, media_type=f"image/{image_format.lower()}", headers=headers)
 
 @app.get("/api/categories")
-async def get_categories():
+async def get_categories(request: Request, catalog: Catalog = Depends(catalogs.resolve)):
     """Get all available product categories"""
     try:
-        categories = await product_service.get_categories()
-        return {"categories": categories}
+        return _cached_json_response(request, await catalog.products.get_categories_json())
     except Exception as e:
         raise HTTPException(status_code=500, detail=f"Error fetching categories: {str(e)}")
 
+# The catalog endpoints again under /api/{catalog}/..., added last so the fixed /api paths match first
+CATALOG_SCOPED_PATHS = {
+    "/api/find-similar", "/api/find-similar/batch", "/api/search/vectors", "/api/products",
+    "/api/products/{product_id}", "/api/products/{product_id}/similar", "/api/categories"
+}
+for route in [route for route in app.routes if isinstance(route, APIRoute) and route.path in CATALOG_SCOPED_PATHS]:
+    app.add_api_route(
+        "/api/{catalog}" + route.path[len("/api"):],
+        route.endpoint,
+        methods=list(route.methods),
+        response_model=route.response_model,
+        name=f"{route.name}_in_catalog",
+        # Read by catalogs.resolve from the path, so list it for the docs by hand
+        openapi_extra={"parameters": [{"name": "catalog", "in": "path", "required": True, "schema": {"type": "string"}}]}
+    )
+
 if __name__ == "__main__":
     port = int(os.getenv("PORT", 8000))
     host = os.getenv("HOST", "0.0.0.0")
@@ -194,6 +837,7 @@ if __name__ == "__main__":
         "main:app",
         host=host,
         port=port,
-        reload=True,
+        # File watching is for local development only; use serve.py in production
+        reload=os.getenv("RELOAD", "false").lower() == "true",
         log_level="info"
     )
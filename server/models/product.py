@@ -1,5 +1,5 @@
 from pydantic import BaseModel, Field
-from typing import List, Optional
+from typing import Dict, List, Optional
 from datetime import datetime
 
 class Product(BaseModel):
@@ -19,10 +19,35 @@ class Product(BaseModel):
             datetime: lambda v: v.isoformat()
         }
 
+class ProductFilter(BaseModel):
+    category: Optional[str] = Field(None, description="Category, case-insensitive")
+    min_price: Optional[float] = Field(None, description="Lowest price, inclusive")
+    max_price: Optional[float] = Field(None, description="Highest price, inclusive")
+    brands: List[str] = Field(default_factory=list, description="Any of these brands, case-insensitive")
+    tags: List[str] = Field(default_factory=list, description="Every one of these tags, case-insensitive")
+    
+    def is_empty(self) -> bool:
+        return not (self.category or self.brands or self.tags) and self.min_price is None and self.max_price is None
+    
+    def key(self) -> tuple:
+        return (
+            (self.category or "").lower(), self.min_price, self.max_price,
+            tuple(sorted({brand.lower() for brand in self.brands})),
+            tuple(sorted({tag.lower() for tag in self.tags}))
+        )
+
 class SimilarityResult(BaseModel):
     product: Product
     similarity_score: float = Field(..., description="Similarity score (0-1)")
     
+class DuplicateMatch(BaseModel):
+    product: Product
+    distance: int = Field(..., description="Hamming distance between perceptual hashes (bits)")
+
+class DuplicateGroup(BaseModel):
+    products: List[Product]
+    max_distance: int = Field(..., description="Largest Hamming distance joining the group (bits)")
+    
 class ImageMetadata(BaseModel):
     filename: str
     size: int
@@ -31,4 +56,6 @@ class ImageMetadata(BaseModel):
     format: str
     content_type: str
     image_path: str
+    image_hash: Optional[str] = Field(None, description="Content hash used by the /img derivative endpoint")
     thumbnail_path: Optional[str] = None
+    thumbnails: Dict[str, str] = Field(default_factory=dict, description="Thumbnail URLs keyed by '<size>.<ext>'")
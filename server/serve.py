@@ -0,0 +1,194 @@
+"""Production launcher for the Visual Product Matcher API.
+
+Loads the catalog, FAISS index and model once in the parent process, then
+forks N uvicorn workers that share those read-only pages copy-on-write and
+accept connections from a single listening socket.
+
+    python serve.py --workers 4
+
+Signals sent to the parent:
+    SIGHUP          reload catalog and index from disk in every worker
+    SIGTERM/SIGINT  graceful shutdown of all workers
+"""
+import argparse
+import asyncio
+import gc
+import os
+import signal
+import socket
+import sys
+import time
+
+import uvicorn
+
+import main
+
+# A worker that dies sooner than this after starting counts as a crash loop
+RAPID_EXIT_SECONDS = 30.0
+# Consecutive rapid exits after which the supervisor gives up and exits
+MAX_RAPID_EXITS = 5
+# Restart delay after the n-th consecutive rapid exit: 0.5s, 1s, 2s, ... capped
+RESTART_BACKOFF_SECONDS = 0.5
+MAX_RESTART_BACKOFF_SECONDS = 30.0
+
+
+def default_workers() -> int:
+    return int(os.getenv("WEB_CONCURRENCY", os.cpu_count() or 1))
+
+
+def bind_socket(host: str, port: int) -> socket.socket:
+    family = socket.AF_INET6 if ":" in host else socket.AF_INET
+    sock = socket.socket(family, socket.SOCK_STREAM)
+    sock.setsockopt(socket.SOL_SOCKET, socket.SO_REUSEADDR, 1)
+    sock.bind((host, port))
+    sock.listen(2048)
+    sock.set_inheritable(True)
+    return sock
+
+
+async def _serve_worker(sock: socket.socket, log_level: str):
+    config = uvicorn.Config(main.app, log_level=log_level, lifespan="on")
+    server = uvicorn.Server(config)
+
+    # Reload requests from the parent are handled on the worker's own loop
+    loop = asyncio.get_running_loop()
+    loop.add_signal_handler(
+        signal.SIGHUP, lambda: asyncio.ensure_future(main.reload_services())
+    )
+    await server.serve(sockets=[sock])
+
+
+def run_worker(sock: socket.socket, log_level: str):
+    for sig in (signal.SIGTERM, signal.SIGINT, signal.SIGHUP):
+        signal.signal(sig, signal.SIG_DFL)
+    try:
+        asyncio.run(_serve_worker(sock, log_level))
+    finally:
+        os._exit(0)
+
+
+class Supervisor:
+    """Forks workers, forwards signals and replaces workers that die.
+
+    Replacements are delayed with exponential backoff while workers keep
+    dying soon after starting; after MAX_RAPID_EXITS such exits in a row
+    the supervisor stops everything and exits non-zero rather than
+    crash-looping.
+    """
+
+    def __init__(self, sock: socket.socket, workers: int, log_level: str):
+        self.sock = sock
+        self.workers = workers
+        self.log_level = log_level
+        # pid -> monotonic start time
+        self.children = {}
+        self.shutting_down = False
+        self.reload_requested = False
+        self.rapid_exits = 0
+        # Monotonic times at which a replacement worker is due
+        self.pending_restarts = []
+        self.failed = False
+
+    def spawn(self):
+        pid = os.fork()
+        if pid == 0:
+            run_worker(self.sock, self.log_level)
+        self.children[pid] = time.monotonic()
+        print(f"👷 Started worker {pid}")
+
+    def signal_children(self, sig):
+        for pid in list(self.children):
+            try:
+                os.kill(pid, sig)
+            except ProcessLookupError:
+                self.children.pop(pid, None)
+
+    def handle_shutdown(self, signum, frame):
+        self.shutting_down = True
+        self.pending_restarts.clear()
+        self.signal_children(signal.SIGTERM)
+
+    def handle_reload(self, signum, frame):
+        self.reload_requested = True
+
+    def reload(self):
+        self.reload_requested = False
+        print("🔄 Reloading catalog and index in all workers...")
+        # Refresh the parent's copy too, so replacement workers fork from fresh state.
+        # Shards are left to each worker: clients made here would be bound to a loop that closes on return.
+        asyncio.run(main.reload_services(start_shards=False))
+        self.signal_children(signal.SIGHUP)
+
+    def worker_exited(self, pid: int, status: int):
+        started = self.children.pop(pid)
+        if self.shutting_down:
+            return
+        if time.monotonic() - started < RAPID_EXIT_SECONDS:
+            self.rapid_exits += 1
+        else:
+            self.rapid_exits = 0
+        if self.rapid_exits >= MAX_RAPID_EXITS:
+            print(f"❌ Workers exited {self.rapid_exits} times in a row within {RAPID_EXIT_SECONDS:.0f}s "
+                  f"of starting (last status {status}); shutting down")
+            self.failed = True
+            self.handle_shutdown(None, None)
+            return
+        delay = 0.0
+        if self.rapid_exits:
+            delay = min(RESTART_BACKOFF_SECONDS * 2 ** (self.rapid_exits - 1), MAX_RESTART_BACKOFF_SECONDS)
+        print(f"⚠️  Worker {pid} exited with status {status}, restarting in {delay:.1f}s")
+        self.pending_restarts.append(time.monotonic() + delay)
+
+    def run(self) -> int:
+        signal.signal(signal.SIGTERM, self.handle_shutdown)
+        signal.signal(signal.SIGINT, self.handle_shutdown)
+        signal.signal(signal.SIGHUP, self.handle_reload)
+
+        for _ in range(self.workers):
+            self.spawn()
+
+        while self.children or self.pending_restarts:
+            if self.reload_requested and not self.shutting_down:
+                self.reload()
+            now = time.monotonic()
+            for due in [due for due in self.pending_restarts if due <= now]:
+                self.pending_restarts.remove(due)
+                self.spawn()
+            try:
+                pid, status = os.waitpid(-1, os.WNOHANG)
+            except ChildProcessError:
+                pid = 0
+            if pid == 0:
+                time.sleep(0.5)
+                continue
+            self.worker_exited(pid, status)
+
+        print("🔄 All workers stopped")
+        return 1 if self.failed else 0
+
+
+def main_cli():
+    parser = argparse.ArgumentParser(description="Run the API with preloaded, forked workers")
+    parser.add_argument("--host", default=os.getenv("HOST", "0.0.0.0"))
+    parser.add_argument("--port", type=int, default=int(os.getenv("PORT", 8000)))
+    parser.add_argument("--workers", type=int, default=default_workers())
+    parser.add_argument("--log-level", default="info")
+    args = parser.parse_args()
+
+    if sys.platform == "win32":
+        parser.error("serve.py relies on fork(); use `uvicorn main:app` on Windows")
+
+    sock = bind_socket(args.host, args.port)
+
+    print(f"🚀 Preloading services for {args.workers} workers...")
+    asyncio.run(main.initialize_services())
+
+    # Move everything loaded so far into the permanent generation before forking
+    gc.collect()
+    gc.freeze()
+
+    sys.exit(Supervisor(sock, max(1, args.workers), args.log_level).run())
+
+
+if __name__ == "__main__":
+    main_cli()
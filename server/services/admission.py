@@ -0,0 +1,109 @@
+import time
+import asyncio
+from typing import Optional
+
+from fastapi import HTTPException, Header
+
+from services.metrics import metrics
+
+ADMISSIONS = metrics.counter(
+    "vpm_admission_total", "Expensive requests by admission outcome", ("outcome",)
+)
+
+
+class Deadline:
+    """Absolute time budget for one request, passed down to the stages that spend it"""
+
+    def __init__(self, budget_seconds: float):
+        self.expires_at = time.monotonic() + budget_seconds
+
+    def remaining(self) -> float:
+        return self.expires_at - time.monotonic()
+
+    def check(self, stage: str):
+        """Give up before starting a stage once the budget is spent"""
+        if self.remaining() <= 0:
+            ADMISSIONS.inc("expired")
+            raise HTTPException(
+                status_code=503,
+                detail=f"Request deadline exceeded before {stage}",
+                headers={"Retry-After": "1"}
+            )
+
+
+class AdmissionController:
+    """Concurrency limit with a bounded wait queue for expensive endpoints.
+
+    At most ``max_concurrent`` requests run at once and at most
+    ``max_queue`` wait. A request is turned away with 503 and Retry-After
+    as soon as it is clear it cannot finish in its budget: when the queue
+    is full, when the expected wait plus the typical service time exceeds
+    the budget, or when its wait times out. Cheap endpoints do not go
+    through the controller, so they keep being served during a spike.
+    """
+
+    def __init__(self, max_concurrent: int, max_queue: int, default_budget: float, max_budget: float):
+        self.max_concurrent = max_concurrent
+        self.max_queue = max_queue
+        self.default_budget = default_budget
+        self.max_budget = max_budget
+        self._semaphore = asyncio.Semaphore(max_concurrent)
+        self.running = 0
+        self.waiting = 0
+        # Exponentially weighted mean of time spent holding a slot
+        self.service_time = 0.5
+
+    def _retry_after(self) -> str:
+        wait = (self.waiting + 1) * self.service_time / self.max_concurrent
+        return str(max(1, round(wait)))
+
+    def _reject(self, outcome: str, detail: str):
+        ADMISSIONS.inc(outcome)
+        raise HTTPException(status_code=503, detail=detail, headers={"Retry-After": self._retry_after()})
+
+    async def admit(self, x_request_timeout_ms: Optional[int] = Header(None)):
+        """FastAPI dependency: wait for a slot, yield the request's Deadline, release on completion"""
+        budget = self.default_budget
+        if x_request_timeout_ms is not None:
+            if x_request_timeout_ms <= 0:
+                raise HTTPException(status_code=400, detail="X-Request-Timeout-Ms must be a positive number of milliseconds")
+            budget = min(x_request_timeout_ms / 1000, self.max_budget)
+        deadline = Deadline(budget)
+
+        if not self._semaphore.locked():
+            # A free slot with nobody queued ahead; acquire() returns without suspending
+            await self._semaphore.acquire()
+        else:
+            if self.waiting >= self.max_queue:
+                self._reject("queue_full", "Server is busy; try again shortly")
+            expected_wait = (self.waiting + 1) * self.service_time / self.max_concurrent
+            if expected_wait + self.service_time > deadline.remaining():
+                self._reject("over_budget", "Server is busy and the request would not finish in time")
+
+            self.waiting += 1
+            try:
+                # Leave time for the work itself once a slot frees up
+                await asyncio.wait_for(self._semaphore.acquire(), timeout=max(deadline.remaining() - self.service_time, 0.001))
+            except asyncio.TimeoutError:
+                self._reject("timed_out", "Server is busy; the request timed out waiting")
+            finally:
+                self.waiting -= 1
+
+        ADMISSIONS.inc("admitted")
+        self.running += 1
+        start = time.monotonic()
+        try:
+            yield deadline
+        finally:
+            self.running -= 1
+            self._semaphore.release()
+            self.service_time = 0.8 * self.service_time + 0.2 * (time.monotonic() - start)
+
+    def snapshot(self):
+        return {
+            "running": self.running,
+            "waiting": self.waiting,
+            "max_concurrent": self.max_concurrent,
+            "max_queue": self.max_queue,
+            "service_time_ms": round(self.service_time * 1000, 1),
+        }
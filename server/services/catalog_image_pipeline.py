@@ -0,0 +1,181 @@
+import os
+import json
+import time
+import random
+import asyncio
+import hashlib
+import httpx
+from concurrent.futures import ProcessPoolExecutor
+from fastapi import HTTPException
+from pathlib import Path
+from typing import Dict, Any, Iterable, Optional
+from urllib.parse import urlsplit
+
+from services.image_service import ImageService, normalize_image_bytes
+
+CATALOG_IMAGE_DIR = Path("data/catalog_images")
+
+# Statuses worth retrying: throttling and transient server errors
+RETRYABLE_STATUS = {408, 425, 429, 500, 502, 503, 504}
+
+
+def catalog_image_key(image_url: str) -> str:
+    """Stable file stem for a catalog image URL"""
+    return hashlib.sha1(image_url.encode('utf-8')).hexdigest()[:20]
+
+
+def local_catalog_image(image_url: str, output_dir: Path = CATALOG_IMAGE_DIR) -> Optional[Path]:
+    """Path of the normalized local copy of a catalog image, if it was fetched"""
+    path = output_dir / f"{catalog_image_key(image_url)}.jpg"
+    return path if path.exists() else None
+
+
+class HostLimiter:
+    """Per-host concurrency cap plus a minimum interval between request starts"""
+
+    def __init__(self, max_concurrent: int, requests_per_second: float):
+        self.max_concurrent = max_concurrent
+        self.interval = 1.0 / requests_per_second if requests_per_second > 0 else 0.0
+        self._semaphores: Dict[str, asyncio.Semaphore] = {}
+        self._next_start: Dict[str, float] = {}
+        self._locks: Dict[str, asyncio.Lock] = {}
+
+    def semaphore(self, host: str) -> asyncio.Semaphore:
+        if host not in self._semaphores:
+            self._semaphores[host] = asyncio.Semaphore(self.max_concurrent)
+            self._locks[host] = asyncio.Lock()
+        return self._semaphores[host]
+
+    async def wait_turn(self, host: str):
+        async with self._locks[host]:
+            now = time.monotonic()
+            start = max(now, self._next_start.get(host, now))
+            self._next_start[host] = start + self.interval
+        if start > now:
+            await asyncio.sleep(start - now)
+
+
+class CatalogImagePipeline:
+    """Download, validate and thumbnail every catalog image into local storage.
+
+    Downloads run on the event loop with a global and a per-host concurrency
+    cap, a per-host request rate and exponential-backoff retries. Decoding
+    and resizing run in a process pool. Progress is recorded in a state file
+    so interrupted runs resume where they stopped.
+    """
+
+    def __init__(
+        self,
+        image_service: ImageService,
+        output_dir: Path = CATALOG_IMAGE_DIR,
+        concurrency: int = 16,
+        per_host_concurrency: int = 4,
+        per_host_rate: float = 10.0,
+        retries: int = 3,
+        processes: Optional[int] = None,
+        timeout: float = 30.0
+    ):
+        self.image_service = image_service
+        self.output_dir = Path(output_dir)
+        self.thumbnail_dir = self.output_dir / "thumbnails"
+        self.state_file = self.output_dir / "state.json"
+        self.concurrency = concurrency
+        self.retries = retries
+        self.timeout = timeout
+        self.processes = processes or os.cpu_count()
+        self.host_limiter = HostLimiter(per_host_concurrency, per_host_rate)
+        self.state: Dict[str, Dict[str, Any]] = {}
+
+    def _load_state(self):
+        if self.state_file.exists():
+            with open(self.state_file, 'r', encoding='utf-8') as f:
+                self.state = json.load(f)
+
+    def _save_state(self):
+        tmp_path = self.state_file.with_suffix(".tmp")
+        with open(tmp_path, 'w', encoding='utf-8') as f:
+            json.dump(self.state, f)
+        os.replace(tmp_path, self.state_file)
+
+    def _is_done(self, image_url: str) -> bool:
+        entry = self.state.get(image_url)
+        return bool(entry and entry.get("status") == "done" and (self.output_dir / entry["image"]).exists())
+
+    async def _download(self, client: httpx.AsyncClient, image_url: str) -> bytes:
+        host = urlsplit(image_url).netloc
+        attempt = 0
+        while True:
+            async with self.host_limiter.semaphore(host):
+                await self.host_limiter.wait_turn(host)
+                try:
+                    return await self.image_service.download_image(image_url, client, self.timeout)
+                except httpx.HTTPStatusError as e:
+                    if e.response.status_code not in RETRYABLE_STATUS or attempt >= self.retries:
+                        raise
+                    retry_after = e.response.headers.get("retry-after", "")
+                    delay = float(retry_after) if retry_after.isdigit() else None
+                except httpx.TransportError:
+                    if attempt >= self.retries:
+                        raise
+                    delay = None
+            # Back off outside the host slot so other requests to the host can proceed
+            attempt += 1
+            await asyncio.sleep(delay if delay is not None else 0.5 * 2 ** attempt * random.uniform(0.5, 1.5))
+
+    async def _process(self, client, pool, image_url: str, stats: Dict[str, Any]):
+        key = catalog_image_key(image_url)
+        image_name = f"{key}.jpg"
+        thumbnail_name = f"thumbnails/{key}_thumb.jpg"
+        try:
+            contents = await self._download(client, image_url)
+            stats["bytes"] += len(contents)
+            loop = asyncio.get_running_loop()
+            info = await loop.run_in_executor(
+                pool, normalize_image_bytes, contents,
+                str(self.output_dir / image_name), str(self.output_dir / thumbnail_name)
+            )
+            self.state[image_url] = {"status": "done", "image": image_name, "thumbnail": thumbnail_name, **info}
+            stats["fetched"] += 1
+        except Exception as e:
+            detail = e.detail if isinstance(e, HTTPException) else str(e)
+            attempts = self.state.get(image_url, {}).get("attempts", 0) + 1
+            self.state[image_url] = {"status": "failed", "error": detail, "attempts": attempts}
+            stats["failed"] += 1
+            print(f"Warning: Could not fetch catalog image {image_url}: {detail}")
+
+    async def run(self, image_urls: Iterable[str], retry_failed: bool = False) -> Dict[str, Any]:
+        """Fetch every URL not already stored; returns throughput statistics"""
+        self.thumbnail_dir.mkdir(parents=True, exist_ok=True)
+        self._load_state()
+
+        urls = list(dict.fromkeys(image_urls))
+        pending = [
+            url for url in urls
+            if not self._is_done(url)
+            and (retry_failed or self.state.get(url, {}).get("status") != "failed")
+        ]
+        stats = {"total": len(urls), "skipped": len(urls) - len(pending), "fetched": 0, "failed": 0, "bytes": 0}
+
+        start = time.perf_counter()
+        semaphore = asyncio.Semaphore(self.concurrency)
+        completed = 0
+
+        async def worker(url: str):
+            nonlocal completed
+            async with semaphore:
+                await self._process(client, pool, url, stats)
+            completed += 1
+            if completed % 100 == 0:
+                self._save_state()
+
+        limits = httpx.Limits(max_connections=self.concurrency, max_keepalive_connections=self.concurrency)
+        with ProcessPoolExecutor(max_workers=self.processes) as pool:
+            async with httpx.AsyncClient(follow_redirects=True, limits=limits) as client:
+                try:
+                    await asyncio.gather(*(worker(url) for url in pending))
+                finally:
+                    self._save_state()
+
+        stats["seconds"] = round(time.perf_counter() - start, 3)
+        stats["images_per_sec"] = round(stats["fetched"] / stats["seconds"], 2) if stats["seconds"] else 0.0
+        return stats
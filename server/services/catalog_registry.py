@@ -0,0 +1,214 @@
+import re
+import json
+import time
+import fcntl
+import asyncio
+from collections import OrderedDict
+from pathlib import Path
+from typing import Dict, Optional
+
+from fastapi import HTTPException, Request
+
+from services.catalog_store import CatalogStore
+from services.product_service import ProductService
+from services.similarity_service import SimilarityService
+
+CATALOG_NAME_PATTERN = re.compile(r"^[a-z0-9][a-z0-9_-]{0,63}$")
+# First path segments of the unscoped /api routes; a catalog with one of these names could not be reached
+RESERVED_NAMES = {"admin", "categories", "dedup", "find-similar", "products", "search", "upload-image", "upload-url"}
+# Seconds a client is asked to wait while a catalog's index is being built
+BUILD_RETRY_AFTER = 5
+
+
+class CatalogBuilding(Exception):
+    """The catalog has no index yet and one is being built in the background"""
+
+
+class Catalog:
+    """One merchant's product store and similarity index"""
+
+    def __init__(self, name: Optional[str], products: ProductService, similarity: SimilarityService):
+        self.name = name
+        self.products = products
+        self.similarity = similarity
+        self.loaded_at = time.time()
+
+    @property
+    def nbytes(self) -> int:
+        """Approximate RAM held: catalog columns, in-memory index codes and cached responses"""
+        return (
+            self.products.products.nbytes + self.similarity.index_nbytes
+            + self.products.response_cache.total_bytes
+        )
+
+    def snapshot(self):
+        return {
+            "products": len(self.products.products),
+            "bytes": self.nbytes,
+            "index_mmapped": self.similarity.index_mmapped,
+        }
+
+
+class CatalogRegistry:
+    """Named catalogs under ``root``, loaded on first use and evicted least-recently-used.
+
+    Each catalog lives in ``root/<name>/`` with the same files as ``data/``
+    (products.json, faiss_index.bin, embeddings.f32, neighbor_graph/) and
+    gets its own ProductService and SimilarityService sharing the default
+    service's model. A catalog without an index is embedded on a worker
+    thread, under a lock file so prefork workers build it only once, and
+    answers 503 until the files are written. Existing catalogs are loaded
+    on a worker thread too, so a cold catalog does not stall the event
+    loop. Saved indexes are memory-mapped where FAISS allows, so their
+    pages belong to the OS page cache rather than the heap. Once the loaded catalogs hold more than
+    ``max_bytes``, the coldest are dropped; requests already using one keep
+    it until they finish. The default catalog is never evicted.
+    """
+
+    def __init__(self, root: Path, default: Catalog, max_bytes: int):
+        self.root = Path(root)
+        self.default = default
+        self.max_bytes = max_bytes
+        # name -> Catalog, least recently used first
+        self.loaded: "OrderedDict[str, Catalog]" = OrderedDict()
+        self.stats = {"loads": 0, "evictions": 0, "load_seconds": 0.0}
+        self._locks: Dict[str, asyncio.Lock] = {}
+        self.building: Dict[str, asyncio.Task] = {}
+
+    @staticmethod
+    def valid_name(name: str) -> bool:
+        return bool(CATALOG_NAME_PATTERN.match(name)) and name not in RESERVED_NAMES
+
+    @property
+    def total_bytes(self) -> int:
+        return sum(catalog.nbytes for catalog in self.loaded.values())
+
+    async def get(self, name: str) -> Optional[Catalog]:
+        """The named catalog, loading it if needed; None if there is no such catalog.
+
+        Raises CatalogBuilding while its index is still being built.
+        """
+        catalog = self.loaded.get(name)
+        if catalog is not None:
+            self.loaded.move_to_end(name)
+            return catalog
+        data_dir = self.root / name
+        if not self.valid_name(name) or not (data_dir / "products.json").exists():
+            return None
+        if name in self.building:
+            raise CatalogBuilding(name)
+        if self.default.similarity.model is not None and not (data_dir / "faiss_index.bin").exists():
+            self.building[name] = asyncio.create_task(self._build_in_background(name))
+            raise CatalogBuilding(name)
+
+        lock = self._locks.setdefault(name, asyncio.Lock())
+        async with lock:
+            catalog = self.loaded.get(name)
+            if catalog is None:
+                catalog = await self._load(name)
+                self.loaded[name] = catalog
+                self._evict(keep=name)
+        self._locks.pop(name, None)
+        return catalog
+
+    async def _build_in_background(self, name: str):
+        try:
+            await asyncio.to_thread(self._build, name)
+        except Exception as e:
+            print(f"❌ Error building index for catalog '{name}': {e}")
+        finally:
+            self.building.pop(name, None)
+
+    def _build(self, name: str):
+        """Embed the catalog and write its index files; blocking, runs on a worker thread"""
+        start = time.perf_counter()
+        data_dir = self.root / name
+        with open(data_dir / ".build.lock", "w") as lock_file:
+            # Held until the file closes; other workers wait here, then find the index written
+            fcntl.flock(lock_file, fcntl.LOCK_EX)
+            similarity = SimilarityService(data_dir)
+            if similarity.index_path.exists():
+                return
+            with open(data_dir / "products.json", "r", encoding="utf-8") as f:
+                products = CatalogStore(json.load(f))
+            similarity.model = self.default.similarity.model
+            similarity.build_index_files(products)
+        print(f"🏗️  Built index for catalog '{name}' ({len(products)} products) in {time.perf_counter() - start:.2f}s")
+
+    async def _load(self, name: str) -> Catalog:
+        start = time.perf_counter()
+        # Parsing products.json, building the store and reading (or re-quantizing) the index all block
+        catalog = await asyncio.to_thread(self._load_blocking, name)
+
+        elapsed = time.perf_counter() - start
+        self.stats["loads"] += 1
+        self.stats["load_seconds"] += elapsed
+        print(f"📦 Loaded catalog '{name}': {len(catalog.products.products)} products, "
+              f"{catalog.nbytes / (1024 * 1024):.1f}MB in RAM, index "
+              f"{'memory-mapped' if catalog.similarity.index_mmapped else 'in memory'} ({elapsed:.2f}s)")
+        return catalog
+
+    def _load_blocking(self, name: str) -> Catalog:
+        """Open a catalog on a worker thread.
+
+        The service loaders are coroutines but only do blocking file and
+        FAISS work, so they run to completion on a private event loop here.
+        """
+        return asyncio.run(self._open(name))
+
+    async def _open(self, name: str) -> Catalog:
+        data_dir = self.root / name
+        products = ProductService(data_dir, sample_data=False)
+        await products.initialize()
+        similarity = SimilarityService(data_dir)
+        await similarity.attach_catalog(products, self.default.similarity.model)
+        return Catalog(name, products, similarity)
+
+    def _evict(self, keep: str):
+        total = self.total_bytes
+        while total > self.max_bytes and len(self.loaded) > 1:
+            name, catalog = next(iter(self.loaded.items()))
+            if name == keep:
+                break
+            del self.loaded[name]
+            catalog.similarity.vector_store.close()
+            total -= catalog.nbytes
+            self.stats["evictions"] += 1
+            print(f"♻️  Evicted catalog '{name}' ({catalog.nbytes / (1024 * 1024):.1f}MB)")
+
+    async def resolve(self, request: Request) -> Catalog:
+        """FastAPI dependency: the catalog named in the path, or the default one for unscoped routes"""
+        name = request.path_params.get("catalog")
+        if name is None:
+            return self.default
+        try:
+            catalog = await self.get(name)
+        except CatalogBuilding:
+            raise HTTPException(
+                status_code=503,
+                detail=f"Catalog '{name}' is being indexed; try again shortly",
+                headers={"Retry-After": str(BUILD_RETRY_AFTER)}
+            )
+        except Exception as e:
+            print(f"❌ Error loading catalog '{name}': {e}")
+            raise HTTPException(status_code=503, detail=f"Catalog '{name}' could not be loaded")
+        if catalog is None:
+            raise HTTPException(status_code=404, detail=f"Catalog '{name}' not found")
+        return catalog
+
+    def clear(self):
+        """Drop every loaded catalog; each reloads from disk on its next request"""
+        for catalog in self.loaded.values():
+            catalog.similarity.vector_store.close()
+        self.loaded.clear()
+
+    def snapshot(self):
+        return {
+            "loaded": len(self.loaded),
+            "bytes": self.total_bytes,
+            "max_bytes": self.max_bytes,
+            "loads": self.stats["loads"],
+            "evictions": self.stats["evictions"],
+            "building": sorted(self.building),
+            "catalogs": {name: catalog.snapshot() for name, catalog in self.loaded.items()},
+        }
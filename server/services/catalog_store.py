@@ -0,0 +1,355 @@
+from collections import OrderedDict
+from datetime import datetime, timedelta, timezone
+from typing import Any, Dict, Iterable, Iterator, List, Optional, Sequence
+
+import numpy as np
+
+from models.product import Product, ProductFilter
+
+REQUIRED_FIELDS = ("id", "name", "category", "image_url")
+OPTIONAL_TEXT_FIELDS = ("description", "brand")
+EPOCH = datetime(1970, 1, 1, tzinfo=timezone.utc)
+# created_offsets value for timestamps given without a UTC offset
+NAIVE_OFFSET = np.iinfo(np.int32).min
+# Filter masks kept per store; the store is immutable so they never go stale
+MASK_CACHE_SIZE = 64
+
+
+class StringColumn:
+    """Optional strings packed into one UTF-8 buffer with int64 offsets"""
+
+    def __init__(self, values: Sequence[Optional[str]]):
+        encoded = [value.encode("utf-8") if value is not None else b"" for value in values]
+        self.buffer = b"".join(encoded)
+        self.offsets = np.zeros(len(encoded) + 1, dtype=np.int64)
+        np.cumsum(np.fromiter(map(len, encoded), dtype=np.int64, count=len(encoded)), out=self.offsets[1:])
+        self.nulls = np.fromiter((value is None for value in values), dtype=bool, count=len(values))
+
+    def get(self, i: int) -> Optional[str]:
+        if self.nulls[i]:
+            return None
+        return self.buffer[self.offsets[i]:self.offsets[i + 1]].decode("utf-8")
+
+    @property
+    def nbytes(self) -> int:
+        return len(self.buffer) + self.offsets.nbytes + self.nulls.nbytes
+
+
+class CodeColumn:
+    """Optional strings interned to int32 codes into a shared vocabulary (-1 is None)"""
+
+    def __init__(self, values: Sequence[Optional[str]]):
+        self.vocab: List[str] = []
+        lookup: Dict[str, int] = {}
+        codes = np.empty(len(values), dtype=np.int32)
+        for i, value in enumerate(values):
+            if value is None:
+                codes[i] = -1
+                continue
+            code = lookup.get(value)
+            if code is None:
+                code = lookup[value] = len(self.vocab)
+                self.vocab.append(value)
+            codes[i] = code
+        self.codes = codes
+
+    def get(self, i: int) -> Optional[str]:
+        code = self.codes[i]
+        return self.vocab[code] if code >= 0 else None
+
+    @property
+    def nbytes(self) -> int:
+        return self.codes.nbytes + sum(len(value) + 49 for value in self.vocab)
+
+
+class ProductRow:
+    """Read-only view of one catalog row; attribute names match Product"""
+
+    __slots__ = ("_store", "_i")
+
+    def __init__(self, store: "CatalogStore", i: int):
+        self._store = store
+        self._i = i
+
+    @property
+    def position(self) -> int:
+        return self._i
+
+    @property
+    def id(self) -> str:
+        return self._store.ids.get(self._i)
+
+    @property
+    def name(self) -> str:
+        return self._store.names.get(self._i)
+
+    @property
+    def category(self) -> str:
+        return self._store.categories.get(self._i)
+
+    @property
+    def description(self) -> Optional[str]:
+        return self._store.descriptions.get(self._i)
+
+    @property
+    def image_url(self) -> str:
+        return self._store.image_urls.get(self._i)
+
+    @property
+    def price(self) -> Optional[float]:
+        price = float(self._store.prices[self._i])
+        return None if price != price else price
+
+    @property
+    def brand(self) -> Optional[str]:
+        return self._store.brands.get(self._i)
+
+    @property
+    def tags(self) -> List[str]:
+        store = self._store
+        start, end = store.tag_offsets[self._i], store.tag_offsets[self._i + 1]
+        return [store.tag_vocab[code] for code in store.tag_codes[start:end]]
+
+    @property
+    def embedding(self) -> Optional[List[float]]:
+        embedding = self._store.embeddings.get(self._i)
+        return embedding.tolist() if embedding is not None else None
+
+    @property
+    def created_at(self) -> datetime:
+        store = self._store
+        value = EPOCH + timedelta(microseconds=int(store.created_us[self._i]))
+        offset = int(store.created_offsets[self._i])
+        if offset == NAIVE_OFFSET:
+            return value.replace(tzinfo=None)
+        # Back in the offset it was given in, so "+05:30" is not re-emitted as "+00:00"
+        return value.astimezone(timezone(timedelta(seconds=offset)))
+
+    def to_record(self) -> Dict[str, Any]:
+        return {
+            "id": self.id,
+            "name": self.name,
+            "category": self.category,
+            "description": self.description,
+            "image_url": self.image_url,
+            "price": self.price,
+            "brand": self.brand,
+            "tags": self.tags,
+            "embedding": self.embedding,
+            "created_at": self.created_at,
+        }
+
+    def to_product(self) -> Product:
+        """Materialize a Product for the response"""
+        return Product(**self.to_record())
+
+    def __repr__(self) -> str:
+        return f"ProductRow({self._i}, id={self.id!r}, name={self.name!r})"
+
+
+def _parse_created_at(value) -> datetime:
+    if value is None:
+        return datetime.utcnow()
+    if isinstance(value, datetime):
+        return value
+    if not isinstance(value, str):
+        raise ValueError(f"expected an ISO 8601 string, got {type(value).__name__}")
+    return datetime.fromisoformat(value.replace("Z", "+00:00"))
+
+
+def _validate_record(i: int, record: Dict[str, Any]) -> datetime:
+    """Check one record as Product would, naming the row on failure; returns its parsed created_at.
+
+    Rows are only turned into Product models when returned, so a bad value
+    has to be caught here rather than as a 500 at the response boundary.
+    """
+    if not isinstance(record, dict):
+        raise ValueError(f"Product {i} is not an object")
+    for field in REQUIRED_FIELDS:
+        if not isinstance(record.get(field), str):
+            raise ValueError(f"Product {i} has no valid '{field}'")
+    for field in OPTIONAL_TEXT_FIELDS:
+        if not isinstance(record.get(field), (str, type(None))):
+            raise ValueError(f"Product {i} has an invalid '{field}': expected a string")
+
+    price = record.get("price")
+    if price is not None:
+        try:
+            if isinstance(price, bool):
+                raise ValueError
+            float(price)
+        except (TypeError, ValueError):
+            raise ValueError(f"Product {i} has an invalid 'price': {price!r} is not a number") from None
+
+    tags = record.get("tags")
+    if tags is not None and not (isinstance(tags, list) and all(isinstance(tag, str) for tag in tags)):
+        raise ValueError(f"Product {i} has invalid 'tags': expected a list of strings")
+
+    embedding = record.get("embedding")
+    if embedding is not None and not isinstance(embedding, list):
+        raise ValueError(f"Product {i} has an invalid 'embedding': expected a list of numbers")
+
+    try:
+        return _parse_created_at(record.get("created_at"))
+    except ValueError as e:
+        raise ValueError(f"Product {i} has an invalid 'created_at': {e}") from None
+
+
+class CatalogStore:
+    """Columnar, read-only product catalog.
+
+    Text fields live in packed UTF-8 buffers, category, brand and tags are
+    interned to integer codes, and prices and timestamps are NumPy arrays,
+    so a row costs tens of bytes of overhead instead of a pydantic object
+    with its own dict, list and datetime. Indexing returns a ``ProductRow``
+    view; ``Product`` models are built only for rows that are returned.
+    Changes produce a new store, so readers never see a half-applied edit.
+    """
+
+    def __init__(self, records: Sequence[Dict[str, Any]]):
+        created = [_validate_record(i, record) for i, record in enumerate(records)]
+
+        self.size = len(records)
+        self.ids = StringColumn([record["id"] for record in records])
+        self.names = StringColumn([record["name"] for record in records])
+        self.descriptions = StringColumn([record.get("description") for record in records])
+        self.image_urls = StringColumn([record["image_url"] for record in records])
+        self.categories = CodeColumn([record["category"] for record in records])
+        self.brands = CodeColumn([record.get("brand") for record in records])
+        self.prices = np.array(
+            [np.nan if record.get("price") is None else float(record["price"]) for record in records],
+            dtype=np.float64
+        )
+
+        tags = CodeColumn([tag for record in records for tag in (record.get("tags") or [])])
+        self.tag_vocab, self.tag_codes = tags.vocab, tags.codes
+        self.tag_offsets = np.zeros(self.size + 1, dtype=np.int64)
+        np.cumsum([len(record.get("tags") or []) for record in records], out=self.tag_offsets[1:])
+
+        # UTC offset of each timestamp in seconds, so rows keep the zone they were written in
+        self.created_offsets = np.array([
+            NAIVE_OFFSET if value.tzinfo is None else int(value.utcoffset().total_seconds()) for value in created
+        ], dtype=np.int32)
+        self.created_us = np.array([
+            (value if value.tzinfo else value.replace(tzinfo=timezone.utc)) - EPOCH for value in created
+        ], dtype="timedelta64[us]").astype(np.int64)
+
+        # Embeddings normally live in the vector store; keep any that came with the catalog
+        self.embeddings: Dict[int, np.ndarray] = {
+            i: np.asarray(record["embedding"], dtype=np.float32)
+            for i, record in enumerate(records) if record.get("embedding")
+        }
+
+        # Id lookup through sorted hashes; a dict of a million ids would cost more than the catalog
+        self._id_hashes = np.fromiter((hash(record["id"]) for record in records), dtype=np.int64, count=self.size)
+        self._id_order = np.argsort(self._id_hashes, kind="stable")
+        self._sorted_hashes = self._id_hashes[self._id_order]
+
+        # Row of each entry in tag_codes, built on first tag filter
+        self._tag_rows: Optional[np.ndarray] = None
+        self._masks: OrderedDict = OrderedDict()
+
+    @classmethod
+    def from_products(cls, products: Iterable[Product]) -> "CatalogStore":
+        return cls([product.model_dump() for product in products])
+
+    def __len__(self) -> int:
+        return self.size
+
+    def __getitem__(self, index):
+        if isinstance(index, slice):
+            return [ProductRow(self, i) for i in range(*index.indices(self.size))]
+        if index < 0:
+            index += self.size
+        if not 0 <= index < self.size:
+            raise IndexError("catalog index out of range")
+        return ProductRow(self, index)
+
+    def __iter__(self) -> Iterator[ProductRow]:
+        return (ProductRow(self, i) for i in range(self.size))
+
+    def position(self, product_id: str) -> Optional[int]:
+        """Row of the first product with this id, or None"""
+        key = hash(product_id)
+        start = int(np.searchsorted(self._sorted_hashes, key))
+        matches = []
+        while start < self.size and self._sorted_hashes[start] == key:
+            i = int(self._id_order[start])
+            if self.ids.get(i) == product_id:
+                matches.append(i)
+            start += 1
+        return min(matches) if matches else None
+
+    def category_positions(self, category: str) -> np.ndarray:
+        """Rows whose category matches case-insensitively"""
+        return np.flatnonzero(self.filter_mask(ProductFilter(category=category)))
+
+    def _codes_matching(self, vocab: List[str], wanted: Iterable[str]) -> List[int]:
+        wanted = {value.lower() for value in wanted}
+        return [code for code, value in enumerate(vocab) if value.lower() in wanted]
+
+    def _rows_with_tag(self, tag: str) -> np.ndarray:
+        if self._tag_rows is None:
+            self._tag_rows = np.repeat(np.arange(self.size, dtype=np.int64), np.diff(self.tag_offsets))
+        has_tag = np.zeros(self.size, dtype=bool)
+        has_tag[self._tag_rows[np.isin(self.tag_codes, self._codes_matching(self.tag_vocab, [tag]))]] = True
+        return has_tag
+
+    def filter_mask(self, filters: Optional[ProductFilter]) -> Optional[np.ndarray]:
+        """Boolean row mask for the filter, or None when it filters nothing"""
+        if filters is None or filters.is_empty():
+            return None
+        key = filters.key()
+        mask = self._masks.get(key)
+        if mask is not None:
+            self._masks.move_to_end(key)
+            return mask
+
+        mask = np.ones(self.size, dtype=bool)
+        if filters.category:
+            mask &= np.isin(self.categories.codes, self._codes_matching(self.categories.vocab, [filters.category]))
+        if filters.min_price is not None:
+            mask &= self.prices >= filters.min_price  # NaN (no price) never matches
+        if filters.max_price is not None:
+            mask &= self.prices <= filters.max_price
+        if filters.brands:
+            mask &= np.isin(self.brands.codes, self._codes_matching(self.brands.vocab, filters.brands))
+        for tag in filters.tags:
+            mask &= self._rows_with_tag(tag)
+
+        mask.flags.writeable = False
+        self._masks[key] = mask
+        if len(self._masks) > MASK_CACHE_SIZE:
+            self._masks.popitem(last=False)
+        return mask
+
+    def category_names(self) -> List[str]:
+        return sorted(self.categories.vocab[code] for code in np.unique(self.categories.codes))
+
+    def records(self) -> Iterator[Dict[str, Any]]:
+        return (row.to_record() for row in self)
+
+    def appended(self, product: Product) -> "CatalogStore":
+        return CatalogStore([*self.records(), product.model_dump()])
+
+    def replaced(self, position: int, product: Product) -> "CatalogStore":
+        records = list(self.records())
+        records[position] = product.model_dump()
+        return CatalogStore(records)
+
+    def deleted(self, position: int) -> "CatalogStore":
+        records = list(self.records())
+        del records[position]
+        return CatalogStore(records)
+
+    @property
+    def nbytes(self) -> int:
+        """Approximate bytes held by the columns"""
+        return (
+            self.ids.nbytes + self.names.nbytes + self.descriptions.nbytes + self.image_urls.nbytes
+            + self.categories.nbytes + self.brands.nbytes + self.prices.nbytes
+            + self.tag_codes.nbytes + self.tag_offsets.nbytes + sum(len(tag) + 49 for tag in self.tag_vocab)
+            + self.created_us.nbytes + self.created_offsets.nbytes
+            + self._id_hashes.nbytes + self._id_order.nbytes + self._sorted_hashes.nbytes
+            + sum(embedding.nbytes for embedding in self.embeddings.values())
+        )
@@ -0,0 +1,316 @@
+import os
+import io
+import json
+import time
+import asyncio
+import threading
+import httpx
+import numpy as np
+import faiss
+from PIL import Image
+from pathlib import Path
+from typing import Dict, List, Optional, Tuple
+
+from models.product import DuplicateMatch, DuplicateGroup
+from services.image_service import ImageService
+from services.product_service import ProductService
+from services.catalog_image_pipeline import local_catalog_image
+
+HASH_BITS = 64
+# Largest Hamming radius the multi-index tables are probed for
+MAX_DISTANCE = 12
+# Seconds a client is asked to wait while catalog images are being hashed
+HASHING_RETRY_AFTER = 10
+
+
+class HashesPending(Exception):
+    """No catalog hash index yet; one is being built in the background"""
+
+
+def _dct_matrix(n: int) -> np.ndarray:
+    """Orthonormal DCT-II basis, so dct(x) == M @ x"""
+    k = np.arange(n)[:, None]
+    i = np.arange(n)[None, :]
+    matrix = np.cos(np.pi * (2 * i + 1) * k / (2 * n)) * np.sqrt(2.0 / n)
+    matrix[0] /= np.sqrt(2.0)
+    return matrix
+
+
+_DCT_32 = _dct_matrix(32)
+
+
+def _grayscale(img: Image.Image, size: Tuple[int, int]) -> np.ndarray:
+    # Let the JPEG decoder scale down by up to 8x before we resample
+    img.draft('L', (size[0] * 4, size[1] * 4))
+    return np.asarray(img.convert('L').resize(size, Image.Resampling.LANCZOS), dtype=np.float32)
+
+
+def dhash(img: Image.Image) -> int:
+    """Difference hash: sign of horizontal gradients on a 9x8 thumbnail"""
+    pixels = _grayscale(img, (9, 8))
+    bits = (pixels[:, 1:] > pixels[:, :-1]).flatten()
+    return int(np.packbits(bits).view('>u8')[0])
+
+
+def phash(img: Image.Image) -> int:
+    """Perceptual hash: low-frequency 8x8 DCT coefficients above their median"""
+    pixels = _grayscale(img, (32, 32))
+    coefficients = (_DCT_32 @ pixels @ _DCT_32.T)[:8, :8].flatten()
+    # The DC term only reflects overall brightness; keep it out of the threshold
+    bits = coefficients > np.median(coefficients[1:])
+    return int(np.packbits(bits).view('>u8')[0])
+
+
+HASH_FUNCTIONS = {"phash": phash, "dhash": dhash}
+
+
+def hash_image_bytes(contents: bytes, kind: str = "phash") -> int:
+    """Decode an image and return its 64-bit perceptual hash"""
+    with Image.open(io.BytesIO(contents)) as img:
+        return HASH_FUNCTIONS[kind](img)
+
+
+class HammingIndex:
+    """Multi-index hashing over 64-bit hashes.
+
+    Each hash is split into ``nhash`` disjoint substrings with one hash
+    table per substring (FAISS IndexBinaryMultiHash). By the pigeonhole
+    principle, anything within d bits matches at least one substring within
+    d // nhash bits, so probing that many bit flips per table is exact.
+    Three 21-bit tables keep buckets sparse at millions of hashes.
+    """
+
+    def __init__(self, nhash: int = 3):
+        self.nhash = nhash
+        self.index = faiss.IndexBinaryMultiHash(HASH_BITS, nhash, HASH_BITS // nhash)
+        # nflip is index state, so searches with different radii must not overlap
+        self._search_lock = threading.Lock()
+
+    def __len__(self) -> int:
+        return self.index.ntotal
+
+    @staticmethod
+    def _codes(hashes: np.ndarray) -> np.ndarray:
+        return np.ascontiguousarray(np.asarray(hashes, dtype=np.uint64)).view(np.uint8).reshape(-1, HASH_BITS // 8)
+
+    def add(self, hashes: np.ndarray):
+        self.index.add(self._codes(hashes))
+
+    def _range_search(self, hashes: np.ndarray, max_distance: int):
+        if not 0 <= max_distance <= MAX_DISTANCE:
+            raise ValueError(f"max_distance must be between 0 and {MAX_DISTANCE}")
+        with self._search_lock:
+            self.index.nflip = max_distance // self.nhash
+            # FAISS returns distances strictly below the radius
+            return self.index.range_search(self._codes(hashes), max_distance + 1)
+
+    def search(self, hashes: np.ndarray, max_distance: int) -> List[List[Tuple[int, int]]]:
+        """Return (row, distance) pairs within max_distance bits of each query"""
+        limits, distances, labels = self._range_search(hashes, max_distance)
+        return [
+            sorted(zip(labels[start:stop].tolist(), distances[start:stop].astype(int).tolist()), key=lambda m: m[1])
+            for start, stop in zip(limits[:-1], limits[1:])
+        ]
+
+    def pairs(self, hashes: np.ndarray, max_distance: int, batch_size: int = 65536) -> np.ndarray:
+        """All (i, j, distance) with i < j among the indexed hashes, queried in batches.
+
+        ``hashes`` must be the same array that was added, in the same order.
+        """
+        found = []
+        for start in range(0, len(hashes), batch_size):
+            limits, distances, labels = self._range_search(hashes[start:start + batch_size], max_distance)
+            queries = start + np.repeat(np.arange(len(limits) - 1), np.diff(limits).astype(np.int64))
+            keep = labels > queries
+            found.append(np.stack([queries[keep], labels[keep], distances[keep].astype(np.int64)], axis=1))
+        return np.concatenate(found) if found else np.zeros((0, 3), dtype=np.int64)
+
+
+class DedupService:
+    """Near-duplicate detection for catalog and uploaded images.
+
+    Catalog images are hashed by a background task, started on first use
+    (or at startup with DEDUP_PRECOMPUTE) and again whenever the catalog
+    changes. Queries use the last finished index and raise HashesPending
+    until the first one is ready. Images that could not be fetched are
+    retried after DEDUP_RETRY_FAILED_MINUTES.
+    """
+
+    def __init__(self, image_service: ImageService, product_service: ProductService):
+        self.image_service = image_service
+        self.product_service = product_service
+        self.hash_kind = os.getenv("DEDUP_HASH", "phash").lower()
+        if self.hash_kind not in HASH_FUNCTIONS:
+            print(f"⚠️  Unknown DEDUP_HASH '{self.hash_kind}', using phash")
+            self.hash_kind = "phash"
+        self.fetch_concurrency = int(os.getenv("DEDUP_FETCH_CONCURRENCY", 8))
+        self.retry_failed_after = float(os.getenv("DEDUP_RETRY_FAILED_MINUTES", 60)) * 60
+        self.hashes_file = product_service.data_dir / f"image_hashes_{self.hash_kind}.json"
+
+        # image_url -> hash for every catalog image fetched so far
+        self.url_hashes: Dict[str, int] = {}
+        self.index: Optional[HammingIndex] = None
+        self.index_hashes = np.zeros(0, dtype=np.uint64)
+        self.index_urls: List[str] = []
+        # Catalog version the index was built from
+        self.index_version: Optional[int] = None
+        # image_url -> time.monotonic() of the failed fetch; retried once retry_failed_after has passed
+        self.failed_urls: Dict[str, float] = {}
+        self._refresh_task: Optional[asyncio.Task] = None
+        self._lock = asyncio.Lock()
+
+    def _load_hash_cache(self):
+        if not self.url_hashes and self.hashes_file.exists():
+            with open(self.hashes_file, 'r', encoding='utf-8') as f:
+                self.url_hashes = {url: int(value, 16) for url, value in json.load(f).items()}
+
+    def _save_hash_cache(self):
+        self.hashes_file.parent.mkdir(parents=True, exist_ok=True)
+        tmp_path = self.hashes_file.with_suffix(f".{os.getpid()}.tmp")
+        with open(tmp_path, 'w', encoding='utf-8') as f:
+            json.dump({url: f"{value:016x}" for url, value in self.url_hashes.items()}, f)
+        os.replace(tmp_path, self.hashes_file)
+
+    async def hash_bytes(self, contents: bytes) -> int:
+        """Hash image bytes off the event loop"""
+        return await asyncio.to_thread(hash_image_bytes, contents, self.hash_kind)
+
+    async def _fetch_hashes(self, urls: List[str]):
+        semaphore = asyncio.Semaphore(self.fetch_concurrency)
+
+        async with httpx.AsyncClient(follow_redirects=True) as client:
+            async def fetch(url: str):
+                async with semaphore:
+                    try:
+                        # Prefer the local copy written by jobs.fetch_catalog_images
+                        local_path = local_catalog_image(url)
+                        if local_path:
+                            contents = await asyncio.to_thread(local_path.read_bytes)
+                        else:
+                            contents = await self.image_service.download_image(url, client)
+                        self.url_hashes[url] = await self.hash_bytes(contents)
+                        self.failed_urls.pop(url, None)
+                    except Exception as e:
+                        self.failed_urls[url] = time.monotonic()
+                        print(f"Warning: Could not hash catalog image {url}: {e}")
+
+            await asyncio.gather(*(fetch(url) for url in urls))
+
+    def _retry_due(self, url: str) -> bool:
+        failed_at = self.failed_urls.get(url)
+        return failed_at is None or time.monotonic() - failed_at >= self.retry_failed_after
+
+    def _needs_refresh(self) -> bool:
+        if self.index is None or self.index_version != self.product_service.version:
+            return True
+        return any(time.monotonic() - failed_at >= self.retry_failed_after for failed_at in self.failed_urls.values())
+
+    def start_refresh(self):
+        """Start a background rebuild of the hash index if it is missing, stale or has failures due a retry"""
+        if self._refresh_task is not None and not self._refresh_task.done():
+            return
+        if self._needs_refresh():
+            self._refresh_task = asyncio.create_task(self._refresh())
+
+    async def _refresh(self):
+        try:
+            await self.ensure_catalog_hashes()
+        except Exception as e:
+            print(f"❌ Error hashing catalog images: {e}")
+
+    def _current_index(self) -> HammingIndex:
+        """The latest finished index, kicking off a refresh when due; raises HashesPending if there is none"""
+        self.start_refresh()
+        if self.index is None:
+            raise HashesPending()
+        return self.index
+
+    async def ensure_catalog_hashes(self):
+        """Hash any catalog images not hashed yet and rebuild the Hamming index.
+
+        Fetches every missing image, so it runs as a background task (or
+        from jobs), never inside a request.
+        """
+        async with self._lock:
+            version = self.product_service.version
+            await asyncio.to_thread(self._load_hash_cache)
+            products = await self.product_service.get_all_products()
+            urls = list(dict.fromkeys(product.image_url for product in products))
+
+            missing = [url for url in urls if url not in self.url_hashes and self._retry_due(url)]
+            if missing:
+                print(f"🔄 Hashing {len(missing)} catalog images...")
+                await self._fetch_hashes(missing)
+                await asyncio.to_thread(self._save_hash_cache)
+
+            indexed_urls = [url for url in urls if url in self.url_hashes]
+            if self.index is None or indexed_urls != self.index_urls:
+                index_hashes = np.array([self.url_hashes[url] for url in indexed_urls], dtype=np.uint64)
+                index = HammingIndex()
+                await asyncio.to_thread(index.add, index_hashes)
+                # Swap all three together so queries never pair rows with the wrong URLs
+                self.index, self.index_hashes, self.index_urls = index, index_hashes, indexed_urls
+                print(f"✅ Catalog hash index ready ({len(indexed_urls)} images, {len(self.failed_urls)} failed)")
+            self.index_version = version
+
+    def snapshot(self):
+        return {
+            "images": len(self.index_urls),
+            "failed": len(self.failed_urls),
+            "hashing": self._refresh_task is not None and not self._refresh_task.done(),
+            "ready": self.index is not None,
+        }
+
+    def _products_by_url(self, products) -> Dict[str, list]:
+        by_url: Dict[str, list] = {}
+        for product in products:
+            by_url.setdefault(product.image_url, []).append(product)
+        return by_url
+
+    async def find_duplicates(self, image_hash: int, max_distance: int = 8) -> List[DuplicateMatch]:
+        """Catalog products whose image is within max_distance bits of the given hash"""
+        index, index_urls = self._current_index(), self.index_urls
+        by_url = self._products_by_url(await self.product_service.get_all_products())
+
+        matches = index.search(np.array([image_hash], dtype=np.uint64), max_distance)[0]
+        return [
+            DuplicateMatch(product=product.to_product(), distance=distance)
+            for row, distance in matches
+            for product in by_url.get(index_urls[row], [])
+        ]
+
+    async def duplicate_report(self, max_distance: int = 6) -> List[DuplicateGroup]:
+        """Group catalog products whose images are identical or near-identical"""
+        index, index_hashes, index_urls = self._current_index(), self.index_hashes, self.index_urls
+        by_url = self._products_by_url(await self.product_service.get_all_products())
+
+        # Union-find over indexed URLs, joined by every near-duplicate pair
+        parent = list(range(len(index_urls)))
+
+        def find(row: int) -> int:
+            while parent[row] != row:
+                parent[row] = parent[parent[row]]
+                row = parent[row]
+            return row
+
+        pairs = (await asyncio.to_thread(index.pairs, index_hashes, max_distance)).tolist()
+        for i, j, _ in pairs:
+            parent[find(j)] = find(i)
+
+        group_distance: Dict[int, int] = {}
+        for i, _, distance in pairs:
+            root = find(i)
+            group_distance[root] = max(group_distance.get(root, 0), distance)
+
+        members: Dict[int, List[int]] = {}
+        for row in range(len(index_urls)):
+            members.setdefault(find(row), []).append(row)
+
+        groups = []
+        for root, rows in members.items():
+            products = [product.to_product() for row in rows for product in by_url.get(index_urls[row], [])]
+            if len(products) > 1:
+                groups.append(DuplicateGroup(products=products, max_distance=group_distance.get(root, 0)))
+
+        groups.sort(key=lambda group: len(group.products), reverse=True)
+        return groups
@@ -0,0 +1,177 @@
+import os
+import re
+import time
+import bisect
+import asyncio
+from collections import OrderedDict
+from pathlib import Path
+from typing import Callable, Dict, List, Optional, Sequence, Tuple
+
+from services.image_service import IMAGE_EXTENSIONS
+from services.thumbnailer import FORMAT_EXTENSIONS, render_derivative
+from services.metrics import STAGE_SECONDS
+
+# Bump when encoder settings change so ETags stop matching stale copies
+DERIVATIVE_VERSION = 1
+
+IMAGE_HASH_PATTERN = re.compile(r"^[0-9a-f]{20,64}$")
+# Originals remembered per hash so cache hits can report them as used without a directory lookup
+SOURCE_MEMO_SIZE = 4096
+# Default seconds between re-measuring the cache directory for other workers' renders and evictions
+RESCAN_SECONDS = 300.0
+
+
+class DerivativeCache:
+    """Lazily rendered, resized copies of stored images in a size-bounded LRU directory.
+
+    Originals are looked up by content hash in the source directories.
+    Requested dimensions are snapped up to one of ``sizes``, so the cache
+    holds a few renditions per image rather than one per pixel width.
+    Each (hash, width, height, format) is rendered once, on first request.
+    Each render is added to an in-memory size count. Once that count
+    passes ``max_bytes``, files are evicted least-recently-used first
+    until it fits. Recency comes from mtime, which every hit refreshes.
+    Other worker processes share the directory, so it is re-measured on
+    disk at startup and then after a render at most every
+    ``rescan_seconds``. Every request reports the original it was
+    made from to ``on_source_used``, so upload retention sees originals as
+    in use while their derivatives are.
+    """
+
+    def __init__(
+        self,
+        source_dirs: List[Path],
+        cache_dir: Path,
+        max_bytes: int,
+        sizes: Sequence[int],
+        on_source_used: Optional[Callable[[Path], None]] = None,
+        rescan_seconds: float = RESCAN_SECONDS
+    ):
+        self.source_dirs = [Path(directory) for directory in source_dirs]
+        self.sizes = sorted(set(sizes))
+        self.on_source_used = on_source_used
+        # image hash -> original path, least recently used first
+        self._sources: "OrderedDict[str, Path]" = OrderedDict()
+        self.cache_dir = Path(cache_dir)
+        self.cache_dir.mkdir(parents=True, exist_ok=True)
+        self.max_bytes = max_bytes
+        self.rescan_seconds = rescan_seconds
+
+        # name -> size in bytes, least recently used first, as of the last scan plus this worker's renders
+        self.entries, self.total_bytes = self._scan()
+        self._scanned_at = time.monotonic()
+        self.stats = {"hits": 0, "misses": 0, "evictions": 0, "evicted_bytes": 0}
+        self._locks: Dict[str, asyncio.Lock] = {}
+
+    def snap(self, size: int) -> int:
+        """Smallest configured size at least ``size``, or the largest one"""
+        index = bisect.bisect_left(self.sizes, size)
+        return self.sizes[min(index, len(self.sizes) - 1)]
+
+    def _scan(self) -> Tuple["OrderedDict[str, int]", int]:
+        """Files in the cache directory, least recently used first, and their total size"""
+        found = []
+        with os.scandir(self.cache_dir) as it:
+            for entry in it:
+                if entry.name.endswith(".tmp") or not entry.is_file(follow_symlinks=False):
+                    continue
+                try:
+                    stat = entry.stat()
+                except FileNotFoundError:
+                    continue  # Evicted by another worker mid-scan
+                found.append((stat.st_mtime, entry.name, stat.st_size))
+        found.sort()
+        return OrderedDict((name, size) for _, name, size in found), sum(size for _, _, size in found)
+
+    async def _rescan_if_due(self):
+        if time.monotonic() - self._scanned_at >= self.rescan_seconds:
+            self.entries, self.total_bytes = await asyncio.to_thread(self._scan)
+            self._scanned_at = time.monotonic()
+
+    def _evict(self, keep: str):
+        """Delete the least recently used files until the counted total fits"""
+        # Always keep the entry just rendered, even if it alone exceeds the budget
+        if keep in self.entries:
+            self.entries.move_to_end(keep)
+        while self.total_bytes > self.max_bytes and len(self.entries) > 1:
+            name, size = self.entries.popitem(last=False)
+            self.total_bytes -= size
+            try:
+                (self.cache_dir / name).unlink()
+            except FileNotFoundError:
+                continue  # Already evicted by another worker
+            self.stats["evictions"] += 1
+            self.stats["evicted_bytes"] += size
+
+    def find_source(self, image_hash: str) -> Optional[Path]:
+        """Stored original for a content hash, if any; only image extensions match, never temp files"""
+        if not IMAGE_HASH_PATTERN.match(image_hash):
+            return None
+        for directory in self.source_dirs:
+            for extension in IMAGE_EXTENSIONS:
+                path = directory / f"{image_hash}.{extension}"
+                if path.is_file():
+                    self._source_used(image_hash, path)
+                    return path
+        return None
+
+    def _source_used(self, image_hash: str, path: Path):
+        self._sources[image_hash] = path
+        self._sources.move_to_end(image_hash)
+        if len(self._sources) > SOURCE_MEMO_SIZE:
+            self._sources.popitem(last=False)
+        if self.on_source_used is not None:
+            self.on_source_used(path)
+
+    @staticmethod
+    def etag(image_hash: str, width: int, height: int, image_format: str) -> str:
+        """Strong ETag; the bytes are fully determined by these inputs"""
+        return f'"{image_hash}-{width}x{height}-{FORMAT_EXTENSIONS[image_format]}-v{DERIVATIVE_VERSION}"'
+
+    async def get(self, image_hash: str, width: int, height: int, image_format: str) -> Optional[Path]:
+        """Path of the rendered derivative, rendering it first if needed; None if the original is unknown.
+
+        ``width`` and ``height`` should already be snapped with ``snap``.
+        """
+        name = f"{image_hash}_{width}x{height}.{FORMAT_EXTENSIONS[image_format]}"
+        path = self.cache_dir / name
+
+        if name in self.entries and path.exists():
+            self.entries.move_to_end(name)
+            os.utime(path)
+            self.stats["hits"] += 1
+            source = self._sources.get(image_hash)
+            if source is not None:
+                self._source_used(image_hash, source)
+            return path
+
+        source = self.find_source(image_hash)
+        if source is None:
+            return None
+
+        lock = self._locks.setdefault(name, asyncio.Lock())
+        try:
+            async with lock:
+                # Another request (or worker process) may have rendered it meanwhile
+                if not path.exists():
+                    self.stats["misses"] += 1
+                    tmp_path = self.cache_dir / f"{name}.{os.getpid()}.tmp"
+                    try:
+                        # Decoding and resizing are CPU-bound; keep them off the event loop
+                        with STAGE_SECONDS.time("image.render"):
+                            await asyncio.to_thread(render_derivative, source, width, height, image_format, tmp_path)
+                        os.replace(tmp_path, path)
+                    finally:
+                        tmp_path.unlink(missing_ok=True)
+                else:
+                    self.stats["hits"] += 1
+                    os.utime(path)
+                size = path.stat().st_size
+                self.total_bytes += size - self.entries.pop(name, 0)
+                self.entries[name] = size
+                await self._rescan_if_due()
+                self._evict(name)
+        finally:
+            # Also on a failed render, so each bad size or format does not leave a lock behind
+            self._locks.pop(name, None)
+        return path
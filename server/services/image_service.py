@@ -1,106 +1,198 @@
+import io
 import os
-import uuid
+import hashlib
 import httpx
 from PIL import Image
 from fastapi import UploadFile, HTTPException
-from typing import Dict, Any
+from typing import Dict, Any, Optional, List, Tuple
 import aiofiles
 from pathlib import Path
 
 from models.product import ImageMetadata
+from services.thumbnailer import ThumbnailSpec, FORMAT_EXTENSIONS, render_thumbnails
+from services.upload_janitor import UploadJanitor
+from services.metrics import STAGE_SECONDS
+
+ALLOWED_FORMATS = {'JPEG', 'PNG', 'WEBP', 'BMP', 'GIF'}
+# Extensions originals are stored under; anything else is stored as .jpg (the format is read from the bytes)
+IMAGE_EXTENSIONS = ('jpg', 'jpeg', 'png', 'webp', 'bmp', 'gif')
+THUMBNAIL_SIZE = (300, 300)
+
+def parse_thumbnail_variants(value: str) -> List[Tuple[int, str]]:
+    """Parse "300:jpeg,150:webp" into [(300, "JPEG"), (150, "WEBP")]"""
+    variants = []
+    for item in value.split(','):
+        size, _, image_format = item.strip().partition(':')
+        image_format = (image_format or 'jpeg').upper()
+        if image_format == 'JPG':
+            image_format = 'JPEG'
+        if image_format not in FORMAT_EXTENSIONS:
+            raise ValueError(f"Unsupported thumbnail format: {image_format}")
+        variants.append((int(size), image_format))
+    return variants
+
+def normalize_image_bytes(
+    contents: bytes,
+    image_path: str,
+    thumbnail_path: str,
+    max_size: tuple = (1024, 1024)
+) -> Dict[str, Any]:
+    """Decode an image, store it as an RGB JPEG capped at max_size plus a thumbnail.
+    
+    Module-level so batch jobs can run it in a process pool.
+    """
+    with Image.open(io.BytesIO(contents)) as img:
+        if img.format not in ALLOWED_FORMATS:
+            raise ValueError(f"Unsupported image format: {img.format}")
+        source_format = img.format
+        width, height = img.size
+    
+    render_thumbnails(io.BytesIO(contents), [
+        ThumbnailSpec(max(max_size), "JPEG", Path(image_path)),
+        ThumbnailSpec(max(THUMBNAIL_SIZE), "JPEG", Path(thumbnail_path)),
+    ])
+    return {"width": width, "height": height, "format": source_format}
 
 class ImageService:
     def __init__(self):
         self.upload_dir = Path("uploads")
         self.upload_dir.mkdir(exist_ok=True)
         
-        self.thumbnail_dir = Path("uploads/thumbnails")
-        self.thumbnail_dir.mkdir(exist_ok=True)
-        
         self.max_file_size = 10 * 1024 * 1024  # 10MB
-        self.allowed_formats = {'JPEG', 'PNG', 'WEBP', 'BMP', 'GIF'}
+        
+        # Retention for uploads/; the sweep loop is started from the app lifespan
+        self.janitor = UploadJanitor(
+            self.upload_dir,
+            max_age_seconds=float(os.getenv("UPLOAD_MAX_AGE_HOURS", 24)) * 3600,
+            max_bytes=int(os.getenv("UPLOAD_MAX_MB", 1024)) * 1024 * 1024,
+            interval=float(os.getenv("UPLOAD_JANITOR_INTERVAL", 60)),
+            rescan_interval=float(os.getenv("UPLOAD_RESCAN_INTERVAL", 3600))
+        )
+        self.allowed_formats = ALLOWED_FORMATS
+        
+        # Thumbnail variants advertised per upload, e.g. "300:jpeg,300:webp,150:webp"; the first is the default.
+        # They are rendered lazily by the /img endpoint, not at upload time.
+        self.thumbnail_variants = parse_thumbnail_variants(os.getenv("THUMBNAIL_VARIANTS", "300:jpeg,300:webp"))
     
-    async def process_uploaded_file(self, file: UploadFile) -> Dict[str, Any]:
+    async def process_uploaded_file(self, file: UploadFile, create_thumbnail: bool = True) -> Dict[str, Any]:
         """Process an uploaded image file"""
+        with STAGE_SECONDS.time("image.read"):
+            contents = await file.read()
+        return await self.process_image_bytes(contents, file.filename, create_thumbnail)
+    
+    async def process_image_bytes(self, contents: bytes, filename: str, create_thumbnail: bool = True) -> Dict[str, Any]:
+        """Save raw uploaded image bytes and process them"""
         # Validate file size
-        contents = await file.read()
         if len(contents) > self.max_file_size:
             raise HTTPException(status_code=400, detail="File too large. Max size is 10MB")
         
-        # Generate unique filename
-        file_extension = file.filename.split('.')[-1].lower()
-        unique_filename = f"{uuid.uuid4()}.{file_extension}"
-        file_path = self.upload_dir / unique_filename
-        
-        # Save file
-        async with aiofiles.open(file_path, 'wb') as f:
-            await f.write(contents)
+        file_extension = filename.split('.')[-1].lower()
+        if file_extension not in IMAGE_EXTENSIONS:
+            file_extension = 'jpg'
+        file_path, image_hash = await self._store_original(contents, file_extension)
         
         # Process image and get metadata
-        return await self._process_image(file_path, file.filename)
+        return await self._process_image(file_path, filename, image_hash, create_thumbnail)
     
-    async def process_image_url(self, image_url: str) -> Dict[str, Any]:
-        """Process an image from URL"""
+    async def process_image_url(
+        self,
+        image_url: str,
+        create_thumbnail: bool = True,
+        client: Optional[httpx.AsyncClient] = None
+    ) -> Dict[str, Any]:
+        """Process an image from URL, optionally reusing a shared HTTP client"""
+        if client is None:
+            async with httpx.AsyncClient() as own_client:
+                return await self.process_image_url(image_url, create_thumbnail, own_client)
+        
         try:
-            async with httpx.AsyncClient() as client:
-                response = await client.get(image_url, timeout=30.0)
+            contents = await self.download_image(image_url, client)
+            
+            file_extension = image_url.split('.')[-1].split('?')[0].lower()
+            if file_extension not in IMAGE_EXTENSIONS:
+                file_extension = 'jpg'
+            
+            file_path, image_hash = await self._store_original(contents, file_extension)
+            
+            # Process image and get metadata
+            return await self._process_image(file_path, image_url.split('/')[-1], image_hash, create_thumbnail)
+            
+        except httpx.RequestError as e:
+            raise HTTPException(status_code=400, detail=f"Error downloading image: {str(e)}")
+        except Exception as e:
+            raise HTTPException(status_code=500, detail=f"Error processing image URL: {str(e)}")
+    
+    async def download_image(self, image_url: str, client: httpx.AsyncClient, timeout: float = 30.0) -> bytes:
+        """Download image bytes, rejecting non-image responses and stopping once over max_file_size"""
+        with STAGE_SECONDS.time("image.download"):
+            async with client.stream("GET", image_url, timeout=timeout) as response:
                 response.raise_for_status()
                 
                 if not response.headers.get('content-type', '').startswith('image/'):
                     raise HTTPException(status_code=400, detail="URL does not point to an image")
+                if int(response.headers.get('content-length') or 0) > self.max_file_size:
+                    raise HTTPException(status_code=400, detail="File too large. Max size is 10MB")
                 
-                # Generate unique filename
-                file_extension = image_url.split('.')[-1].split('?')[0].lower()
-                if file_extension not in ['jpg', 'jpeg', 'png', 'webp', 'bmp', 'gif']:
-                    file_extension = 'jpg'
-                
-                unique_filename = f"{uuid.uuid4()}.{file_extension}"
-                file_path = self.upload_dir / unique_filename
-                
-                # Save image
-                async with aiofiles.open(file_path, 'wb') as f:
-                    await f.write(response.content)
-                
-                # Process image and get metadata
-                return await self._process_image(file_path, image_url.split('/')[-1])
-                
-        except httpx.RequestError as e:
-            raise HTTPException(status_code=400, detail=f"Error downloading image: {str(e)}")
-        except Exception as e:
-            raise HTTPException(status_code=500, detail=f"Error processing image URL: {str(e)}")
+                chunks, size = [], 0
+                async for chunk in response.aiter_bytes():
+                    size += len(chunk)
+                    if size > self.max_file_size:
+                        raise HTTPException(status_code=400, detail="File too large. Max size is 10MB")
+                    chunks.append(chunk)
+        return b"".join(chunks)
     
-    async def _process_image(self, file_path: Path, original_filename: str) -> Dict[str, Any]:
+    async def _store_original(self, contents: bytes, file_extension: str) -> Tuple[Path, str]:
+        """Save image bytes under their content hash; identical uploads share one file"""
+        with STAGE_SECONDS.time("image.store"):
+            image_hash = hashlib.sha256(contents).hexdigest()[:32]
+            file_path = self.upload_dir / f"{image_hash}.{file_extension}"
+            
+            if not file_path.exists():
+                # Write then rename so a concurrent identical upload never sees a partial file
+                tmp_path = self.upload_dir / f"{image_hash}.{os.getpid()}.{id(contents)}.tmp"
+                async with aiofiles.open(tmp_path, 'wb') as f:
+                    await f.write(contents)
+                os.replace(tmp_path, file_path)
+        self.janitor.track(file_path)
+        return file_path, image_hash
+    
+    async def _process_image(
+        self,
+        file_path: Path,
+        original_filename: str,
+        image_hash: str,
+        create_thumbnail: bool = True
+    ) -> Dict[str, Any]:
         """Process image and extract metadata"""
         try:
-            with Image.open(file_path) as img:
+            # Only the header is read here; the original file is kept as uploaded
+            with STAGE_SECONDS.time("image.decode"), Image.open(file_path) as img:
                 # Validate format
                 if img.format not in self.allowed_formats:
                     os.remove(file_path)
                     raise HTTPException(status_code=400, detail=f"Unsupported image format: {img.format}")
                 
-                # Convert to RGB if necessary
-                if img.mode != 'RGB':
-                    img = img.convert('RGB')
-                    img.save(file_path, 'JPEG', quality=95)
-                
-                # Create thumbnail
-                thumbnail_path = await self._create_thumbnail(img, file_path.stem)
-                
-                # Get file stats
-                file_stats = os.stat(file_path)
-                
-                metadata = ImageMetadata(
-                    filename=original_filename,
-                    size=file_stats.st_size,
-                    width=img.width,
-                    height=img.height,
-                    format=img.format,
-                    content_type=f"image/{img.format.lower()}",
-                    image_path=f"/uploads/{file_path.name}",
-                    thumbnail_path=f"/uploads/thumbnails/{thumbnail_path.name}" if thumbnail_path else None
-                )
-                
-                return metadata.dict()
+                width, height, image_format = img.width, img.height, img.format
+            
+            thumbnails = self._thumbnail_urls(image_hash) if create_thumbnail else {}
+            
+            # Get file stats
+            file_stats = os.stat(file_path)
+            
+            metadata = ImageMetadata(
+                filename=original_filename,
+                size=file_stats.st_size,
+                width=width,
+                height=height,
+                format=image_format,
+                content_type=f"image/{image_format.lower()}",
+                image_path=f"/uploads/{file_path.name}",
+                image_hash=image_hash,
+                thumbnail_path=next(iter(thumbnails.values()), None),
+                thumbnails=thumbnails
+            )
+            
+            return metadata.dict()
                 
         except Exception as e:
             # Clean up file if processing fails
@@ -108,32 +200,13 @@ class ImageService:
                 os.remove(file_path)
             raise HTTPException(status_code=500, detail=f"Error processing image: {str(e)}")
     
-    async def _create_thumbnail(self, img: Image.Image, base_name: str) -> Path:
-        """Create a thumbnail of the image"""
-        try:
-            thumbnail_size = (300, 300)
-            thumbnail = img.copy()
-            thumbnail.thumbnail(thumbnail_size, Image.Resampling.LANCZOS)
-            
-            thumbnail_filename = f"{base_name}_thumb.jpg"
-            thumbnail_path = self.thumbnail_dir / thumbnail_filename
-            
-            thumbnail.save(thumbnail_path, 'JPEG', quality=85)
-            return thumbnail_path
-            
-        except Exception as e:
-            print(f"Warning: Could not create thumbnail: {e}")
-            return None
+    def _thumbnail_urls(self, image_hash: str) -> Dict[str, str]:
+        """Derivative URLs for every configured thumbnail variant"""
+        return {
+            f"{size}.{FORMAT_EXTENSIONS[image_format]}": f"/img/{image_hash}?w={size}&h={size}&fmt={FORMAT_EXTENSIONS[image_format]}"
+            for size, image_format in self.thumbnail_variants
+        }
     
-    def cleanup_temp_files(self, older_than_hours: int = 24):
-        """Clean up temporary uploaded files older than specified hours"""
-        import time
-        current_time = time.time()
-        cutoff_time = current_time - (older_than_hours * 3600)
-        
-        for file_path in self.upload_dir.rglob("*"):
-            if file_path.is_file() and file_path.stat().st_mtime < cutoff_time:
-                try:
-                    os.remove(file_path)
-                except Exception as e:
-                    print(f"Warning: Could not remove file {file_path}: {e}")
+    def cleanup_temp_files(self, older_than_hours: int = 24) -> int:
+        """Remove uploads not accessed within the given hours; returns bytes reclaimed"""
+        return self.janitor.sweep(max_age_seconds=older_than_hours * 3600)
@@ -0,0 +1,172 @@
+import sys
+import time
+import asyncio
+import threading
+import traceback
+from collections import deque
+from concurrent.futures import Future, ThreadPoolExecutor
+from typing import Any, Dict, Optional
+
+import numpy as np
+
+from services.metrics import metrics
+
+LOOP_LAG_SECONDS = metrics.histogram(
+    "vpm_event_loop_lag_seconds", "Delay between when the loop monitor should wake and when it did",
+    buckets=(0.001, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0)
+)
+LOOP_STALLS = metrics.counter("vpm_event_loop_stalls_total", "Event-loop stalls longer than the threshold")
+
+
+EXECUTOR_BUSY = metrics.gauge("vpm_executor_busy", "Busy workers per executor", ("executor",))
+EXECUTOR_QUEUED = metrics.gauge("vpm_executor_queued", "Jobs waiting for a worker per executor", ("executor",))
+
+
+class MonitoredThreadPoolExecutor(ThreadPoolExecutor):
+    """Thread pool that counts its own running and waiting jobs.
+
+    ``submit`` wraps each job, so the counts come from the jobs themselves
+    rather than the pool's internals, and are published to /metrics under
+    the ``executor`` label as they change.
+    """
+
+    def __init__(self, name: str, max_workers: int, **kwargs):
+        super().__init__(max_workers=max_workers, **kwargs)
+        self.name = name
+        self.max_workers = max_workers
+        self.submitted = 0  # Submitted and not yet finished or cancelled
+        self.running = 0
+        self._count_lock = threading.Lock()
+        self._publish()
+
+    def submit(self, fn, /, *args, **kwargs) -> Future:
+        with self._count_lock:
+            self.submitted += 1
+        try:
+            future = super().submit(self._run, fn, args, kwargs)
+        except BaseException:
+            self._finished()
+            raise
+        self._publish()
+        # Also fires for jobs cancelled before they started
+        future.add_done_callback(lambda _: self._finished())
+        return future
+
+    def _run(self, fn, args, kwargs):
+        with self._count_lock:
+            self.running += 1
+        self._publish()
+        try:
+            return fn(*args, **kwargs)
+        finally:
+            with self._count_lock:
+                self.running -= 1
+
+    def _finished(self):
+        with self._count_lock:
+            self.submitted -= 1
+        self._publish()
+
+    def _publish(self):
+        stats = self.stats()
+        EXECUTOR_BUSY.set(self.name, value=stats["busy"])
+        EXECUTOR_QUEUED.set(self.name, value=stats["queued"])
+
+    def stats(self) -> Dict[str, Any]:
+        """Busy workers and queued jobs"""
+        with self._count_lock:
+            busy, submitted = self.running, self.submitted
+        return {
+            "max_workers": self.max_workers,
+            "busy": busy,
+            "queued": max(submitted - busy, 0),
+            "utilization": round(busy / self.max_workers, 3) if self.max_workers else 0.0,
+        }
+
+
+class LoopMonitor:
+    """Watchdog for event-loop scheduling lag and executor saturation.
+
+    A coroutine sleeps for ``interval`` and records how late it woke up. A
+    companion thread watches that heartbeat; when the loop has not ticked
+    for ``threshold`` seconds it logs the loop thread's stack and the task
+    that is running, once per stall. Registered executors are reported with
+    their busy workers and queue depth.
+    """
+
+    def __init__(self, interval: float = 0.1, threshold: float = 0.25, window: int = 600):
+        self.interval = interval
+        self.threshold = threshold
+        # Recent lag samples (seconds); 600 at 100ms is the last minute
+        self.lags: deque = deque(maxlen=window)
+        self.stalls = 0
+        self.executors: Dict[str, MonitoredThreadPoolExecutor] = {}
+        self._heartbeat = time.perf_counter()
+        self._loop: Optional[asyncio.AbstractEventLoop] = None
+        self._loop_thread_id: Optional[int] = None
+        self._stop = threading.Event()
+
+    def watch_executor(self, executor: MonitoredThreadPoolExecutor):
+        """Report a pool's busy workers and queue depth in snapshots"""
+        self.executors[executor.name] = executor
+
+    def _log_stall(self, stalled_for: float):
+        frame = sys._current_frames().get(self._loop_thread_id)
+        task = asyncio.current_task(self._loop)
+        stack = "".join(traceback.format_stack(frame, limit=20)) if frame is not None else "  <no frame>\n"
+        print(f"⚠️  Event loop blocked for {stalled_for * 1000:.0f}ms"
+              f"{f' in task {task.get_name()} ({task.get_coro()!r})' if task else ''}:\n{stack}")
+
+    def _watch(self):
+        reported = None
+        while not self._stop.wait(self.interval):
+            heartbeat = self._heartbeat
+            stalled_for = time.perf_counter() - heartbeat
+            if stalled_for >= self.threshold and reported != heartbeat:
+                reported = heartbeat
+                self.stalls += 1
+                LOOP_STALLS.inc()
+                try:
+                    self._log_stall(stalled_for)
+                except Exception as e:
+                    print(f"Warning: Could not capture blocked loop stack: {e}")
+
+    async def run(self):
+        """Measure loop lag until cancelled; start from the app lifespan"""
+        self._loop = asyncio.get_running_loop()
+        self._loop_thread_id = threading.get_ident()
+        self._heartbeat = time.perf_counter()
+        self._stop.clear()
+        watcher = threading.Thread(target=self._watch, name="loop-monitor", daemon=True)
+        watcher.start()
+        try:
+            while True:
+                start = time.perf_counter()
+                await asyncio.sleep(self.interval)
+                now = time.perf_counter()
+                lag = max(now - start - self.interval, 0.0)
+                self._heartbeat = now
+                self.lags.append(lag)
+                LOOP_LAG_SECONDS.observe(value=lag)
+        finally:
+            self._stop.set()
+
+    def snapshot(self) -> Dict[str, Any]:
+        lags = np.fromiter(self.lags, dtype=np.float64) * 1000 if self.lags else np.zeros(1)
+        executors = {name: executor.stats() for name, executor in self.executors.items()}
+        # Overload is judged on roughly the last second so one old stall does not linger
+        recent = float(lags[-max(1, int(1.0 / self.interval)):].mean())
+        return {
+            "lag_ms": {
+                "current": round(float(lags[-1]), 2),
+                "mean": round(float(lags.mean()), 2),
+                "recent": round(recent, 2),
+                "p99": round(float(np.percentile(lags, 99)), 2),
+                "max": round(float(lags.max()), 2),
+            },
+            "stalls": self.stalls,
+            "executors": executors,
+            "overloaded": recent >= self.threshold * 1000 or any(
+                stats.get("queued", 0) > stats.get("max_workers", 0) for stats in executors.values()
+            ),
+        }
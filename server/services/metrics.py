@@ -0,0 +1,214 @@
+import time
+import threading
+from bisect import bisect_left
+from typing import Callable, Dict, List, Optional, Tuple
+
+# Latency buckets in seconds, 1ms to 10s
+DEFAULT_BUCKETS = (0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+
+# Per-metric cap on label combinations; further ones are folded into "other"
+MAX_SERIES = 200
+
+
+def _format_labels(names: Tuple[str, ...], values: Tuple[str, ...], extra: str = "") -> str:
+    pairs = [f'{name}="{_escape(value)}"' for name, value in zip(names, values)]
+    if extra:
+        pairs.append(extra)
+    return "{" + ",".join(pairs) + "}" if pairs else ""
+
+
+def _escape(value: str) -> str:
+    return str(value).replace("\\", "\\\\").replace('"', '\\"').replace("\n", "\\n")
+
+
+class _Metric:
+    kind = "untyped"
+
+    def __init__(self, name: str, description: str, labelnames: Tuple[str, ...] = ()):
+        self.name = name
+        self.description = description
+        self.labelnames = tuple(labelnames)
+        self._lock = threading.Lock()
+
+    def _key(self, labels: Tuple[str, ...], series: dict) -> Tuple[str, ...]:
+        if labels not in series and len(series) >= MAX_SERIES:
+            return tuple("other" for _ in self.labelnames)
+        return labels
+
+    def render(self) -> List[str]:
+        return [f"# HELP {self.name} {self.description}", f"# TYPE {self.name} {self.kind}", *self.samples()]
+
+    def samples(self) -> List[str]:
+        raise NotImplementedError
+
+
+class Counter(_Metric):
+    """Monotonic count, optionally read from a callback at scrape time"""
+
+    kind = "counter"
+
+    def __init__(self, name, description, labelnames=(), fn: Optional[Callable[[], float]] = None):
+        super().__init__(name, description, labelnames)
+        self.fn = fn
+        self.values: Dict[Tuple[str, ...], float] = {}
+
+    def inc(self, *labels: str, amount: float = 1.0):
+        with self._lock:
+            key = self._key(labels, self.values)
+            self.values[key] = self.values.get(key, 0.0) + amount
+
+    def samples(self) -> List[str]:
+        if self.fn is not None:
+            return [f"{self.name} {float(self.fn())}"]
+        with self._lock:
+            items = list(self.values.items())
+        return [f"{self.name}{_format_labels(self.labelnames, key)} {value}" for key, value in items]
+
+
+class Gauge(Counter):
+    """Current value, set directly or read from a callback at scrape time"""
+
+    kind = "gauge"
+
+    def set(self, *labels: str, value: float):
+        with self._lock:
+            self.values[self._key(labels, self.values)] = value
+
+
+class Histogram(_Metric):
+    """Cumulative-bucket histogram with running sum and count per label set"""
+
+    kind = "histogram"
+
+    def __init__(self, name, description, labelnames=(), buckets: Tuple[float, ...] = DEFAULT_BUCKETS):
+        super().__init__(name, description, labelnames)
+        self.buckets = tuple(buckets)
+        # labels -> [per-bucket counts..., +Inf count, sum]
+        self.series: Dict[Tuple[str, ...], List[float]] = {}
+
+    def observe(self, *labels: str, value: float):
+        slot = bisect_left(self.buckets, value)
+        with self._lock:
+            key = self._key(labels, self.series)
+            row = self.series.get(key)
+            if row is None:
+                row = self.series[key] = [0] * (len(self.buckets) + 1) + [0.0]
+            row[slot] += 1
+            row[-1] += value
+
+    def time(self, *labels: str) -> "_Timer":
+        """Context manager observing the elapsed wall time of its block"""
+        return _Timer(self, labels)
+
+    def samples(self) -> List[str]:
+        with self._lock:
+            items = [(key, list(row)) for key, row in self.series.items()]
+        lines = []
+        for key, row in items:
+            cumulative = 0
+            for bound, count in zip(self.buckets + (float("inf"),), row):
+                cumulative += count
+                le = 'le="+Inf"' if bound == float("inf") else f'le="{bound!r}"'
+                lines.append(f"{self.name}_bucket{_format_labels(self.labelnames, key, le)} {cumulative}")
+            labels = _format_labels(self.labelnames, key)
+            lines.append(f"{self.name}_sum{labels} {row[-1]}")
+            lines.append(f"{self.name}_count{labels} {cumulative}")
+        return lines
+
+
+class _Timer:
+    __slots__ = ("histogram", "labels", "start")
+
+    def __init__(self, histogram: Histogram, labels: Tuple[str, ...]):
+        self.histogram = histogram
+        self.labels = labels
+
+    def __enter__(self):
+        self.start = time.perf_counter()
+        return self
+
+    def __exit__(self, *exc_info):
+        self.histogram.observe(*self.labels, value=time.perf_counter() - self.start)
+        return False
+
+
+class MetricsRegistry:
+    """In-process metrics rendered in the Prometheus text exposition format.
+
+    Label values must come from small fixed sets (stage names, route
+    templates, status codes); each metric also caps its series count. Every
+    worker process keeps its own registry.
+    """
+
+    def __init__(self):
+        self.metrics: Dict[str, _Metric] = {}
+
+    def _register(self, metric: _Metric) -> _Metric:
+        # Re-registering returns the existing metric so modules can declare theirs at import
+        return self.metrics.setdefault(metric.name, metric)
+
+    def counter(self, name: str, description: str, labelnames=(), fn=None) -> Counter:
+        return self._register(Counter(name, description, labelnames, fn))
+
+    def gauge(self, name: str, description: str, labelnames=(), fn=None) -> Gauge:
+        return self._register(Gauge(name, description, labelnames, fn))
+
+    def histogram(self, name: str, description: str, labelnames=(), buckets=DEFAULT_BUCKETS) -> Histogram:
+        return self._register(Histogram(name, description, labelnames, buckets))
+
+    def render(self) -> str:
+        lines = []
+        for metric in list(self.metrics.values()):
+            try:
+                lines.extend(metric.render())
+            except Exception as e:
+                print(f"Warning: Could not render metric {metric.name}: {e}")
+        return "\n".join(lines) + "\n"
+
+
+# Shared registry for the process; services record into it, /metrics renders it
+metrics = MetricsRegistry()
+
+STAGE_SECONDS = metrics.histogram(
+    "vpm_stage_duration_seconds", "Time spent in each request pipeline stage", ("stage",)
+)
+
+HTTP_REQUESTS = metrics.counter(
+    "vpm_http_requests_total", "HTTP requests by handler, method and status", ("handler", "method", "status")
+)
+HTTP_SECONDS = metrics.histogram(
+    "vpm_http_request_duration_seconds", "HTTP request latency by handler", ("handler",)
+)
+
+
+class MetricsMiddleware:
+    """Plain ASGI middleware counting and timing requests per handler.
+
+    Requests are labelled with the matched endpoint's name (or "unmatched"),
+    never the raw path, so series stay bounded.
+    """
+
+    def __init__(self, app):
+        self.app = app
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http":
+            await self.app(scope, receive, send)
+            return
+
+        start = time.perf_counter()
+        status = 500
+
+        async def send_wrapper(message):
+            nonlocal status
+            if message["type"] == "http.response.start":
+                status = message["status"]
+            await send(message)
+
+        try:
+            await self.app(scope, receive, send_wrapper)
+        finally:
+            endpoint = scope.get("endpoint")
+            handler = getattr(endpoint, "__name__", type(endpoint).__name__) if endpoint else "unmatched"
+            HTTP_REQUESTS.inc(handler, scope["method"], str(status))
+            HTTP_SECONDS.observe(handler, value=time.perf_counter() - start)
@@ -0,0 +1,155 @@
+import os
+import numpy as np
+from concurrent.futures import ThreadPoolExecutor
+from pathlib import Path
+from typing import Iterable, Optional, Tuple
+
+
+class NeighborGraph:
+    """Exact top-k neighbour lists for every catalog row.
+
+    The graph is two dense arrays indexed by catalog position: ``ids``
+    (int32, -1 for empty slots) and ``scores`` (float32, descending). They
+    are saved as .npy files and memory-mapped for serving, so a lookup is a
+    single row slice.
+    """
+
+    def __init__(self, path: Path, k: int = 20):
+        self.path = Path(path)
+        self.k = k
+        self.ids: Optional[np.ndarray] = None
+        self.scores: Optional[np.ndarray] = None
+
+    def __len__(self) -> int:
+        return 0 if self.ids is None else len(self.ids)
+
+    @property
+    def ids_path(self) -> Path:
+        return self.path / "ids.npy"
+
+    @property
+    def scores_path(self) -> Path:
+        return self.path / "scores.npy"
+
+    def load(self) -> bool:
+        """Memory-map a saved graph; returns False if none exists"""
+        if self.ids is None and self.ids_path.exists() and self.scores_path.exists():
+            self.ids = np.load(self.ids_path, mmap_mode='r')
+            self.scores = np.load(self.scores_path, mmap_mode='r')
+            self.k = self.ids.shape[1]
+        return self.ids is not None
+
+    def save(self):
+        self.path.mkdir(parents=True, exist_ok=True)
+        for array, target in ((self.ids, self.ids_path), (self.scores, self.scores_path)):
+            tmp_path = target.with_suffix(f".{os.getpid()}.tmp.npy")
+            np.save(tmp_path, np.ascontiguousarray(array))
+            os.replace(tmp_path, target)
+
+    def clear(self):
+        self.ids = self.scores = None
+        for target in (self.ids_path, self.scores_path):
+            if target.exists():
+                os.remove(target)
+
+    def neighbors(self, position: int) -> Tuple[np.ndarray, np.ndarray]:
+        """Return (ids, scores) for one catalog position"""
+        return self.ids[position], self.scores[position]
+
+    def build(self, vectors: np.ndarray, block_size: int = 1024, workers: Optional[int] = None):
+        """Compute the full graph with blocked inner products.
+
+        Query rows are processed in blocks of block_size across a thread pool
+        (NumPy's matmul releases the GIL); each block scans the catalog in
+        chunks so peak memory stays at block_size x chunk scores per worker.
+        """
+        n = len(vectors)
+        k = min(self.k, max(n - 1, 0))
+        ids = np.full((n, self.k), -1, dtype=np.int32)
+        scores = np.full((n, self.k), -np.inf, dtype=np.float32)
+        self.ids, self.scores = ids, scores
+        if k == 0:
+            return
+
+        def run_block(start: int):
+            rows = np.arange(start, min(start + block_size, n))
+            ids[rows, :k], scores[rows, :k] = self._search_rows(vectors, rows, k, block_size)
+
+        with ThreadPoolExecutor(max_workers=workers or os.cpu_count()) as pool:
+            list(pool.map(run_block, range(0, n, block_size)))
+
+    def update(self, vectors: np.ndarray, changed: Iterable[int], block_size: int = 1024):
+        """Incrementally refresh the graph after rows were added or changed.
+
+        ``vectors`` is the full current catalog (appended rows at the end).
+        Changed rows and rows that listed a changed row as a neighbour are
+        recomputed exactly; every other row only merges in the changed rows.
+        """
+        n = len(vectors)
+        old_n = len(self)
+        if n < old_n:
+            raise ValueError("NeighborGraph.update cannot remove rows; rebuild instead")
+
+        # Take private, writable copies of the (possibly memory-mapped) arrays
+        ids = np.full((n, self.k), -1, dtype=np.int32)
+        scores = np.full((n, self.k), -np.inf, dtype=np.float32)
+        if old_n:
+            ids[:old_n] = self.ids
+            scores[:old_n] = self.scores
+        k = min(self.k, max(n - 1, 0))
+
+        changed = np.union1d(np.asarray(list(changed), dtype=np.int64), np.arange(old_n, n))
+        if k == 0 or not len(changed):
+            self.ids, self.scores = ids, scores
+            return
+
+        # Rows pointing at a changed row may have lost that neighbour's old score
+        stale = np.isin(ids, changed).any(axis=1)
+        stale[changed] = True
+        recompute = np.flatnonzero(stale)
+        for start in range(0, len(recompute), block_size):
+            rows = recompute[start:start + block_size]
+            ids[rows, :k], scores[rows, :k] = self._search_rows(vectors, rows, k, block_size)
+
+        # Everyone else only needs to consider the changed rows as new candidates
+        candidates = np.asarray(vectors[changed], dtype=np.float32)
+        others = np.flatnonzero(~stale)
+        for start in range(0, len(others), block_size):
+            rows = others[start:start + block_size]
+            block_scores = np.asarray(vectors[rows], dtype=np.float32) @ candidates.T
+            merged_ids = np.hstack([ids[rows, :k], np.broadcast_to(changed, block_scores.shape)])
+            merged_scores = np.hstack([scores[rows, :k], block_scores])
+            ids[rows, :k], scores[rows, :k] = self._top_k(merged_ids, merged_scores, k)
+
+        self.ids, self.scores = ids, scores
+
+    @staticmethod
+    def _top_k(ids: np.ndarray, scores: np.ndarray, k: int) -> Tuple[np.ndarray, np.ndarray]:
+        """Select the k best columns per row, sorted by descending score"""
+        if scores.shape[1] > k:
+            part = np.argpartition(-scores, k - 1, axis=1)[:, :k]
+            ids = np.take_along_axis(ids, part, axis=1)
+            scores = np.take_along_axis(scores, part, axis=1)
+        order = np.argsort(-scores, axis=1, kind='stable')
+        return np.take_along_axis(ids, order, axis=1), np.take_along_axis(scores, order, axis=1)
+
+    def _search_rows(self, vectors: np.ndarray, rows: np.ndarray, k: int, chunk_size: int):
+        """Exact top-k for the given rows against every catalog row except themselves"""
+        queries = np.asarray(vectors[rows], dtype=np.float32)
+        best_ids = np.full((len(rows), k), -1, dtype=np.int32)
+        best_scores = np.full((len(rows), k), -np.inf, dtype=np.float32)
+
+        for start in range(0, len(vectors), chunk_size):
+            stop = min(start + chunk_size, len(vectors))
+            block_scores = queries @ np.asarray(vectors[start:stop], dtype=np.float32).T
+            block_ids = np.arange(start, stop, dtype=np.int32)
+
+            # A product is never its own neighbour
+            self_hits = (rows >= start) & (rows < stop)
+            block_scores[np.flatnonzero(self_hits), rows[self_hits] - start] = -np.inf
+
+            merged_ids = np.hstack([best_ids, np.broadcast_to(block_ids, block_scores.shape)])
+            merged_scores = np.hstack([best_scores, block_scores])
+            best_ids, best_scores = self._top_k(merged_ids, merged_scores, k)
+
+        return best_ids, best_scores
@@ -6,38 +6,59 @@ import uuid
 from datetime import datetime
 
 from models.product import Product
+from services.catalog_store import CatalogStore
+from services.response_cache import CachedBody, ResponseCache, dumps
 
 class ProductService:
-    def __init__(self):
-        self.data_dir = Path("data")
+    def __init__(self, data_dir: Path = Path("data"), sample_data: bool = True):
+        self.data_dir = Path(data_dir)
         self.products_file = self.data_dir / "products.json"
-        self.products: List[Product] = []
+        # Without sample data a missing or unreadable products.json is an error, not a fresh demo catalog
+        self.sample_data = sample_data
+        # Row order is the similarity index order
+        self.products = CatalogStore([])
+        # Bumped on every catalog change; cached response bodies are only valid for one version
+        self.version = 0
+        self.response_cache = ResponseCache(int(float(os.getenv("RESPONSE_CACHE_MB", "32")) * 1024 * 1024))
         
+    def _set_catalog(self, store: CatalogStore):
+        self.products = store
+        self.version += 1
+
     async def initialize(self):
         """Initialize the product service and load sample data"""
         self.data_dir.mkdir(exist_ok=True)
         
         if self.products_file.exists():
             await self._load_products()
-        else:
+        elif self.sample_data:
             await self._create_sample_products()
+        else:
+            raise FileNotFoundError(f"No catalog at {self.products_file}")
         
         print(f"✅ Loaded {len(self.products)} products")
     
+    async def reload(self):
+        """Reload products from disk, keeping the current catalog if the file is missing"""
+        if self.products_file.exists():
+            await self._load_products()
+    
     async def _load_products(self):
         """Load products from JSON file"""
         try:
             with open(self.products_file, 'r', encoding='utf-8') as f:
                 products_data = json.load(f)
-                self.products = [Product(**product) for product in products_data]
+            self._set_catalog(CatalogStore(products_data))
         except Exception as e:
             print(f"Error loading products: {e}")
+            if not self.sample_data:
+                raise
             await self._create_sample_products()
     
     async def _save_products(self):
         """Save products to JSON file"""
         try:
-            products_data = [product.dict() for product in self.products]
+            products_data = list(self.products.records())
             with open(self.products_file, 'w', encoding='utf-8') as f:
                 json.dump(products_data, f, indent=2, default=str)
         except Exception as e:
@@ -392,10 +413,9 @@ class ProductService:
         
         all_products = sample_products + additional_products
         
-        self.products = []
         for product_data in all_products:
             product_data['created_at'] = datetime.utcnow()
-            self.products.append(Product(**product_data))
+        self._set_catalog(CatalogStore.from_products(Product(**product_data) for product_data in all_products))
         
         await self._save_products()
         print(f"✅ Created {len(self.products)} sample products")
@@ -407,52 +427,74 @@ class ProductService:
         offset: int = 0
     ) -> List[Product]:
         """Get products with optional filtering"""
-        filtered_products = self.products
-        
+        return [self.products[i].to_product() for i in self._page_positions(category, limit, offset)]
+    
+    def _page_positions(self, category: Optional[str], limit: int, offset: int) -> List[int]:
         if category:
-            filtered_products = [
-                p for p in filtered_products 
-                if p.category.lower() == category.lower()
-            ]
-        
-        return filtered_products[offset:offset + limit]
+            return [int(i) for i in self.products.category_positions(category)[offset:offset + limit]]
+        return list(range(len(self.products))[offset:offset + limit])
+    
+    def _product_body(self, position: int) -> CachedBody:
+        return self.response_cache.get(
+            self.version, ("product", position), lambda: dumps(self.products[position].to_record())
+        )
+    
+    async def get_products_json(self, category: Optional[str] = None, limit: int = 50, offset: int = 0) -> CachedBody:
+        """get_products as encoded JSON, assembled from cached per-product bodies"""
+        def build():
+            positions = self._page_positions(category, limit, offset)
+            return b"[" + b",".join(self._product_body(i).body for i in positions) + b"]"
+        key = ("products", category.lower() if category else None, limit, offset)
+        return self.response_cache.get(self.version, key, build)
+    
+    async def get_product_json(self, product_id: str) -> Optional[CachedBody]:
+        """get_product_by_id as encoded JSON, or None"""
+        position = self.products.position(product_id)
+        return self._product_body(position) if position is not None else None
     
-    async def get_all_products(self) -> List[Product]:
-        """Get all products"""
+    async def get_all_products(self) -> CatalogStore:
+        """Get all products as row views; call to_product() on the ones being returned"""
         return self.products
     
+    def get_product_position(self, product_id: str) -> Optional[int]:
+        """Get a product's position in the catalog (its row in the similarity index)"""
+        return self.products.position(product_id)
+    
     async def get_product_by_id(self, product_id: str) -> Optional[Product]:
         """Get a specific product by ID"""
-        for product in self.products:
-            if product.id == product_id:
-                return product
-        return None
+        position = self.products.position(product_id)
+        return self.products[position].to_product() if position is not None else None
     
     async def add_product(self, product: Product) -> Product:
         """Add a new product"""
-        self.products.append(product)
+        self._set_catalog(self.products.appended(product))
         await self._save_products()
         return product
     
     async def update_product(self, updated_product: Product) -> Optional[Product]:
         """Update an existing product"""
-        for i, product in enumerate(self.products):
-            if product.id == updated_product.id:
-                self.products[i] = updated_product
-                await self._save_products()
-                return updated_product
-        return None
+        position = self.products.position(updated_product.id)
+        if position is None:
+            return None
+        self._set_catalog(self.products.replaced(position, updated_product))
+        await self._save_products()
+        return updated_product
     
     async def delete_product(self, product_id: str) -> bool:
         """Delete a product"""
-        for i, product in enumerate(self.products):
-            if product.id == product_id:
-                del self.products[i]
-                await self._save_products()
-                return True
-        return False
+        position = self.products.position(product_id)
+        if position is None:
+            return False
+        self._set_catalog(self.products.deleted(position))
+        await self._save_products()
+        return True
     
     async def get_categories(self) -> List[str]:
         """Get all unique categories"""
-        categories = set(product.category for product in self.products)
-        return sorted(list(categories))
+        return self.products.category_names()
+    
+    async def get_categories_json(self) -> CachedBody:
+        """{"categories": [...]} as encoded JSON"""
+        return self.response_cache.get(
+            self.version, ("categories",), lambda: dumps({"categories": self.products.category_names()})
+        )
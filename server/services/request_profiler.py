@@ -0,0 +1,193 @@
+import re
+import sys
+import json
+import time
+import random
+import asyncio
+import threading
+from collections import Counter, deque
+from datetime import datetime, timezone
+from pathlib import Path
+from typing import Any, Dict, List, Optional
+
+PROFILE_NAME_PATTERN = re.compile(r"^[\w.-]+\.collapsed$")
+
+
+def _frame_label(frame) -> str:
+    code = frame.f_code
+    parts = Path(code.co_filename).parts
+    return f"{code.co_name} ({'/'.join(parts[-2:])}:{code.co_firstlineno})"
+
+
+class RequestProfiler:
+    """Stack-sampling profiles of slow (or randomly sampled) requests.
+
+    While at least one request is in flight, a daemon thread samples every
+    thread's stack each ``interval`` seconds into a short in-memory ring
+    and measures event-loop scheduling lag. When a request ends over the
+    threshold, or is picked by ``sample_rate``, the samples taken during it
+    are written as a collapsed-stack file (the input format of
+    flamegraph.pl and speedscope) with a JSON sidecar. Only the newest
+    ``max_files`` profiles are kept. With no request in flight the thread
+    sleeps on an event, so idle cost is nil.
+    """
+
+    def __init__(
+        self,
+        profile_dir: Path,
+        threshold_seconds: float = 1.0,
+        sample_rate: float = 0.0,
+        interval: float = 0.005,
+        max_files: int = 50,
+        window_seconds: float = 120.0
+    ):
+        self.profile_dir = Path(profile_dir)
+        self.threshold_seconds = threshold_seconds
+        self.sample_rate = sample_rate
+        self.interval = interval
+        self.max_files = max_files
+
+        maxlen = int(window_seconds / interval)
+        # (timestamp, collapsed stack) and (timestamp, loop lag seconds)
+        self.samples: deque = deque(maxlen=maxlen)
+        self.lags: deque = deque(maxlen=maxlen)
+        self._active = 0
+        self._wake = threading.Event()
+        self._thread: Optional[threading.Thread] = None
+        self._loop: Optional[asyncio.AbstractEventLoop] = None
+        # Send time of the loop-lag probe not yet run by the loop, if any
+        self._probe_sent: Optional[float] = None
+
+    def _ensure_thread(self):
+        if self._thread is None or not self._thread.is_alive():
+            self._loop = asyncio.get_running_loop()
+            self._thread = threading.Thread(target=self._run, name="request-profiler", daemon=True)
+            self._thread.start()
+
+    def _record_lag(self):
+        sent, self._probe_sent = self._probe_sent, None
+        self.lags.append((sent, time.perf_counter() - sent))
+
+    def _run(self):
+        own_id = threading.get_ident()
+        while True:
+            self._wake.wait()
+            now = time.perf_counter()
+            names = {thread.ident: thread.name for thread in threading.enumerate()}
+            for thread_id, frame in sys._current_frames().items():
+                if thread_id == own_id:
+                    continue
+                stack = []
+                while frame is not None:
+                    stack.append(_frame_label(frame))
+                    frame = frame.f_back
+                stack.append(names.get(thread_id, str(thread_id)))
+                self.samples.append((now, ";".join(reversed(stack))))
+            # One probe at a time; a probe that has not run yet is itself the lag
+            if self._probe_sent is None:
+                self._probe_sent = time.perf_counter()
+                try:
+                    self._loop.call_soon_threadsafe(self._record_lag)
+                except RuntimeError:
+                    self._probe_sent = None  # Loop closed
+            time.sleep(self.interval)
+
+    def begin(self) -> float:
+        """Mark a request as started; returns its start time"""
+        self._ensure_thread()
+        self._active += 1
+        self._wake.set()
+        return time.perf_counter()
+
+    def end(self, start: float) -> Optional[Dict[str, Any]]:
+        """Mark a request as finished; returns the profile to write if it qualifies"""
+        self._active -= 1
+        if self._active == 0:
+            self._wake.clear()
+
+        end = time.perf_counter()
+        duration = end - start
+        slow = duration >= self.threshold_seconds
+        if not slow and not (self.sample_rate and random.random() < self.sample_rate):
+            return None
+
+        stacks = Counter(stack for timestamp, stack in list(self.samples) if start <= timestamp <= end)
+        lags = [lag for sent, lag in list(self.lags) if start <= sent <= end]
+        pending = self._probe_sent
+        if pending is not None:
+            lags.append(end - pending)
+        return {
+            "stacks": stacks,
+            "duration_ms": round(duration * 1000, 1),
+            "reason": "slow" if slow else "sampled",
+            "samples": sum(stacks.values()),
+            "interval_ms": self.interval * 1000,
+            "loop_lag_max_ms": round(max(lags) * 1000, 2) if lags else None,
+            "loop_lag_mean_ms": round(sum(lags) / len(lags) * 1000, 2) if lags else None,
+        }
+
+    def write(self, profile: Dict[str, Any], handler: str, method: str, path: str):
+        """Save a profile and drop the oldest beyond max_files"""
+        self.profile_dir.mkdir(parents=True, exist_ok=True)
+        stamp = datetime.now(timezone.utc).strftime("%Y%m%dT%H%M%S%f")
+        name = f"{stamp}_{handler}_{int(profile['duration_ms'])}ms.collapsed"
+        stacks = profile.pop("stacks")
+
+        with open(self.profile_dir / name, 'w', encoding='utf-8') as f:
+            f.writelines(f"{stack} {count}\n" for stack, count in stacks.most_common())
+        meta = {"name": name, "handler": handler, "method": method, "path": path,
+                "created_at": datetime.now(timezone.utc).isoformat(), **profile}
+        with open(self.profile_dir / f"{name}.json", 'w', encoding='utf-8') as f:
+            json.dump(meta, f)
+
+        for old in self._profile_files()[:-self.max_files]:
+            old.unlink(missing_ok=True)
+            old.with_name(old.name + ".json").unlink(missing_ok=True)
+
+    def _profile_files(self) -> List[Path]:
+        if not self.profile_dir.exists():
+            return []
+        return sorted(self.profile_dir.glob("*.collapsed"))
+
+    def list_profiles(self) -> List[Dict[str, Any]]:
+        """Metadata for stored profiles, newest first"""
+        profiles = []
+        for path in reversed(self._profile_files()):
+            try:
+                with open(path.with_name(path.name + ".json"), 'r', encoding='utf-8') as f:
+                    profiles.append(json.load(f))
+            except (OSError, ValueError):
+                profiles.append({"name": path.name})
+        return profiles
+
+    def profile_path(self, name: str) -> Optional[Path]:
+        if not PROFILE_NAME_PATTERN.match(name):
+            return None
+        path = self.profile_dir / name
+        return path if path.exists() else None
+
+
+class ProfilerMiddleware:
+    """Plain ASGI middleware feeding request timings to a RequestProfiler"""
+
+    def __init__(self, app, profiler: RequestProfiler):
+        self.app = app
+        self.profiler = profiler
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http":
+            await self.app(scope, receive, send)
+            return
+
+        start = self.profiler.begin()
+        try:
+            await self.app(scope, receive, send)
+        finally:
+            profile = self.profiler.end(start)
+            if profile is not None:
+                endpoint = scope.get("endpoint")
+                handler = getattr(endpoint, "__name__", type(endpoint).__name__) if endpoint else "unmatched"
+                try:
+                    await asyncio.to_thread(self.profiler.write, profile, handler, scope["method"], scope["path"])
+                except Exception as e:
+                    print(f"Warning: Could not write request profile: {e}")
@@ -0,0 +1,102 @@
+import json
+import hashlib
+from collections import OrderedDict
+from datetime import datetime
+from typing import Any, Callable, Hashable, NamedTuple, Optional
+
+try:
+    import orjson
+except ImportError:  # Optional; the stdlib fallback writes the same JSON, several times slower
+    orjson = None
+
+
+def _default(value):
+    if isinstance(value, datetime):
+        # Same as Product's json_encoders
+        return value.isoformat()
+    raise TypeError(f"Object of type {type(value).__name__} is not JSON serializable")
+
+
+def dumps(value: Any) -> bytes:
+    """Compact JSON bytes, matching what FastAPI would send for the same records"""
+    if orjson is not None:
+        return orjson.dumps(value)
+    return json.dumps(value, default=_default, ensure_ascii=False, separators=(",", ":")).encode("utf-8")
+
+
+class CachedBody(NamedTuple):
+    body: bytes
+    etag: str
+
+
+def make_body(body: bytes) -> CachedBody:
+    """Wrap encoded JSON with a strong ETag derived from its content"""
+    return CachedBody(body, f'"{hashlib.blake2b(body, digest_size=16).hexdigest()}"')
+
+
+def etag_matches(if_none_match: Optional[str], etag: str) -> bool:
+    """Whether an If-None-Match header lists this ETag or is ``*`` (weak comparison, RFC 9110)"""
+    if not if_none_match:
+        return False
+    for candidate in if_none_match.split(","):
+        candidate = candidate.strip()
+        if candidate == "*":
+            return True
+        if candidate.startswith("W/"):
+            candidate = candidate[2:]
+        if candidate == etag:
+            return True
+    return False
+
+
+class ResponseCache:
+    """Pre-encoded JSON response bodies, tied to one catalog version.
+
+    Entries are built on first request and kept least-recently-used
+    first up to ``max_bytes``. Every catalog change bumps the version,
+    and the first lookup at a new version drops all entries, so a body
+    is never served for a catalog it was not built from. ETags hash the
+    body, so they agree across workers that hold the same catalog.
+    """
+
+    def __init__(self, max_bytes: int):
+        self.max_bytes = max_bytes
+        self.version = None
+        # key -> CachedBody, least recently used first
+        self.entries: "OrderedDict[Hashable, CachedBody]" = OrderedDict()
+        self.total_bytes = 0
+        self.stats = {"hits": 0, "misses": 0, "evictions": 0}
+
+    def clear(self):
+        self.entries.clear()
+        self.total_bytes = 0
+
+    def get(self, version: int, key: Hashable, build: Callable[[], bytes]) -> CachedBody:
+        """Cached body for key at this catalog version, encoding it with build() on a miss"""
+        if version != self.version:
+            self.clear()
+            self.version = version
+        cached = self.entries.get(key)
+        if cached is not None:
+            self.entries.move_to_end(key)
+            self.stats["hits"] += 1
+            return cached
+
+        self.stats["misses"] += 1
+        cached = make_body(build())
+        if len(cached.body) <= self.max_bytes:
+            self.entries[key] = cached
+            self.total_bytes += len(cached.body)
+            while self.total_bytes > self.max_bytes:
+                _, evicted = self.entries.popitem(last=False)
+                self.total_bytes -= len(evicted.body)
+                self.stats["evictions"] += 1
+        return cached
+
+    def snapshot(self):
+        return {
+            "entries": len(self.entries),
+            "bytes": self.total_bytes,
+            "max_bytes": self.max_bytes,
+            **self.stats,
+        }
@@ -0,0 +1,449 @@
+import argparse
+import asyncio
+import hashlib
+import heapq
+import itertools
+import os
+import pickle
+import socket
+import struct
+import subprocess
+import sys
+import threading
+import time
+from pathlib import Path
+from typing import Any, Dict, List, Optional, Sequence, Tuple
+
+import faiss
+import numpy as np
+
+from services.metrics import metrics
+from services.vector_store import VectorStore
+
+SERVER_DIR = Path(__file__).resolve().parent.parent
+
+SHARD_QUERIES = metrics.counter(
+    "vpm_shard_queries_total", "Per-shard sub-queries by outcome", ("shard", "outcome")
+)
+SHARD_SECONDS = metrics.histogram(
+    "vpm_shard_search_seconds", "Round trip of one shard sub-query", ("shard",),
+    buckets=(0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5)
+)
+
+
+def _mix64(x):
+    """splitmix64 finalizer over uint64 scalars or arrays"""
+    with np.errstate(over="ignore"):
+        x = (x ^ (x >> np.uint64(30))) * np.uint64(0xBF58476D1CE4E5B9)
+        x = (x ^ (x >> np.uint64(27))) * np.uint64(0x94D049BB133111EB)
+        return x ^ (x >> np.uint64(31))
+
+
+def assign_shards(keys: Sequence[str], shards: int) -> np.ndarray:
+    """Rendezvous (highest random weight) shard for each key.
+
+    A key stays on its shard as long as that shard exists. Going from N
+    to N+1 shards moves only the roughly 1/(N+1) of keys the new shard
+    wins, and no key moves between two old shards.
+    """
+    unique, inverse = np.unique(np.asarray(keys, dtype=object), return_inverse=True)
+    hashes = np.fromiter(
+        (int.from_bytes(hashlib.blake2b(str(key).encode("utf-8"), digest_size=8).digest(), "little") for key in unique),
+        dtype=np.uint64, count=len(unique)
+    )
+    weights = np.stack([_mix64(hashes ^ _mix64(np.uint64(shard + 1))) for shard in range(shards)])
+    return weights.argmax(axis=0)[inverse].astype(np.int32)
+
+
+def overwrite_codes(index, positions: Sequence[int], vectors: np.ndarray):
+    """Re-encode rows of a flat or scalar-quantized index in place.
+
+    Row ids stay put and the quantizer keeps its trained ranges, so a
+    changed vector costs one encode instead of a rebuild.
+    """
+    size = index.code_size
+    codes = faiss.rev_swig_ptr(index.codes.data(), index.ntotal * size)
+    encoded = index.sa_encode(np.ascontiguousarray(vectors, dtype=np.float32).reshape(len(positions), -1))
+    for position, code in zip(positions, encoded):
+        codes[position * size:(position + 1) * size] = code
+
+
+def _send(sock: socket.socket, message: Any):
+    data = pickle.dumps(message, protocol=pickle.HIGHEST_PROTOCOL)
+    sock.sendall(struct.pack("<Q", len(data)) + data)
+
+
+def _recv_exact(sock: socket.socket, size: int) -> bytes:
+    chunks = []
+    while size:
+        chunk = sock.recv(min(size, 1 << 20))
+        if not chunk:
+            raise ConnectionError("shard connection closed")
+        chunks.append(chunk)
+        size -= len(chunk)
+    return b"".join(chunks)
+
+
+def _recv(sock: socket.socket) -> Any:
+    (size,) = struct.unpack("<Q", _recv_exact(sock, 8))
+    return pickle.loads(_recv_exact(sock, size))
+
+
+class ShardWorker:
+    """Index state inside one shard process"""
+
+    def __init__(self):
+        self.index = None
+        self.rows = np.zeros(0, dtype=np.int64)
+        self.store: Optional[VectorStore] = None
+        self.rerank_candidates = 0
+
+    def load(self, vector_path: str, dim: int, rows: np.ndarray, qtype: Optional[int], rerank_candidates: int):
+        """Build this shard's index over the given catalog rows"""
+        start = time.perf_counter()
+        store = VectorStore(Path(vector_path), dim)
+        vectors = store.get(rows) if len(rows) else np.zeros((0, dim), dtype=np.float32)
+        if qtype is None:
+            index = faiss.IndexFlatIP(dim)
+        else:
+            index = faiss.IndexScalarQuantizer(dim, qtype, faiss.METRIC_INNER_PRODUCT)
+            if len(vectors):
+                index.train(vectors)
+        if len(vectors):
+            index.add(vectors)
+        self.index, self.rows, self.store = index, rows, store
+        self.rerank_candidates = rerank_candidates if qtype is not None else 0
+        return {"rows": len(rows), "seconds": round(time.perf_counter() - start, 3)}
+
+    def upsert(self, rows: np.ndarray, vectors: np.ndarray):
+        """Overwrite the given catalog rows this shard holds and append the others"""
+        # The coordinator grew or rewrote the vector file; re-map it on the next re-rank
+        self.store.close()
+        held = np.isin(rows, self.rows)
+        if held.any():
+            local = [int(np.flatnonzero(self.rows == row)[0]) for row in rows[held]]
+            overwrite_codes(self.index, local, vectors[held])
+        if not held.all():
+            new = np.ascontiguousarray(vectors[~held], dtype=np.float32)
+            if not self.index.is_trained:
+                self.index.train(new)
+            self.index.add(new)
+            self.rows = np.concatenate([self.rows, rows[~held]])
+        return {"rows": len(self.rows)}
+
+    def remove(self, rows: np.ndarray):
+        """Drop catalog rows that moved to another shard; later rows keep their order"""
+        local = np.flatnonzero(np.isin(self.rows, rows)).astype(np.int64)
+        self.index.remove_ids(faiss.IDSelectorBatch(local))
+        self.rows = np.delete(self.rows, local)
+        return {"rows": len(self.rows)}
+
+    def search(self, queries: np.ndarray, k: int, bitmap: Optional[np.ndarray]):
+        """Top-k over this shard, returned with catalog row ids"""
+        k = min(k, self.index.ntotal)
+        params = None
+        if bitmap is not None:
+            params = faiss.SearchParameters(sel=faiss.IDSelectorBitmap(self.index.ntotal, faiss.swig_ptr(bitmap)))
+        if not self.rerank_candidates:
+            similarities, local = self.index.search(queries, k, params=params)
+        else:
+            candidates = min(max(k, self.rerank_candidates), self.index.ntotal)
+            _, candidate_ids = self.index.search(queries, candidates, params=params)
+            similarities = np.full((len(queries), k), -np.inf, dtype=np.float32)
+            local = np.full((len(queries), k), -1, dtype=np.int64)
+            for row, (query, ids) in enumerate(zip(queries, candidate_ids)):
+                ids = ids[ids >= 0]
+                exact = self.store.get(self.rows[ids]) @ query
+                order = np.argsort(-exact)[:k]
+                similarities[row, :len(order)] = exact[order]
+                local[row, :len(order)] = ids[order]
+        return similarities, np.where(local >= 0, self.rows[np.maximum(local, 0)], -1)
+
+
+def serve_shard(fd: int):
+    """Worker loop: answer (request_id, op, args) messages until the socket closes"""
+    sock = socket.socket(fileno=fd)
+    worker = ShardWorker()
+    while True:
+        try:
+            request_id, op, args = _recv(sock)
+        except ConnectionError:
+            return
+        try:
+            result = (True, getattr(worker, op)(*args))
+        except Exception as e:
+            result = (False, f"{type(e).__name__}: {e}")
+        _send(sock, (request_id, *result))
+
+
+class ShardClient:
+    """Coordinator-side handle for one shard process.
+
+    The worker is a plain ``python -m services.sharded_index`` subprocess
+    talking pickled messages over a socketpair, rather than a
+    multiprocessing child, so it does not re-import the app (and torch).
+    """
+
+    def __init__(self, shard: int):
+        self.shard = shard
+        self.label = str(shard)
+        self.rows = np.zeros(0, dtype=np.int64)
+        self.process: Optional[subprocess.Popen] = None
+        self._sock: Optional[socket.socket] = None
+        self._send_lock = threading.Lock()
+        self._pending: Dict[int, asyncio.Future] = {}
+        self._ids = itertools.count()
+        self._loop: Optional[asyncio.AbstractEventLoop] = None
+
+    @property
+    def alive(self) -> bool:
+        return self.process is not None and self.process.poll() is None and self._sock is not None
+
+    def start(self):
+        self._loop = asyncio.get_running_loop()
+        parent, child = socket.socketpair()
+        env = {**os.environ, "PYTHONPATH": os.pathsep.join(filter(None, [str(SERVER_DIR), os.getenv("PYTHONPATH")]))}
+        self.process = subprocess.Popen(
+            [sys.executable, "-m", "services.sharded_index", "--fd", str(child.fileno())],
+            pass_fds=(child.fileno(),), env=env, cwd=os.getcwd()
+        )
+        child.close()
+        self._sock = parent
+        threading.Thread(target=self._read, args=(parent,), name=f"shard-{self.shard}-reader", daemon=True).start()
+
+    def _read(self, sock: socket.socket):
+        try:
+            while True:
+                request_id, ok, result = _recv(sock)
+                self._loop.call_soon_threadsafe(self._resolve, request_id, ok, result)
+        except (ConnectionError, OSError):
+            try:
+                self._loop.call_soon_threadsafe(self._fail_all, sock)
+            except RuntimeError:
+                pass  # Loop already closed at shutdown
+
+    def _resolve(self, request_id: int, ok: bool, result):
+        future = self._pending.pop(request_id, None)
+        if future is None or future.done():
+            return  # The caller gave up on it
+        if ok:
+            future.set_result(result)
+        else:
+            future.set_exception(RuntimeError(f"shard {self.shard}: {result}"))
+
+    def _fail_all(self, sock: socket.socket):
+        if self._sock is not sock:
+            return  # A restarted worker has a new socket
+        self._sock = None
+        pending, self._pending = self._pending, {}
+        for future in pending.values():
+            if not future.done():
+                future.set_exception(ConnectionError(f"shard {self.shard} exited"))
+
+    def _write(self, message):
+        with self._send_lock:
+            _send(self._sock, message)
+
+    async def call(self, op: str, *args, timeout: Optional[float] = None):
+        if not self.alive:
+            raise ConnectionError(f"shard {self.shard} is not running")
+        request_id = next(self._ids)
+        future = self._loop.create_future()
+        self._pending[request_id] = future
+        try:
+            await asyncio.to_thread(self._write, (request_id, op, args))
+            # On timeout the worker still finishes the request; its late reply is dropped
+            return await asyncio.wait_for(future, timeout)
+        finally:
+            self._pending.pop(request_id, None)
+
+    def stop(self):
+        sock = self._sock
+        if sock is not None:
+            self._fail_all(sock)
+            try:
+                sock.shutdown(socket.SHUT_RDWR)
+            except OSError:
+                pass
+            sock.close()
+        if self.process is not None and self.process.poll() is None:
+            self.process.terminate()
+            try:
+                self.process.wait(timeout=5)
+            except subprocess.TimeoutExpired:
+                self.process.kill()
+
+
+class ShardedIndex:
+    """Scatter-gather search over shard processes, each owning part of the catalog.
+
+    Every shard builds its own FAISS index for its rows from the
+    memory-mapped float32 vector store. ``load`` takes a per-row shard
+    assignment (see ``assign_shards``), starting or stopping processes to
+    match its shard count; ``upsert`` sends single edited or appended
+    rows to their shard without re-placing the rest. ``search``
+    mirrors ``index.search`` over catalog rows. Shards with no rows under
+    the filter mask are skipped. Shards that miss ``timeout`` are left
+    out of that answer instead of holding it up.
+    """
+
+    def __init__(self, vector_path: Path, dim: int, qtype: Optional[int], rerank_candidates: int, timeout: float):
+        self.vector_path = Path(vector_path)
+        self.dim = dim
+        self.qtype = qtype
+        self.rerank_candidates = rerank_candidates
+        self.timeout = timeout
+        self.clients: List[ShardClient] = []
+        self.assignment: Optional[np.ndarray] = None
+        self.partial_answers = 0
+        self._restarts: Dict[int, asyncio.Task] = {}
+
+    def __len__(self) -> int:
+        return len(self.clients)
+
+    async def _load_client(self, client: ShardClient):
+        if not client.alive:
+            client.start()
+        return await client.call(
+            "load", str(self.vector_path), self.dim, client.rows, self.qtype, self.rerank_candidates
+        )
+
+    async def load(self, assignment: np.ndarray, shards: int) -> int:
+        """(Re)build every shard for the assignment; returns how many rows changed shard"""
+        assignment = np.asarray(assignment, dtype=np.int32)
+        moved = len(assignment)
+        if self.assignment is not None:
+            common = min(len(assignment), len(self.assignment))
+            moved = int(np.count_nonzero(assignment[:common] != self.assignment[:common])) + len(assignment) - common
+
+        while len(self.clients) > shards:
+            self.clients.pop().stop()
+        while len(self.clients) < shards:
+            self.clients.append(ShardClient(len(self.clients)))
+        order = np.argsort(assignment, kind="stable")
+        bounds = np.searchsorted(assignment[order], np.arange(shards + 1))
+        for shard, client in enumerate(self.clients):
+            client.rows = np.sort(order[bounds[shard]:bounds[shard + 1]]).astype(np.int64)
+
+        reports = await asyncio.gather(*(self._load_client(client) for client in self.clients))
+        self.assignment = assignment
+        for client, report in zip(self.clients, reports):
+            print(f"🧩 Shard {client.shard}: {report['rows']} rows loaded in {report['seconds']}s (pid {client.process.pid})")
+        return moved
+
+    async def upsert(self, rows: np.ndarray, shards: np.ndarray, vectors: np.ndarray):
+        """Send changed or appended catalog rows to their shards without re-placing the rest.
+
+        ``shards`` is each row's shard from ``assign_shards``; a row whose
+        shard changed is removed from its old one first. Client ``rows``
+        mirror the order the workers keep, so filter bitmaps still line up.
+        """
+        rows = np.asarray(rows, dtype=np.int64)
+        shards = np.asarray(shards, dtype=np.int32)
+        assignment = self.assignment if self.assignment is not None else np.zeros(0, dtype=np.int32)
+        if rows.max() >= len(assignment):
+            # Appended rows have no previous shard
+            assignment = np.concatenate([assignment, np.full(rows.max() + 1 - len(assignment), -1, dtype=np.int32)])
+
+        previous = assignment[rows]
+        for client in self.clients:
+            moved_away = rows[(previous == client.shard) & (shards != client.shard)]
+            if len(moved_away):
+                await client.call("remove", moved_away)
+                client.rows = client.rows[~np.isin(client.rows, moved_away)]
+        for client in self.clients:
+            mine = shards == client.shard
+            if not mine.any():
+                continue
+            await client.call("upsert", rows[mine], np.ascontiguousarray(vectors[mine], dtype=np.float32))
+            client.rows = np.concatenate([client.rows, rows[mine][~np.isin(rows[mine], client.rows)]])
+        assignment[rows] = shards
+        self.assignment = assignment
+
+    def _restart(self, client: ShardClient):
+        task = self._restarts.get(client.shard)
+        if task is not None and not task.done():
+            return
+
+        async def restart():
+            print(f"⚠️  Shard {client.shard} is down, restarting")
+            client.stop()
+            try:
+                await self._load_client(client)
+            except Exception as e:
+                print(f"❌ Could not restart shard {client.shard}: {e}")
+
+        self._restarts[client.shard] = asyncio.create_task(restart())
+
+    async def _query(self, client: ShardClient, queries: np.ndarray, k: int, bitmap: Optional[np.ndarray]):
+        with SHARD_SECONDS.time(client.label):
+            return await client.call("search", queries, k, bitmap, timeout=self.timeout)
+
+    async def search(self, queries: np.ndarray, k: int, mask: Optional[np.ndarray] = None) -> Tuple[np.ndarray, np.ndarray]:
+        """Fan the queries out to every shard and merge the per-shard top-k lists"""
+        calls = {}
+        for client in self.clients:
+            if not len(client.rows):
+                continue
+            bitmap = None
+            if mask is not None:
+                rows = client.rows[client.rows < len(mask)]
+                local = np.zeros(len(client.rows), dtype=bool)
+                local[:len(rows)] = mask[rows]
+                if not local.any():
+                    continue  # Nothing on this shard passes the filter
+                bitmap = np.packbits(local, bitorder="little")
+            calls[client] = asyncio.ensure_future(self._query(client, queries, min(k, len(client.rows)), bitmap))
+
+        answers = []
+        for client, call in calls.items():
+            try:
+                answers.append(await call)
+                SHARD_QUERIES.inc(client.label, "ok")
+            except asyncio.TimeoutError:
+                SHARD_QUERIES.inc(client.label, "timeout")
+            except Exception as e:
+                SHARD_QUERIES.inc(client.label, "error")
+                print(f"Warning: Shard {client.shard} search failed: {e}")
+                if not client.alive:
+                    self._restart(client)
+        if calls and not answers:
+            raise RuntimeError("No shard answered in time")
+        if len(answers) < len(calls):
+            self.partial_answers += 1
+
+        similarities = np.full((len(queries), k), -np.inf, dtype=np.float32)
+        indices = np.full((len(queries), k), -1, dtype=np.int64)
+        for row in range(len(queries)):
+            # Each shard's list is already sorted, so merging is a k-way heap merge
+            merged = heapq.merge(
+                *(zip(shard_similarities[row], shard_indices[row]) for shard_similarities, shard_indices in answers),
+                key=lambda hit: -hit[0]
+            )
+            for column, (similarity, idx) in enumerate(hit for hit in merged if hit[1] >= 0):
+                if column >= k:
+                    break
+                similarities[row, column] = similarity
+                indices[row, column] = idx
+        return similarities, indices
+
+    def snapshot(self) -> Dict[str, Any]:
+        return {
+            "shards": len(self.clients),
+            "rows": [len(client.rows) for client in self.clients],
+            "alive": [client.alive for client in self.clients],
+            "timeout_ms": round(self.timeout * 1000),
+            "partial_answers": self.partial_answers,
+        }
+
+    def close(self):
+        for client in self.clients:
+            client.stop()
+        self.clients = []
+        self.assignment = None
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Shard worker process (started by ShardedIndex)")
+    parser.add_argument("--fd", type=int, required=True)
+    serve_shard(parser.parse_args().fd)
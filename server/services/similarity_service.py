@@ -3,14 +3,36 @@ import numpy as np
 import faiss
 from PIL import Image
 import torch
-from typing import List, Optional
+from typing import Dict, List, Optional, Tuple, Union
 from pathlib import Path
 
-from models.product import SimilarityResult, Product
+from models.product import SimilarityResult, Product, ProductFilter
 from services.product_service import ProductService
+from services.catalog_store import CatalogStore
+from services.vector_store import VectorStore
+from services.neighbor_graph import NeighborGraph
+from services.sharded_index import ShardedIndex, assign_shards, overwrite_codes
+from services.metrics import metrics, STAGE_SECONDS
+
+FALLBACKS = metrics.counter(
+    "vpm_similarity_fallback_total", "Similarity queries answered by a fallback path", ("path",)
+)
+NEIGHBOR_LOOKUPS = metrics.counter(
+    "vpm_neighbor_graph_lookups_total", "Product-to-product lookups by neighbour graph outcome", ("result",)
+)
+
+# Supported INDEX_SHARD_BY values: rendezvous-hash rows by product id or by category
+SHARD_KEYS = ("id", "category")
+
+# Supported INDEX_QUANTIZATION values mapped to FAISS scalar quantizer types
+QUANTIZATION_TYPES = {
+    "none": None,
+    "fp16": faiss.ScalarQuantizer.QT_fp16,
+    "sq8": faiss.ScalarQuantizer.QT_8bit,
+}
 
 class SimilarityService:
-    def __init__(self):
+    def __init__(self, data_dir: Path = Path("data"), sample_data: bool = True):
         # Use lightweight sentence transformer for memory-constrained deployments
         default_model = "sentence-transformers/paraphrase-MiniLM-L6-v2"
         
@@ -26,6 +48,37 @@ class SimilarityService:
         self.embedding_dim = 384  # MiniLM embedding dimension
         self.use_lightweight_mode = os.getenv("LIGHTWEIGHT_MODE", "true").lower() == "true"  # Default to true
         
+        # Index storage: "none" keeps full float32, "fp16"/"sq8" scalar-quantize the catalog
+        self.index_quantization = os.getenv("INDEX_QUANTIZATION", "none").lower()
+        if self.index_quantization not in QUANTIZATION_TYPES:
+            print(f"⚠️  Unknown INDEX_QUANTIZATION '{self.index_quantization}', using full float32")
+            self.index_quantization = "none"
+        # Number of quantized candidates to re-score exactly against the float32 store (0 = off)
+        self.rerank_candidates = int(os.getenv("INDEX_RERANK_CANDIDATES", "0"))
+        
+        self.data_dir = Path(data_dir)
+        # Passed to ProductService; without it a missing or malformed products.json fails initialize()
+        self.sample_data = sample_data
+        self.index_path = self.data_dir / "faiss_index.bin"
+        self.vector_store = VectorStore(self.data_dir / "embeddings.f32", self.embedding_dim)
+        # Memory-map the saved index instead of reading it into RAM (see attach_catalog)
+        self.mmap_index = False
+        self.index_mmapped = False
+        # Set once the "store out of sync, not re-ranking" warning has been logged
+        self._rerank_warned = False
+        
+        # Precomputed top-K neighbours per catalog position (see precompute_neighbors)
+        self.neighbor_graph = NeighborGraph(self.data_dir / "neighbor_graph")
+        
+        # Scatter-gather search over INDEX_SHARDS worker processes (0 or 1 = search in-process)
+        self.shard_count = int(os.getenv("INDEX_SHARDS", "0"))
+        self.shard_by = os.getenv("INDEX_SHARD_BY", "id").lower()
+        if self.shard_by not in SHARD_KEYS:
+            print(f"⚠️  Unknown INDEX_SHARD_BY '{self.shard_by}', sharding by product id")
+            self.shard_by = "id"
+        self.shard_timeout = float(os.getenv("INDEX_SHARD_TIMEOUT_MS", "1000")) / 1000
+        self.shards: Optional[ShardedIndex] = None
+        
     async def initialize(self):
         """Initialize the lightweight sentence transformer model"""
         print(f"🔄 Loading lightweight model: {self.model_name}")
@@ -33,7 +86,7 @@ class SimilarityService:
         
         try:
             # Initialize product service first
-            self.product_service = ProductService()
+            self.product_service = ProductService(self.data_dir, sample_data=self.sample_data)
             await self.product_service.initialize()
             print("✅ Product service initialized")
             
@@ -63,74 +116,297 @@ class SimilarityService:
             
         except Exception as e:
             print(f"❌ Error initializing similarity service: {e}")
+            if not self.sample_data:
+                raise
             print(f"📝 Model name used: {self.model_name}")
             print("⚠️  Falling back to basic text-based similarity matching")
             # Ensure product service is still available for fallback results
             if not self.product_service:
-                self.product_service = ProductService()
+                self.product_service = ProductService(self.data_dir)
                 await self.product_service.initialize()
             self.model = None
             self.index = None
     
+    async def attach_catalog(self, product_service: ProductService, model):
+        """Serve another catalog with a model that is already loaded.
+
+        Used by CatalogRegistry: the saved index is memory-mapped where the
+        FAISS build supports it, and searched in-process without shards.
+        """
+        self.product_service = product_service
+        self.model = model
+        self.mmap_index = True
+        self.shard_count = 0
+        await self._initialize_faiss_index()
+    
+    @property
+    def index_nbytes(self) -> int:
+        """Bytes of index codes held in RAM; a memory-mapped index counts as none"""
+        if self.index is None or self.index_mmapped:
+            return 0
+        return self.index.ntotal * getattr(self.index, "code_size", self.embedding_dim * 4)
+    
+    def _read_index(self):
+        """Read the saved index; returns it and whether it is memory-mapped"""
+        mmap_flag = getattr(faiss, "IO_FLAG_MMAP_IFC", None)  # Not in older FAISS builds
+        if self.mmap_index and mmap_flag is not None:
+            return faiss.read_index(str(self.index_path), mmap_flag), True
+        return faiss.read_index(str(self.index_path)), False
+    
+    def _create_index(self):
+        """Create an empty index using the configured storage type"""
+        qtype = QUANTIZATION_TYPES[self.index_quantization]
+        if qtype is None:
+            return faiss.IndexFlatIP(self.embedding_dim)  # Inner product for cosine similarity
+        return faiss.IndexScalarQuantizer(self.embedding_dim, qtype, faiss.METRIC_INNER_PRODUCT)
+    
+    def _index_matches_config(self, index) -> bool:
+        """Check whether a loaded index uses the configured storage type"""
+        qtype = QUANTIZATION_TYPES[self.index_quantization]
+        if qtype is None:
+            return isinstance(index, faiss.IndexFlat)
+        return isinstance(index, faiss.IndexScalarQuantizer) and index.sq.qtype == qtype
+    
+    def _build_index(self, embeddings_array: np.ndarray):
+        """Build the configured index over normalized embeddings and save it"""
+        index = self._create_index()
+        if not index.is_trained:
+            index.train(embeddings_array)
+        index.add(embeddings_array)
+        
+        self._write_index(index)
+        # Swap in the finished index in one assignment so concurrent searches never see a partial one
+        self.index_mmapped = False
+        self.index = index
+    
+    def _writable_index(self):
+        """The index, copied into memory first if it is memory-mapped (mapped codes are read-only)"""
+        if self.index_mmapped:
+            self.index = faiss.deserialize_index(faiss.serialize_index(self.index))
+            self.index_mmapped = False
+        return self.index
+    
+    def _write_index(self, index):
+        """Save the index through a per-process temp file so readers and other workers never see a partial one"""
+        self.index_path.parent.mkdir(parents=True, exist_ok=True)
+        tmp_path = self.index_path.with_suffix(f"{self.index_path.suffix}.{os.getpid()}.tmp")
+        faiss.write_index(index, str(tmp_path))
+        os.replace(tmp_path, self.index_path)
+    
     async def _initialize_faiss_index(self):
         """Initialize FAISS index with text-based product embeddings"""
-        index_path = Path("data/faiss_index.bin")
-        
-        if index_path.exists():
+        if self.index_path.exists():
             # Load existing index
-            self.index = faiss.read_index(str(index_path))
-            print("📂 Loaded existing FAISS index")
-        else:
-            # Create new index
-            self.index = faiss.IndexFlatIP(self.embedding_dim)  # Inner product for cosine similarity
+            index, mmapped = self._read_index()
+            if self._index_matches_config(index):
+                self.index_mmapped = mmapped
+                self.index = index
+                print("📂 Loaded existing FAISS index")
+                return
             
-            # Get all products and compute text embeddings
-            products = await self.product_service.get_all_products()
+            # Storage type changed; rebuild from the float32 store when we can
+            vectors = self.vector_store.vectors()
+            if vectors is not None and len(vectors) == index.ntotal:
+                print(f"🔄 Rebuilding FAISS index as '{self.index_quantization}' from stored embeddings")
+                self._build_index(np.array(vectors, dtype=np.float32))
+                return
+            print(f"🔄 Existing FAISS index does not match '{self.index_quantization}', recomputing")
+        
+        # Get all products and compute text embeddings
+        products = await self.product_service.get_all_products()
+        if not (products and self.model):
+            self.index_mmapped = False
+            self.index = self._create_index()
+        
+        if products and self.model:
+            self.build_index_files(products)
+    
+    def build_index_files(self, products: CatalogStore):
+        """Embed the catalog and save the vector store and index.
+
+        Blocking; CatalogRegistry runs it on a worker thread for catalogs
+        that have no index yet.
+        """
+        print(f"🔄 Computing text embeddings for {len(products)} products...")
+        
+        # Create text representation of each product and encode them in one batch
+        product_texts = [
+            f"{product.name} {product.description} {' '.join(product.tags)} {product.category}"
+            for product in products
+        ]
+        embeddings_array = np.asarray(
+            self.model.encode(product_texts, convert_to_numpy=True),
+            dtype=np.float32
+        ).reshape(-1, self.embedding_dim)
+        
+        if len(embeddings_array):
+            # Normalize embeddings for cosine similarity
+            faiss.normalize_L2(embeddings_array)
             
-            if products and self.model:
-                print(f"🔄 Computing text embeddings for {len(products)} products...")
-                embeddings = []
-                
-                for product in products:
-                    # Create text representation of product
-                    product_text = f"{product.name} {product.description} {' '.join(product.tags)} {product.category}"
-                    
-                    # Compute text embedding using sentence transformer
-                    embedding = self.model.encode(product_text, convert_to_numpy=True)
-                    embeddings.append(embedding)
-                    
-                    # Update product with embedding
-                    product.embedding = embedding.tolist()
-                    await self.product_service.update_product(product)
-                
-                if embeddings:
-                    # Normalize embeddings for cosine similarity
-                    embeddings_array = np.array(embeddings, dtype=np.float32)
-                    faiss.normalize_L2(embeddings_array)
-                    
-                    # Add to index
-                    self.index.add(embeddings_array)
-                    
-                    # Save index
-                    index_path.parent.mkdir(exist_ok=True)
-                    faiss.write_index(self.index, str(index_path))
-                    
-                    print("✅ FAISS index created and saved")
+            # Keep the exact vectors on disk rather than on every Product
+            self.vector_store.write(embeddings_array)
+            self._build_index(embeddings_array)
+            
+            print(f"✅ FAISS index created and saved ({self.index_quantization})")
+    
+    def _search(self, query_embeddings: np.ndarray, k: int, mask: Optional[np.ndarray] = None):
+        """Search the index, re-ranking quantized candidates against exact vectors.
+        
+        With a row mask only matching rows are scored, so a filtered query
+        still gets a full top-k instead of whatever survives post-filtering.
+        """
+        with STAGE_SECONDS.time("similarity.search"):
+            return self._search_index(query_embeddings, k, mask)
+    
+    def _search_params(self, mask: Optional[np.ndarray]):
+        """FAISS search parameters restricting the search to rows where mask is set"""
+        if mask is None:
+            return None, None
+        ntotal = self.index.ntotal
+        if len(mask) != ntotal:
+            mask = np.resize(mask, ntotal) if len(mask) > ntotal else np.concatenate(
+                [mask, np.zeros(ntotal - len(mask), dtype=bool)]
+            )
+        bitmap = np.packbits(mask, bitorder="little")
+        # The selector only points at the bitmap; the caller keeps it alive for the search
+        selector = faiss.IDSelectorBitmap(ntotal, faiss.swig_ptr(bitmap))
+        return faiss.SearchParameters(sel=selector), bitmap
+    
+    def _search_index(self, query_embeddings: np.ndarray, k: int, mask: Optional[np.ndarray] = None):
+        params, bitmap = self._search_params(mask)
+        rerank = self.index_quantization != "none" and self.rerank_candidates > 0 and self._store_matches_index()
+        if not rerank:
+            return self.index.search(query_embeddings, k, params=params)
+        
+        candidates = min(max(k, self.rerank_candidates), self.index.ntotal)
+        _, candidate_ids = self.index.search(query_embeddings, candidates, params=params)
+        
+        similarities = np.full((len(query_embeddings), k), -np.inf, dtype=np.float32)
+        indices = np.full((len(query_embeddings), k), -1, dtype=np.int64)
+        for row, (query, ids) in enumerate(zip(query_embeddings, candidate_ids)):
+            ids = ids[ids >= 0]
+            if not len(ids):
+                continue
+            exact = self.vector_store.get(ids) @ query
+            order = np.argsort(-exact)[:k]
+            similarities[row, :len(order)] = exact[order]
+            indices[row, :len(order)] = ids[order]
+        return similarities, indices
+    
+    def _store_matches_index(self) -> bool:
+        """Whether every index row has its exact vector in the store, as re-ranking needs"""
+        if len(self.vector_store) == self.index.ntotal:
+            return True
+        if not self._rerank_warned:
+            self._rerank_warned = True
+            print(f"⚠️  {self.vector_store.path} has {len(self.vector_store)} rows for {self.index.ntotal} indexed; "
+                  f"returning quantized scores without re-ranking until the index is rebuilt")
+        return False
+    
+    async def load_shards(self) -> int:
+        """Start or refresh the shard processes for the current index; returns rows that changed shard.
+
+        Shard clients belong to the running event loop, so this is called from
+        each worker's lifespan rather than from initialize(), which serve.py
+        runs before forking.
+        """
+        if self.shard_count < 2 or self.index is None:
+            self.close_shards()
+            return 0
+        products = await self.product_service.get_all_products()
+        ntotal = self.index.ntotal
+        if len(self.vector_store) != ntotal or len(products) != ntotal:
+            print("⚠️  Index sharding needs the vector store and catalog to match the index; searching in-process")
+            self.close_shards()
+            return 0
+        
+        if self.shard_by == "category":
+            keys = np.array(products.categories.vocab, dtype=object)[products.categories.codes]
+        else:
+            keys = [products.ids.get(i) for i in range(ntotal)]
+        if self.shards is None:
+            self.shards = ShardedIndex(
+                self.vector_store.path, self.embedding_dim, QUANTIZATION_TYPES[self.index_quantization],
+                self.rerank_candidates, self.shard_timeout
+            )
+        try:
+            moved = await self.shards.load(assign_shards(keys, self.shard_count), self.shard_count)
+        except Exception as e:
+            print(f"❌ Could not start index shards, searching in-process: {e}")
+            self.close_shards()
+            return 0
+        print(f"✅ Index split across {len(self.shards)} shard processes by {self.shard_by} ({moved} rows placed)")
+        return moved
+    
+    async def _update_shard_row(self, position: int, product: Product):
+        """Push one changed or appended row to its shard process; re-place the catalog only if that fails"""
+        if self.shards is None:
+            return
+        if len(self.vector_store) != self.index.ntotal:
+            await self.load_shards()  # Out of sync; searches in-process until rebuilt
+            return
+        rows = np.array([position], dtype=np.int64)
+        key = product.category if self.shard_by == "category" else product.id
+        try:
+            await self.shards.upsert(rows, assign_shards([key], self.shard_count), self.vector_store.get(rows))
+        except Exception as e:
+            print(f"⚠️  Could not update index shards in place, reloading them: {e}")
+            await self.load_shards()
+    
+    async def reshard(self, shard_count: int) -> int:
+        """Change the number of shard processes; returns rows that moved to a different shard"""
+        self.shard_count = shard_count
+        return await self.load_shards()
+    
+    def close_shards(self):
+        if self.shards is not None:
+            self.shards.close()
+            self.shards = None
+    
+    async def _search_any(self, query_embeddings: np.ndarray, k: int, mask: Optional[np.ndarray] = None):
+        """Search through the shard processes when running, else the in-process index"""
+        if self.shards is not None:
+            try:
+                with STAGE_SECONDS.time("similarity.search"):
+                    return await self.shards.search(query_embeddings, k, mask)
+            except RuntimeError as e:
+                print(f"Warning: Sharded search failed, searching in-process: {e}")
+        return self._search(query_embeddings, k, mask)
+    
+    async def reload(self, start_shards: bool = True):
+        """Re-read the catalog and index from disk, swapping them in place.
+
+        serve.py's parent passes ``start_shards=False``: shard clients are
+        tied to the calling event loop, so only workers may own them.
+        """
+        await self.product_service.reload()
+        self.neighbor_graph = NeighborGraph(self.neighbor_graph.path)
+        if self.model:
+            self.vector_store.close()
+            await self._initialize_faiss_index()
+            if start_shards:
+                await self.load_shards()
+        if not start_shards:
+            self.close_shards()
+        print(f"🔄 Similarity service reloaded ({self.index.ntotal if self.index else 0} vectors)")
+    
+    def _query_text_from_image(self, image_path_or_url: str) -> str:
+        """Extract meaningful text from an image path/URL"""
+        filename = os.path.basename(image_path_or_url).lower()
+        
+        # Remove file extensions and clean up
+        text = filename.replace('.jpg', '').replace('.png', '').replace('.jpeg', '').replace('.webp', '')
+        return text.replace('_', ' ').replace('-', ' ').replace('.', ' ')
     
     async def _compute_text_embedding_from_image(self, image_path_or_url: str) -> np.ndarray:
         """Extract text features from image filename and compute embedding"""
         try:
-            # Extract meaningful text from image path/URL
-            import os
-            filename = os.path.basename(image_path_or_url).lower()
-            
-            # Remove file extensions and clean up
-            text = filename.replace('.jpg', '').replace('.png', '').replace('.jpeg', '').replace('.webp', '')
-            text = text.replace('_', ' ').replace('-', ' ').replace('.', ' ')
+            text = self._query_text_from_image(image_path_or_url)
             
             # If we have a sentence transformer model, use it
             if self.model and hasattr(self.model, 'encode'):
-                embedding = self.model.encode(text, convert_to_numpy=True)
+                with STAGE_SECONDS.time("similarity.encode"):
+                    embedding = self.model.encode(text, convert_to_numpy=True)
                 return embedding.astype(np.float32)
             else:
                 # Fallback to zero embedding
@@ -141,12 +417,144 @@ class SimilarityService:
             # Return zero embedding as fallback
             return np.zeros(self.embedding_dim, dtype=np.float32)
     
+    async def compute_query_embeddings(self, image_paths: List[str]) -> np.ndarray:
+        """Compute embeddings for many query images in one model call"""
+        if not image_paths:
+            return np.zeros((0, self.embedding_dim), dtype=np.float32)
+        if not (self.model and hasattr(self.model, 'encode')):
+            return np.zeros((len(image_paths), self.embedding_dim), dtype=np.float32)
+        
+        texts = [self._query_text_from_image(path) for path in image_paths]
+        with STAGE_SECONDS.time("similarity.encode"):
+            embeddings = self.model.encode(texts, convert_to_numpy=True)
+        return np.asarray(embeddings, dtype=np.float32).reshape(len(image_paths), self.embedding_dim)
+    
+    def _select_hits(
+        self,
+        similarities: np.ndarray,
+        indices: np.ndarray,
+        catalog_size: int,
+        min_similarity: float,
+        max_results: int,
+        mask: Optional[np.ndarray] = None
+    ) -> List[Tuple[int, float]]:
+        """Pick the (row, score) pairs of one row of index hits that pass the filters"""
+        hits = []
+        for similarity, idx in zip(similarities, indices):
+            if idx == -1:  # Invalid index
+                continue
+                
+            if similarity < min_similarity:
+                continue
+            
+            if idx >= catalog_size:
+                continue
+                
+            # Hits from the neighbour graph are not pre-filtered
+            if mask is not None and not mask[idx]:
+                continue
+            
+            hits.append((int(idx), float(similarity)))
+            
+            if len(hits) >= max_results:
+                break
+        
+        return hits
+    
+    def _collect_results(
+        self,
+        similarities: np.ndarray,
+        indices: np.ndarray,
+        products: CatalogStore,
+        min_similarity: float,
+        max_results: int,
+        mask: Optional[np.ndarray] = None
+    ) -> List[SimilarityResult]:
+        """Turn one row of index hits into filtered similarity results"""
+        return [
+            SimilarityResult(product=products[idx].to_product(), similarity_score=similarity)
+            for idx, similarity in self._select_hits(
+                similarities, indices, len(products), min_similarity, max_results, mask
+            )
+        ]
+    
+    async def _search_rows(
+        self,
+        query_embeddings: np.ndarray,
+        max_results: int,
+        filters: Optional[ProductFilter] = None
+    ) -> Tuple[np.ndarray, np.ndarray, CatalogStore, Optional[np.ndarray]]:
+        """Normalize and search a matrix of query embeddings; rows are not hydrated"""
+        # Normalize for cosine similarity
+        query_embeddings = np.ascontiguousarray(query_embeddings, dtype=np.float32).reshape(-1, self.embedding_dim)
+        faiss.normalize_L2(query_embeddings)
+        
+        products = await self.product_service.get_all_products()
+        mask = products.filter_mask(filters)
+        if mask is None:
+            k = min(max_results * 2, self.index.ntotal)  # Get more results to filter
+        else:
+            k = min(max_results, int(np.count_nonzero(mask)), self.index.ntotal)
+        if k == 0:
+            empty = np.zeros((len(query_embeddings), 0))
+            return empty, empty.astype(np.int64), products, mask
+        
+        # Search in FAISS index
+        similarities, indices = await self._search_any(query_embeddings, k, mask)
+        return similarities, indices, products, mask
+    
+    async def _search_embeddings(
+        self,
+        query_embeddings: np.ndarray,
+        min_similarity: float,
+        max_results: int,
+        filters: Optional[ProductFilter] = None
+    ) -> List[List[SimilarityResult]]:
+        """Run one batched index search for a matrix of query embeddings"""
+        similarities, indices, products, mask = await self._search_rows(query_embeddings, max_results, filters)
+        
+        # Get products
+        with STAGE_SECONDS.time("similarity.hydrate"):
+            return [
+                self._collect_results(row_similarities, row_indices, products, min_similarity, max_results, mask)
+                for row_similarities, row_indices in zip(similarities, indices)
+            ]
+    
+    async def search_vectors(
+        self,
+        query_embeddings: np.ndarray,
+        min_similarity: float = 0.0,
+        max_results: int = 20,
+        filters: Optional[ProductFilter] = None,
+        hydrate: bool = False
+    ) -> List[Dict[str, list]]:
+        """Search precomputed query embeddings, returning ids and scores per query.
+        
+        With hydrate the matching products are included as well.
+        """
+        similarities, indices, products, mask = await self._search_rows(query_embeddings, max_results, filters)
+        
+        with STAGE_SECONDS.time("similarity.hydrate"):
+            results = []
+            for row_similarities, row_indices in zip(similarities, indices):
+                hits = self._select_hits(
+                    row_similarities, row_indices, len(products), min_similarity, max_results, mask
+                )
+                result = {
+                    "ids": [products.ids.get(idx) for idx, _ in hits],
+                    "scores": [round(similarity, 6) for _, similarity in hits],
+                }
+                if hydrate:
+                    result["products"] = [products[idx].to_product() for idx, _ in hits]
+                results.append(result)
+            return results
+    
     async def find_similar_products(
         self,
         query_image_path: str,
         min_similarity: float = 0.0,
         max_results: int = 20,
-        category_filter: Optional[str] = None
+        filters: Optional[ProductFilter] = None
     ) -> List[SimilarityResult]:
         """Find similar products using lightweight text-based embeddings"""
         try:
@@ -157,65 +565,164 @@ class SimilarityService:
                 # Extract text from query image filename and compute embedding
                 query_embedding = await self._compute_text_embedding_from_image(query_image_path)
                 
-                # Normalize for cosine similarity
-                query_embedding = query_embedding.reshape(1, -1).astype(np.float32)
-                faiss.normalize_L2(query_embedding)
-                
-                # Search in FAISS index
-                k = min(max_results * 2, self.index.ntotal)  # Get more results to filter
-                similarities, indices = self.index.search(query_embedding, k)
-                
-                # Get products
-                products = await self.product_service.get_all_products()
-                
-                results = []
-                for i, (similarity, idx) in enumerate(zip(similarities[0], indices[0])):
-                    if idx == -1:  # Invalid index
-                        continue
-                        
-                    if similarity < min_similarity:
-                        continue
-                    
-                    if idx >= len(products):
-                        continue
-                        
-                    product = products[idx]
-                    
-                    # Apply category filter
-                    if category_filter and product.category.lower() != category_filter.lower():
-                        continue
-                    
-                    results.append(SimilarityResult(
-                        product=product,
-                        similarity_score=float(similarity)
-                    ))
-                    
-                    if len(results) >= max_results:
-                        break
-                
-                return results
+                results = await self._search_embeddings(
+                    query_embedding, min_similarity, max_results, filters
+                )
+                return results[0]
             else:
                 # Fallback to basic text matching
                 print("📊 Using basic text-based similarity matching")
-                return await self._get_text_based_results(query_image_path, max_results, category_filter)
+                return await self._get_text_based_results(query_image_path, max_results, filters)
             
         except Exception as e:
             print(f"Error finding similar products: {e}")
-            return await self._get_text_based_results(query_image_path, max_results, category_filter)
+            return await self._get_text_based_results(query_image_path, max_results, filters)
     
-    async def _get_mock_results(self, max_results: int = 20, category_filter: Optional[str] = None) -> List[SimilarityResult]:
+    async def find_similar_products_batch(
+        self,
+        queries: List[Union[str, np.ndarray]],
+        min_similarity: float = 0.0,
+        max_results: int = 20,
+        filters: Optional[ProductFilter] = None
+    ) -> List[List[SimilarityResult]]:
+        """Find similar products for many queries with a single index search.
+        
+        Each query is either an image path (embedded like find_similar_products)
+        or a precomputed embedding vector. Results are returned in query order.
+        """
+        if not (self.use_lightweight_mode and self.model and self.index):
+            # Precomputed vectors have nothing to fall back on without an index
+            return [
+                await self._get_text_based_results(query, max_results, filters)
+                if isinstance(query, str) else []
+                for query in queries
+            ]
+        
+        path_positions = [i for i, query in enumerate(queries) if isinstance(query, str)]
+        query_embeddings = np.zeros((len(queries), self.embedding_dim), dtype=np.float32)
+        if path_positions:
+            query_embeddings[path_positions] = await self.compute_query_embeddings(
+                [queries[i] for i in path_positions]
+            )
+        for i, query in enumerate(queries):
+            if not isinstance(query, str):
+                query_embeddings[i] = np.asarray(query, dtype=np.float32).reshape(self.embedding_dim)
+        
+        return await self._search_embeddings(query_embeddings, min_similarity, max_results, filters)
+    
+    def get_product_embedding(self, position: int) -> Optional[np.ndarray]:
+        """Return a catalog product's normalized vector without re-encoding it"""
+        if self.index is None or not 0 <= position < self.index.ntotal:
+            return None
+        if len(self.vector_store) == self.index.ntotal:
+            return self.vector_store.get(np.array([position]))[0]
+        return self.index.reconstruct(int(position))
+    
+    def _all_vectors(self) -> np.ndarray:
+        """Return every indexed vector, preferring the exact float32 store"""
+        ntotal = self.index.ntotal if self.index is not None else 0
+        if ntotal and len(self.vector_store) == ntotal:
+            return self.vector_store.vectors()
+        if ntotal:
+            return self.index.reconstruct_n(0, ntotal)
+        return np.zeros((0, self.embedding_dim), dtype=np.float32)
+    
+    def _load_neighbors(self) -> bool:
+        """Load the neighbour graph if it matches the current index"""
+        return (
+            self.neighbor_graph.load() and self.index is not None
+            and len(self.neighbor_graph) == self.index.ntotal
+        )
+    
+    async def find_similar_to_product(
+        self,
+        product_id: str,
+        min_similarity: float = 0.0,
+        max_results: int = 20,
+        filters: Optional[ProductFilter] = None
+    ) -> Optional[List[SimilarityResult]]:
+        """Find products similar to an existing catalog product, or None if it is unknown"""
+        position = self.product_service.get_product_position(product_id)
+        if position is None:
+            return None
+        
+        products = await self.product_service.get_all_products()
+        mask = products.filter_mask(filters)
+        
+        # Serve from the precomputed table when it holds enough matches
+        if self._load_neighbors():
+            neighbor_ids, neighbor_scores = self.neighbor_graph.neighbors(position)
+            results = self._collect_results(
+                neighbor_scores, neighbor_ids, products, min_similarity, max_results, mask
+            )
+            if len(results) >= max_results or self.neighbor_graph.k >= len(products) - 1:
+                NEIGHBOR_LOOKUPS.inc("hit")
+                return results
+            NEIGHBOR_LOOKUPS.inc("short")
+        else:
+            NEIGHBOR_LOOKUPS.inc("missing")
+        
+        embedding = self.get_product_embedding(position)
+        if embedding is None:
+            # No index to search; fall back to the product's own text
+            query_text = products[position].name.replace('/', ' ')
+            return [
+                result for result in await self._get_text_based_results(query_text, max_results + 1, filters)
+                if result.product.id != product_id
+            ][:max_results]
+        
+        query_embedding = embedding.reshape(1, -1).astype(np.float32)
+        if mask is None:
+            # Ask for one extra hit since the product itself is the best match
+            k = min(max_results * 2 + 1, self.index.ntotal)
+        else:
+            # Leave the product itself out of the selector instead
+            mask = mask.copy()
+            mask[position] = False
+            k = min(max_results, int(np.count_nonzero(mask)), self.index.ntotal)
+            if k == 0:
+                return []
+        similarities, indices = await self._search_any(query_embedding, k, mask)
+        keep = indices[0] != position
+        return self._collect_results(
+            similarities[0][keep], indices[0][keep], products, min_similarity, max_results, mask
+        )
+    
+    def precompute_neighbors(self, k: int = 20, block_size: int = 1024, workers: Optional[int] = None) -> int:
+        """Build the exact top-k neighbour graph for the whole catalog and save it.
+        
+        Returns the number of rows in the graph.
+        """
+        graph = NeighborGraph(self.neighbor_graph.path, k)
+        graph.build(self._all_vectors(), block_size=block_size, workers=workers)
+        graph.save()
+        self.neighbor_graph = graph
+        return len(graph)
+    
+    def _refresh_neighbors(self, changed: List[int], previous_total: int):
+        """Incrementally update a saved neighbour graph after index rows changed"""
+        try:
+            if self.neighbor_graph.load() and len(self.neighbor_graph) == previous_total:
+                self.neighbor_graph.update(self._all_vectors(), changed)
+                self.neighbor_graph.save()
+        except Exception as e:
+            print(f"Error updating neighbour graph: {e}")
+    
+    async def _get_mock_results(self, max_results: int = 20, filters: Optional[ProductFilter] = None) -> List[SimilarityResult]:
         """Return mock similarity results for development"""
+        FALLBACKS.inc("mock")
         try:
             # Ensure product service is initialized
             if not self.product_service:
-                self.product_service = ProductService()
+                self.product_service = ProductService(self.data_dir)
                 await self.product_service.initialize()
             
             products = await self.product_service.get_all_products()
             
-            # Filter by category if specified
-            if category_filter:
-                products = [p for p in products if p.category.lower() == category_filter.lower()]
+            # Apply attribute filters if specified
+            mask = products.filter_mask(filters)
+            if mask is not None:
+                products = [products[int(i)] for i in np.flatnonzero(mask)]
             
             # Take first max_results products and assign mock similarity scores
             results = []
@@ -227,7 +734,7 @@ class SimilarityService:
                 similarity_score = max(0.1, min(0.99, base_score + random_factor))
                 
                 results.append(SimilarityResult(
-                    product=product,
+                    product=product.to_product(),
                     similarity_score=similarity_score
                 ))
             
@@ -236,19 +743,21 @@ class SimilarityService:
             print(f"Error generating mock results: {e}")
             return []
     
-    async def _get_text_based_results(self, query_image_path: str, max_results: int = 20, category_filter: Optional[str] = None) -> List[SimilarityResult]:
+    async def _get_text_based_results(self, query_image_path: str, max_results: int = 20, filters: Optional[ProductFilter] = None) -> List[SimilarityResult]:
         """Return text-based similarity results for lightweight deployment"""
+        FALLBACKS.inc("text_based")
         try:
             # Ensure product service is initialized
             if not self.product_service:
-                self.product_service = ProductService()
+                self.product_service = ProductService(self.data_dir)
                 await self.product_service.initialize()
             
             products = await self.product_service.get_all_products()
             
-            # Filter by category if specified
-            if category_filter:
-                products = [p for p in products if p.category.lower() == category_filter.lower()]
+            # Apply attribute filters if specified
+            mask = products.filter_mask(filters)
+            if mask is not None:
+                products = [products[int(i)] for i in np.flatnonzero(mask)]
             
             # Simple text-based similarity using product names and tags
             # Extract filename from query path for basic matching
@@ -256,7 +765,7 @@ class SimilarityService:
             query_filename = os.path.basename(query_image_path).lower()
             query_terms = query_filename.replace('.jpg', '').replace('.png', '').replace('.jpeg', '').replace('_', ' ').replace('-', ' ').split()
             
-            results = []
+            scored = []
             for product in products:
                 # Calculate text similarity score
                 score = 0.0
@@ -270,18 +779,18 @@ class SimilarityService:
                     # Default similarity for same category
                     score = 0.3
                 
-                results.append(SimilarityResult(
-                    product=product,
-                    similarity_score=score
-                ))
+                scored.append((score, product))
             
-            # Sort by similarity score and return top results
-            results.sort(key=lambda x: x.similarity_score, reverse=True)
-            return results[:max_results]
+            # Sort by similarity score and build results for the top ones only
+            scored.sort(key=lambda x: x[0], reverse=True)
+            return [
+                SimilarityResult(product=product.to_product(), similarity_score=score)
+                for score, product in scored[:max_results]
+            ]
             
         except Exception as e:
             print(f"Error generating text-based results: {e}")
-            return await self._get_mock_results(max_results, category_filter)
+            return await self._get_mock_results(max_results, filters)
     
     async def add_product_to_index(self, product: Product):
         """Add a new product to the FAISS index using text embeddings"""
@@ -291,30 +800,57 @@ class SimilarityService:
                 # Create text representation of product
                 product_text = f"{product.name} {product.description} {' '.join(product.tags)} {product.category}"
                 embedding = self.model.encode(product_text, convert_to_numpy=True)
-                product.embedding = embedding.tolist()
             else:
                 embedding = np.array(product.embedding, dtype=np.float32)
             
             # Normalize and add to index
-            embedding = embedding.reshape(1, -1)
+            embedding = embedding.reshape(1, -1).astype(np.float32)
             faiss.normalize_L2(embedding)
-            self.index.add(embedding)
+            previous_total = self.index.ntotal
+            if len(self.vector_store) == previous_total:
+                self.vector_store.append(embedding)
+            self._writable_index().add(embedding)
             
             # Save updated index
-            index_path = Path("data/faiss_index.bin")
-            index_path.parent.mkdir(exist_ok=True)
-            faiss.write_index(self.index, str(index_path))
+            self._write_index(self.index)
+            
+            self._refresh_neighbors([], previous_total)
+            await self._update_shard_row(previous_total, product)
             
         except Exception as e:
             print(f"Error adding product to index: {e}")
     
+    async def update_product_in_index(self, product: Product):
+        """Re-embed a changed catalog product and replace its index row"""
+        try:
+            position = self.product_service.get_product_position(product.id)
+            if position is None or not self.model or len(self.vector_store) != self.index.ntotal:
+                print(f"Cannot update product {product.id} in place; rebuild the index instead")
+                return
+            
+            product_text = f"{product.name} {product.description} {' '.join(product.tags)} {product.category}"
+            embedding = self.model.encode(product_text, convert_to_numpy=True).reshape(1, -1).astype(np.float32)
+            faiss.normalize_L2(embedding)
+            
+            # Re-encode just this row; retraining the quantizer over the catalog is for rebuild_index
+            self.vector_store.update(position, embedding)
+            overwrite_codes(self._writable_index(), [position], embedding)
+            self._write_index(self.index)
+            self._refresh_neighbors([position], self.index.ntotal)
+            await self._update_shard_row(position, product)
+            
+        except Exception as e:
+            print(f"Error updating product in index: {e}")
+    
     async def rebuild_index(self):
         """Rebuild the entire FAISS index"""
-        # Remove existing index
-        index_path = Path("data/faiss_index.bin")
-        if index_path.exists():
-            os.remove(index_path)
+        # Remove existing index, stored embeddings and the neighbour graph built from them
+        for path in (self.index_path, self.vector_store.path):
+            if path.exists():
+                os.remove(path)
+        self.vector_store.close()
+        self.neighbor_graph.clear()
         
         # Recreate index
-        self.index = faiss.IndexFlatIP(self.embedding_dim)
         await self._initialize_faiss_index()
+        await self.load_shards()
@@ -0,0 +1,51 @@
+from pathlib import Path
+from typing import BinaryIO, List, NamedTuple, Union
+from PIL import Image
+
+# Encoder settings per output format
+FORMAT_OPTIONS = {
+    "JPEG": {"quality": 85},
+    "WEBP": {"quality": 80, "method": 4},
+}
+
+FORMAT_EXTENSIONS = {"JPEG": "jpg", "WEBP": "webp"}
+
+
+class ThumbnailSpec(NamedTuple):
+    max_size: int  # Longest edge in pixels
+    format: str    # "JPEG" or "WEBP"
+    path: Path
+
+
+def render_thumbnails(source: Union[str, Path, BinaryIO], specs: List[ThumbnailSpec]) -> List[Path]:
+    """Decode an image once and write every requested thumbnail.
+
+    For JPEG sources the decoder is put in draft mode so DCT scaling hands
+    back an image only as large as the biggest thumbnail needs (up to 8x
+    smaller per side). Sizes are then produced largest first, each one
+    downscaled in place from the previous, using reduce() for the integer
+    part of the scale before the final LANCZOS pass.
+    """
+    if not specs:
+        return []
+    ordered = sorted(specs, key=lambda spec: spec.max_size, reverse=True)
+    largest = ordered[0].max_size
+
+    with Image.open(source) as img:
+        img.draft('RGB', (largest, largest))
+        frame = img if img.mode == 'RGB' else img.convert('RGB')
+
+        for spec in ordered:
+            frame.thumbnail((spec.max_size, spec.max_size), Image.Resampling.LANCZOS, reducing_gap=2.0)
+            frame.save(spec.path, spec.format, **FORMAT_OPTIONS[spec.format])
+    return [spec.path for spec in specs]
+
+
+def render_derivative(source: Union[str, Path, BinaryIO], width: int, height: int, image_format: str, path: Path) -> Path:
+    """Write one copy of the image fitted inside width x height (never upscaled)"""
+    with Image.open(source) as img:
+        img.draft('RGB', (width, height))
+        frame = img if img.mode == 'RGB' else img.convert('RGB')
+        frame.thumbnail((width, height), Image.Resampling.LANCZOS, reducing_gap=2.0)
+        frame.save(path, image_format, **FORMAT_OPTIONS[image_format])
+    return Path(path)
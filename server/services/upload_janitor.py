@@ -0,0 +1,175 @@
+import os
+import time
+import asyncio
+from collections import OrderedDict
+from pathlib import Path
+from typing import Dict, List, Optional, Tuple
+
+from fastapi.staticfiles import StaticFiles
+
+# A served file's mtime is refreshed at most this often; the in-memory order is updated every time
+TOUCH_PERSIST_SECONDS = 60.0
+
+
+class UploadJanitor:
+    """Age and total-size quotas for the uploads directory.
+
+    Files are kept in an index ordered by last access, least recent first.
+    It is filled by one directory walk at startup and then kept up to date
+    by ``track`` as uploads are stored and ``touch`` as they are served
+    (from /uploads and as /img sources), so each sweep only pops entries
+    off the front. A periodic rescan picks up files written by
+    other worker processes and drops ones they already deleted.
+    """
+
+    def __init__(
+        self,
+        root: Path,
+        max_age_seconds: float,
+        max_bytes: int,
+        interval: float = 60.0,
+        rescan_interval: float = 3600.0
+    ):
+        self.root = Path(root)
+        self.max_age_seconds = max_age_seconds
+        self.max_bytes = max_bytes
+        self.interval = interval
+        self.rescan_interval = rescan_interval
+
+        # relative path -> (size, last access), least recently accessed first
+        self.entries: "OrderedDict[str, Tuple[int, float]]" = OrderedDict()
+        self.total_bytes = 0
+        self.stats = {"sweeps": 0, "reclaimed_files": 0, "reclaimed_bytes": 0, "last_sweep_seconds": 0.0}
+        self._last_scan: Optional[float] = None
+
+    def _key(self, path: Path) -> str:
+        return str(Path(path).relative_to(self.root))
+
+    def _add(self, key: str, size: int, accessed: float):
+        old_size, _ = self.entries.pop(key, (0, 0.0))
+        self.total_bytes += size - old_size
+        self.entries[key] = (size, accessed)
+
+    def track(self, path: Path):
+        """Record a file that was just written or reused"""
+        try:
+            size = os.stat(path).st_size
+        except FileNotFoundError:
+            return
+        self._add(self._key(path), size, time.time())
+
+    def touch(self, path: Path):
+        """Mark a file as read now, persisting the time for the next startup scan.
+
+        Called on every serve, so the mtime is only rewritten once per
+        ``TOUCH_PERSIST_SECONDS`` per file. Paths outside the root are ignored.
+        """
+        try:
+            key = self._key(path)
+        except ValueError:
+            return
+        entry = self.entries.get(key)
+        if entry is None:
+            # Written by another worker since the last rescan
+            self.track(path)
+            return
+        now = time.time()
+        self.entries.move_to_end(key)
+        self.entries[key] = (entry[0], now)
+        if now - entry[1] >= TOUCH_PERSIST_SECONDS:
+            try:
+                os.utime(path)
+            except FileNotFoundError:
+                pass
+
+    def _walk(self) -> List[Tuple[float, str, int]]:
+        found = []
+        stack = [self.root]
+        while stack:
+            with os.scandir(stack.pop()) as it:
+                for entry in it:
+                    if entry.is_dir(follow_symlinks=False):
+                        stack.append(Path(entry.path))
+                    elif entry.is_file(follow_symlinks=False):
+                        stat = entry.stat()
+                        # Many mounts are noatime/relatime, so mtime is the floor
+                        accessed = max(stat.st_atime, stat.st_mtime)
+                        found.append((accessed, self._key(Path(entry.path)), stat.st_size))
+        found.sort()
+        return found
+
+    async def rescan(self):
+        """Reconcile the index with the directory without blocking the event loop"""
+        found = await asyncio.to_thread(self._walk)
+        on_disk = {key for _, key, _ in found}
+        for key in [key for key in self.entries if key not in on_disk]:
+            self.total_bytes -= self.entries.pop(key)[0]
+
+        # Newly seen files go in front of entries tracked in this process, which are more recent
+        tracked = self.entries
+        self.entries = OrderedDict()
+        self.total_bytes = 0
+        for accessed, key, size in found:
+            if key not in tracked:
+                self._add(key, size, accessed)
+        for key, (size, accessed) in tracked.items():
+            self._add(key, size, accessed)
+        self._last_scan = time.monotonic()
+
+    def _remove_oldest(self) -> int:
+        key, (size, _) = self.entries.popitem(last=False)
+        self.total_bytes -= size
+        try:
+            os.remove(self.root / key)
+        except FileNotFoundError:
+            return 0
+        except OSError as e:
+            print(f"Warning: Could not remove file {self.root / key}: {e}")
+            return 0
+        self.stats["reclaimed_files"] += 1
+        self.stats["reclaimed_bytes"] += size
+        return size
+
+    def sweep(self, max_age_seconds: Optional[float] = None) -> int:
+        """Delete expired files, then the least recently used until under quota; returns bytes reclaimed"""
+        start = time.perf_counter()
+        cutoff = time.time() - (self.max_age_seconds if max_age_seconds is None else max_age_seconds)
+        reclaimed = 0
+        while self.entries and next(iter(self.entries.values()))[1] < cutoff:
+            reclaimed += self._remove_oldest()
+        while self.entries and self.total_bytes > self.max_bytes:
+            reclaimed += self._remove_oldest()
+
+        self.stats["sweeps"] += 1
+        self.stats["last_sweep_seconds"] = round(time.perf_counter() - start, 6)
+        return reclaimed
+
+    def snapshot(self) -> Dict[str, float]:
+        return {"files": len(self.entries), "bytes": self.total_bytes, "max_bytes": self.max_bytes, **self.stats}
+
+    async def run(self):
+        """Sweep every ``interval`` seconds until cancelled"""
+        while True:
+            try:
+                if self._last_scan is None or time.monotonic() - self._last_scan >= self.rescan_interval:
+                    await self.rescan()
+                reclaimed = self.sweep()
+                if reclaimed:
+                    print(f"🧹 Reclaimed {reclaimed / (1024 * 1024):.1f}MB from {self.root}")
+            except Exception as e:
+                print(f"Warning: Upload janitor sweep failed: {e}")
+            await asyncio.sleep(self.interval)
+
+
+class TrackedStaticFiles(StaticFiles):
+    """StaticFiles that reports every file it serves to an UploadJanitor as used"""
+
+    def __init__(self, janitor: UploadJanitor, **kwargs):
+        super().__init__(**kwargs)
+        self.janitor = janitor
+
+    async def get_response(self, path: str, scope):
+        response = await super().get_response(path, scope)
+        if response.status_code in (200, 304):
+            self.janitor.touch(Path(self.directory) / path)
+        return response
@@ -0,0 +1,71 @@
+import os
+import numpy as np
+from pathlib import Path
+from typing import Optional
+
+
+class VectorStore:
+    """Append-only float32 embedding file read back through a memory map.
+
+    Rows are stored in catalog order as raw little-endian float32, so the
+    file can be mapped read-only and shared by every process on the box
+    without being counted against each worker's heap.
+    """
+
+    def __init__(self, path: Path, dim: int):
+        self.path = Path(path)
+        self.dim = dim
+        self._mmap: Optional[np.memmap] = None
+
+    def __len__(self) -> int:
+        if not self.path.exists():
+            return 0
+        return self.path.stat().st_size // (self.dim * 4)
+
+    def exists(self) -> bool:
+        return self.path.exists() and len(self) > 0
+
+    def write(self, vectors: np.ndarray):
+        """Replace the store contents with the given vectors"""
+        vectors = np.ascontiguousarray(vectors, dtype='<f4').reshape(-1, self.dim)
+        self.path.parent.mkdir(parents=True, exist_ok=True)
+        # Per-process temp name: prefork workers may write the same store at once
+        tmp_path = self.path.with_suffix(f"{self.path.suffix}.{os.getpid()}.tmp")
+        vectors.tofile(tmp_path)
+        os.replace(tmp_path, self.path)
+        self._mmap = None
+
+    def append(self, vectors: np.ndarray):
+        """Append vectors to the end of the store"""
+        vectors = np.ascontiguousarray(vectors, dtype='<f4').reshape(-1, self.dim)
+        self.path.parent.mkdir(parents=True, exist_ok=True)
+        with open(self.path, 'ab') as f:
+            f.write(vectors.tobytes())
+        self._mmap = None
+
+    def update(self, position: int, vector: np.ndarray):
+        """Overwrite one row in place"""
+        vector = np.ascontiguousarray(vector, dtype='<f4').reshape(self.dim)
+        with open(self.path, 'r+b') as f:
+            f.seek(position * self.dim * 4)
+            f.write(vector.tobytes())
+        self._mmap = None
+
+    def vectors(self) -> Optional[np.ndarray]:
+        """Return a read-only (n, dim) view of the store, or None if empty"""
+        if self._mmap is None:
+            rows = len(self)
+            if rows == 0:
+                return None
+            self._mmap = np.memmap(self.path, dtype='<f4', mode='r', shape=(rows, self.dim))
+        return self._mmap
+
+    def get(self, ids: np.ndarray) -> np.ndarray:
+        """Gather rows by position"""
+        vectors = self.vectors()
+        if vectors is None:
+            return np.zeros((0, self.dim), dtype=np.float32)
+        return np.asarray(vectors[ids], dtype=np.float32)
+
+    def close(self):
+        self._mmap = None
@@ -0,0 +1,140 @@
+import asyncio
+import time
+
+import pytest
+from fastapi import HTTPException
+
+from services.admission import AdmissionController, Deadline
+
+
+async def enter(controller, timeout_ms=None):
+    """Run the dependency up to its yield; returns the generator (to release) and the Deadline"""
+    admission = controller.admit(timeout_ms)
+    return admission, await admission.__anext__()
+
+
+async def release(admission):
+    await admission.aclose()
+
+
+def test_admits_up_to_the_limit_without_waiting():
+    async def run():
+        controller = AdmissionController(max_concurrent=2, max_queue=0, default_budget=5.0, max_budget=10.0)
+        first, deadline = await enter(controller)
+        second, _ = await enter(controller)
+        assert controller.running == 2
+        assert 4.0 < deadline.remaining() <= 5.0
+        await release(first)
+        await release(second)
+        return controller
+
+    controller = asyncio.run(run())
+    assert controller.running == 0 and controller.waiting == 0
+
+
+def test_rejects_when_queue_is_full():
+    async def run():
+        controller = AdmissionController(max_concurrent=1, max_queue=0, default_budget=5.0, max_budget=10.0)
+        held, _ = await enter(controller)
+        try:
+            with pytest.raises(HTTPException) as exc_info:
+                await enter(controller)
+        finally:
+            await release(held)
+        return exc_info.value
+
+    error = asyncio.run(run())
+    assert error.status_code == 503
+    assert int(error.headers["Retry-After"]) >= 1
+
+
+def test_rejects_when_expected_wait_exceeds_budget():
+    async def run():
+        controller = AdmissionController(max_concurrent=1, max_queue=10, default_budget=5.0, max_budget=10.0)
+        controller.service_time = 2.0
+        held, _ = await enter(controller)
+        try:
+            # Two seconds of queueing plus two of work cannot fit in one second
+            with pytest.raises(HTTPException) as exc_info:
+                await enter(controller, timeout_ms=1000)
+        finally:
+            await release(held)
+        return exc_info.value
+
+    assert "would not finish in time" in asyncio.run(run()).detail
+
+
+def test_waiter_times_out_when_no_slot_frees():
+    async def run():
+        controller = AdmissionController(max_concurrent=1, max_queue=10, default_budget=5.0, max_budget=10.0)
+        controller.service_time = 0.01
+        held, _ = await enter(controller)
+        start = time.monotonic()
+        try:
+            with pytest.raises(HTTPException) as exc_info:
+                await enter(controller, timeout_ms=200)
+        finally:
+            await release(held)
+        return exc_info.value, time.monotonic() - start, controller.waiting
+
+    error, elapsed, waiting = asyncio.run(run())
+    assert "timed out waiting" in error.detail
+    assert elapsed < 1.0
+    assert waiting == 0
+
+
+def test_waiter_is_admitted_when_a_slot_frees():
+    async def run():
+        controller = AdmissionController(max_concurrent=1, max_queue=10, default_budget=5.0, max_budget=10.0)
+        controller.service_time = 0.01
+        held, _ = await enter(controller)
+        waiter = asyncio.create_task(enter(controller))
+        await asyncio.sleep(0.05)
+        assert controller.waiting == 1
+        await release(held)
+        admission, _ = await waiter
+        assert controller.running == 1 and controller.waiting == 0
+        await release(admission)
+
+    asyncio.run(run())
+
+
+def test_request_timeout_is_capped():
+    async def run():
+        controller = AdmissionController(max_concurrent=1, max_queue=0, default_budget=5.0, max_budget=10.0)
+        admission, deadline = await enter(controller, timeout_ms=60000)
+        await release(admission)
+        return deadline
+
+    assert asyncio.run(run()).remaining() <= 10.0
+
+
+def test_expired_deadline_rejects_next_stage():
+    deadline = Deadline(0)
+    with pytest.raises(HTTPException) as exc_info:
+        deadline.check("search")
+    assert exc_info.value.status_code == 503
+    assert "before search" in exc_info.value.detail
+
+
+@pytest.mark.parametrize("timeout_ms", [0, -5])
+def test_rejects_non_positive_timeout_header(timeout_ms):
+    async def run():
+        controller = AdmissionController(max_concurrent=1, max_queue=0, default_budget=5.0, max_budget=10.0)
+        with pytest.raises(HTTPException) as exc_info:
+            await enter(controller, timeout_ms)
+        assert exc_info.value.status_code == 400
+        return controller
+
+    controller = asyncio.run(run())
+    assert controller.running == 0 and not controller._semaphore.locked()
+
+
+def test_similar_to_product_goes_through_admission():
+    pytest.importorskip("torch")
+    from fastapi.testclient import TestClient
+    import main
+
+    client = TestClient(main.app)
+    # Only the admission dependency reads the header, and it answers before the handler runs
+    assert client.get("/api/products/missing/similar", headers={"X-Request-Timeout-Ms": "0"}).status_code == 400
@@ -0,0 +1,42 @@
+import asyncio
+import io
+
+import pytest
+
+pytest.importorskip("torch")
+
+from fastapi import HTTPException, UploadFile
+
+import main
+
+
+def upload(size: int, name: str = "image.jpg") -> UploadFile:
+    return UploadFile(io.BytesIO(b"\0" * size), filename=name)
+
+
+def test_read_upload_within_limits():
+    contents = asyncio.run(main._read_upload(upload(3 * main.UPLOAD_READ_CHUNK + 5), 10 ** 8, 10 ** 8))
+    assert len(contents) == 3 * main.UPLOAD_READ_CHUNK + 5
+
+
+def test_read_upload_stops_at_the_file_limit():
+    file = upload(5 * main.UPLOAD_READ_CHUNK)
+    with pytest.raises(HTTPException) as exc_info:
+        asyncio.run(main._read_upload(file, main.UPLOAD_READ_CHUNK, 10 ** 8))
+    assert exc_info.value.status_code == 413
+    # Gave up after the chunk that crossed the limit instead of reading the rest
+    assert file.file.tell() == 2 * main.UPLOAD_READ_CHUNK
+
+
+def test_read_upload_stops_at_the_request_budget():
+    with pytest.raises(HTTPException) as exc_info:
+        asyncio.run(main._read_upload(upload(2 * main.UPLOAD_READ_CHUNK), 10 ** 8, main.UPLOAD_READ_CHUNK))
+    assert exc_info.value.status_code == 413
+    assert "per request" in exc_info.value.detail
+
+
+def test_take_chunk_removes_oldest_queries(monkeypatch):
+    monkeypatch.setattr(main, "BATCH_SEARCH_CHUNK", 2)
+    queries = {5: "a", 1: "b", 3: "c"}
+    assert main._take_chunk(queries) == {5: "a", 1: "b"}
+    assert queries == {3: "c"}
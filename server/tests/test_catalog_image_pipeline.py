@@ -0,0 +1,170 @@
+import io
+import json
+import time
+import asyncio
+import threading
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+import httpx
+import pytest
+from PIL import Image
+from fastapi import HTTPException
+
+from services.image_service import ImageService
+from services.catalog_image_pipeline import CatalogImagePipeline, catalog_image_key
+
+
+def jpeg_bytes(size=(64, 48)) -> bytes:
+    buffer = io.BytesIO()
+    Image.new("RGB", size, (200, 40, 40)).save(buffer, "JPEG")
+    return buffer.getvalue()
+
+
+class StandInHandler(BaseHTTPRequestHandler):
+    """Image host stand-in; each path exercises one way a fetch can go"""
+    image = jpeg_bytes()
+    flaky_calls = 0
+
+    def log_message(self, *args):
+        pass
+
+    def send_body(self, status, content_type, body, headers=None):
+        self.send_response(status)
+        self.send_header("Content-Type", content_type)
+        self.send_header("Content-Length", str(len(body)))
+        for name, value in (headers or {}).items():
+            self.send_header(name, value)
+        self.end_headers()
+        self.wfile.write(body)
+
+    def do_GET(self):
+        if self.path.startswith("/ok"):
+            self.send_body(200, "image/jpeg", self.image)
+        elif self.path == "/page.html":
+            self.send_body(200, "text/html", b"<html>not an image</html>")
+        elif self.path == "/big.jpg":
+            self.send_body(200, "image/jpeg", self.image + b"\0" * 4096)
+        elif self.path == "/big-chunked.jpg":
+            # No Content-Length, so the cap has to be enforced while reading
+            self.send_response(200)
+            self.send_header("Content-Type", "image/jpeg")
+            self.send_header("Transfer-Encoding", "chunked")
+            self.end_headers()
+            for _ in range(8):
+                chunk = b"\0" * 1024
+                self.wfile.write(f"{len(chunk):x}\r\n".encode() + chunk + b"\r\n")
+            self.wfile.write(b"0\r\n\r\n")
+        elif self.path == "/slow.jpg":
+            time.sleep(1.0)
+            self.send_body(200, "image/jpeg", self.image)
+        elif self.path == "/flaky.jpg":
+            type(self).flaky_calls += 1
+            if self.flaky_calls == 1:
+                self.send_body(503, "text/plain", b"busy", {"Retry-After": "0"})
+            else:
+                self.send_body(200, "image/jpeg", self.image)
+        else:
+            self.send_body(404, "text/plain", b"not found")
+
+
+@pytest.fixture
+def image_host():
+    StandInHandler.flaky_calls = 0
+    server = ThreadingHTTPServer(("127.0.0.1", 0), StandInHandler)
+    thread = threading.Thread(target=server.serve_forever, daemon=True)
+    thread.start()
+    yield f"http://127.0.0.1:{server.server_address[1]}"
+    server.shutdown()
+    server.server_close()
+
+
+@pytest.fixture
+def image_service(tmp_path, monkeypatch):
+    # ImageService creates uploads/ in the working directory
+    monkeypatch.chdir(tmp_path)
+    service = ImageService()
+    service.max_file_size = len(StandInHandler.image) + 1024
+    return service
+
+
+def download(image_service, url, timeout=5.0):
+    async def fetch():
+        async with httpx.AsyncClient() as client:
+            return await image_service.download_image(url, client, timeout)
+    return asyncio.run(fetch())
+
+
+def test_download_returns_image_bytes(image_host, image_service):
+    assert download(image_service, f"{image_host}/ok.jpg") == StandInHandler.image
+
+
+def test_download_rejects_non_image_response(image_host, image_service):
+    with pytest.raises(HTTPException) as exc_info:
+        download(image_service, f"{image_host}/page.html")
+    assert exc_info.value.status_code == 400
+    assert "not point to an image" in exc_info.value.detail
+
+
+@pytest.mark.parametrize("path", ["/big.jpg", "/big-chunked.jpg"])
+def test_download_enforces_size_cap(image_host, image_service, path):
+    with pytest.raises(HTTPException) as exc_info:
+        download(image_service, f"{image_host}{path}")
+    assert "too large" in exc_info.value.detail
+
+
+def test_download_times_out(image_host, image_service):
+    with pytest.raises(httpx.TimeoutException):
+        download(image_service, f"{image_host}/slow.jpg", timeout=0.2)
+
+
+def test_download_raises_http_errors(image_host, image_service):
+    with pytest.raises(httpx.HTTPStatusError):
+        download(image_service, f"{image_host}/missing.jpg")
+
+
+def run_pipeline(image_service, output_dir, urls, **kwargs):
+    options = {"concurrency": 4, "per_host_rate": 1000.0, "retries": 0, "processes": 1, "timeout": 0.2}
+    options.update(kwargs)
+    pipeline = CatalogImagePipeline(image_service, output_dir=output_dir, **options)
+    return pipeline, asyncio.run(pipeline.run(urls))
+
+
+def test_pipeline_records_fetched_and_failed(image_host, image_service, tmp_path):
+    output_dir = tmp_path / "catalog_images"
+    urls = [f"{image_host}/{path}" for path in ("ok-1.jpg", "ok-2.jpg", "page.html", "big.jpg", "slow.jpg", "missing.jpg")]
+
+    pipeline, stats = run_pipeline(image_service, output_dir, urls)
+
+    assert stats["total"] == 6
+    assert stats["fetched"] == 2
+    assert stats["failed"] == 4
+    for url in urls[:2]:
+        key = catalog_image_key(url)
+        assert (output_dir / f"{key}.jpg").exists()
+        assert (output_dir / "thumbnails" / f"{key}_thumb.jpg").exists()
+    state = json.loads((output_dir / "state.json").read_text())
+    assert [state[url]["status"] for url in urls] == ["done", "done", "failed", "failed", "failed", "failed"]
+    assert state[urls[0]]["width"] == 64
+
+
+def test_pipeline_resumes_and_retries_failed(image_host, image_service, tmp_path):
+    output_dir = tmp_path / "catalog_images"
+    urls = [f"{image_host}/ok.jpg", f"{image_host}/slow.jpg"]
+    run_pipeline(image_service, output_dir, urls)
+
+    _, stats = run_pipeline(image_service, output_dir, urls)
+    assert (stats["skipped"], stats["fetched"], stats["failed"]) == (2, 0, 0)
+
+    pipeline = CatalogImagePipeline(image_service, output_dir=output_dir, per_host_rate=1000.0, processes=1)
+    stats = asyncio.run(pipeline.run(urls, retry_failed=True))
+    assert (stats["skipped"], stats["fetched"], stats["failed"]) == (1, 1, 0)
+    assert pipeline.state[urls[1]]["status"] == "done"
+
+
+def test_pipeline_retries_retryable_status(image_host, image_service, tmp_path):
+    url = f"{image_host}/flaky.jpg"
+    pipeline, stats = run_pipeline(image_service, tmp_path / "catalog_images", [url], retries=2)
+
+    assert stats["fetched"] == 1
+    assert StandInHandler.flaky_calls == 2
+    assert pipeline.state[url]["status"] == "done"
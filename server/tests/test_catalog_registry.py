@@ -0,0 +1,53 @@
+import asyncio
+import json
+import threading
+
+import pytest
+
+pytest.importorskip("torch")
+
+from fastapi import HTTPException
+
+from services.catalog_registry import Catalog, CatalogRegistry
+from services.product_service import ProductService
+from services.similarity_service import SimilarityService
+
+RECORDS = [{"id": f"p{i}", "name": f"Product {i}", "category": "c", "image_url": f"u{i}"} for i in range(5)]
+
+
+def make_registry(tmp_path, catalogs):
+    for name, content in catalogs.items():
+        (tmp_path / name).mkdir()
+        (tmp_path / name / "products.json").write_text(content, encoding="utf-8")
+    default = Catalog(None, ProductService(tmp_path / "default"), SimilarityService(tmp_path / "default"))
+    return CatalogRegistry(tmp_path, default, max_bytes=1 << 30)
+
+
+def test_catalog_loads_off_the_event_loop(tmp_path, monkeypatch):
+    registry = make_registry(tmp_path, {"acme": json.dumps(RECORDS)})
+    threads = []
+    initialize = ProductService.initialize
+
+    async def recording_initialize(self):
+        threads.append(threading.get_ident())
+        await initialize(self)
+
+    monkeypatch.setattr(ProductService, "initialize", recording_initialize)
+
+    async def load():
+        catalog = await registry.get("acme")
+        return catalog, threading.get_ident()
+
+    catalog, loop_thread = asyncio.run(load())
+    assert len(catalog.products.products) == 5
+    assert threads and loop_thread not in threads
+    assert registry.stats["loads"] == 1
+
+
+def test_malformed_catalog_is_an_error_not_sample_data(tmp_path):
+    registry = make_registry(tmp_path, {"broken": json.dumps([{"id": "p1", "tags": "red"}])})
+    with pytest.raises(HTTPException) as exc_info:
+        asyncio.run(registry.resolve(type("Request", (), {"path_params": {"catalog": "broken"}})()))
+    assert exc_info.value.status_code == 503
+    assert json.loads((tmp_path / "broken" / "products.json").read_text()) == [{"id": "p1", "tags": "red"}]
+    assert not registry.loaded
@@ -0,0 +1,133 @@
+import numpy as np
+import pytest
+
+from models.product import ProductFilter
+from services.catalog_store import CatalogStore
+
+RECORDS = [
+    {"id": "p1", "name": "Runner", "category": "Shoes", "image_url": "https://img/1.jpg",
+     "price": 80.0, "brand": "Nike", "tags": ["running", "Sport"]},
+    {"id": "p2", "name": "Loafer", "category": "shoes", "image_url": "https://img/2.jpg",
+     "price": 120.0, "brand": "Clarks", "tags": ["leather"]},
+    {"id": "p3", "name": "Phone", "category": "Electronics", "image_url": "https://img/3.jpg",
+     "price": 999.0, "brand": "Apple", "tags": ["sport", "mobile"]},
+    {"id": "p4", "name": "Cable", "category": "Electronics", "image_url": "https://img/4.jpg",
+     "price": None, "brand": None, "tags": []},
+    {"id": "p5", "name": "Trail", "category": "Shoes", "image_url": "https://img/5.jpg",
+     "price": 150.0, "brand": "nike", "tags": ["running", "trail"]},
+]
+
+
+@pytest.fixture
+def store():
+    return CatalogStore(RECORDS)
+
+
+def rows(mask):
+    return np.flatnonzero(mask).tolist()
+
+
+def test_empty_filter_is_no_mask(store):
+    assert store.filter_mask(None) is None
+    assert store.filter_mask(ProductFilter()) is None
+
+
+@pytest.mark.parametrize("filters, expected", [
+    (ProductFilter(category="SHOES"), [0, 1, 4]),
+    (ProductFilter(min_price=100), [1, 2, 4]),
+    (ProductFilter(max_price=120), [0, 1]),
+    (ProductFilter(min_price=80, max_price=150, category="shoes"), [0, 1, 4]),
+    (ProductFilter(brands=["NIKE"]), [0, 4]),
+    (ProductFilter(brands=["nike", "apple"]), [0, 2, 4]),
+    (ProductFilter(tags=["sport"]), [0, 2]),
+    (ProductFilter(tags=["running", "trail"]), [4]),
+    (ProductFilter(category="Toys"), []),
+])
+def test_filter_mask(store, filters, expected):
+    mask = store.filter_mask(filters)
+    assert mask.dtype == bool and len(mask) == len(store)
+    assert rows(mask) == expected
+
+
+def test_filter_mask_matches_row_by_row(store):
+    filters = ProductFilter(category="shoes", min_price=90, brands=["nike", "clarks"])
+    expected = [
+        i for i, row in enumerate(store)
+        if row.category.lower() == "shoes" and row.price is not None and row.price >= 90
+        and (row.brand or "").lower() in {"nike", "clarks"}
+    ]
+    assert rows(store.filter_mask(filters)) == expected
+
+
+def test_filter_masks_are_cached_and_read_only(store):
+    mask = store.filter_mask(ProductFilter(brands=["Nike"]))
+    assert store.filter_mask(ProductFilter(brands=["nike"])) is mask
+    with pytest.raises(ValueError):
+        mask[0] = False
+
+
+def test_position(store):
+    assert [store.position(record["id"]) for record in RECORDS] == [0, 1, 2, 3, 4]
+    assert store.position("missing") is None
+
+
+def test_position_returns_first_duplicate():
+    store = CatalogStore(RECORDS + [dict(RECORDS[1], name="Copy")])
+    assert store.position("p2") == 1
+
+
+def test_category_positions(store):
+    assert store.category_positions("electronics").tolist() == [2, 3]
+
+
+def test_changes_return_new_store(store):
+    updated = store.deleted(0)
+    assert len(store) == 5 and len(updated) == 4
+    assert updated.position("p1") is None
+    assert updated.position("p5") == 3
+    assert rows(updated.filter_mask(ProductFilter(brands=["nike"]))) == [3]
+
+
+def test_rows_round_trip(store):
+    row = store[2]
+    assert (row.id, row.name, row.category, row.price, row.brand, row.tags) == (
+        "p3", "Phone", "Electronics", 999.0, "Apple", ["sport", "mobile"]
+    )
+    assert store[3].price is None and store[3].brand is None and store[3].tags == []
+
+
+def test_created_at_keeps_its_offset():
+    created = ["2024-03-01T10:00:00+05:30", "2024-03-01T10:00:00Z", "2024-03-01T10:00:00"]
+    store = CatalogStore([
+        {"id": f"c{i}", "name": "x", "category": "c", "image_url": "u", "created_at": value}
+        for i, value in enumerate(created)
+    ])
+    assert [store[i].created_at.isoformat() for i in range(3)] == [
+        "2024-03-01T10:00:00+05:30", "2024-03-01T10:00:00+00:00", "2024-03-01T10:00:00"
+    ]
+    # Survives a rebuild from the store's own records
+    assert store.deleted(2)[0].created_at.isoformat() == "2024-03-01T10:00:00+05:30"
+
+
+@pytest.mark.parametrize("field, value, message", [
+    ("tags", "red", "Product 1 has invalid 'tags'"),
+    ("tags", ["red", 3], "Product 1 has invalid 'tags'"),
+    ("price", "cheap", "Product 1 has an invalid 'price'"),
+    ("price", True, "Product 1 has an invalid 'price'"),
+    ("price", [10], "Product 1 has an invalid 'price'"),
+    ("created_at", 1700000000, "Product 1 has an invalid 'created_at'"),
+    ("created_at", "yesterday", "Product 1 has an invalid 'created_at'"),
+    ("brand", 7, "Product 1 has an invalid 'brand'"),
+    ("name", None, "Product 1 has no valid 'name'"),
+])
+def test_malformed_rows_are_rejected_with_their_index(field, value, message):
+    records = [dict(record) for record in RECORDS[:2]]
+    records[1][field] = value
+    with pytest.raises(ValueError, match=message):
+        CatalogStore(records)
+
+
+def test_lenient_values_product_accepts_still_load():
+    record = {**RECORDS[0], "price": "19.5", "tags": None, "created_at": "2024-03-01T10:00:00Z"}
+    product = CatalogStore([record])[0].to_product()
+    assert product.price == 19.5 and product.tags == []
@@ -0,0 +1,115 @@
+import asyncio
+import io
+
+import numpy as np
+import pytest
+from PIL import Image, ImageDraw
+
+from services.catalog_image_pipeline import CATALOG_IMAGE_DIR, catalog_image_key
+from services.catalog_store import CatalogStore
+from services.dedup_service import DedupService, HashesPending, hash_image_bytes
+from services.image_service import ImageService
+from services.product_service import ProductService
+
+URL_A = "https://cdn.example/a.jpg"
+URL_A_SMALL = "https://cdn.example/a-small.jpg"
+URL_B = "https://cdn.example/b.jpg"
+# Nothing listens on the discard port, so fetching this fails fast
+URL_BROKEN = "http://127.0.0.1:9/broken.jpg"
+
+
+def pattern(seed: int, size: int) -> Image.Image:
+    rng = np.random.default_rng(seed)
+    img = Image.new("RGB", (256, 256), "white")
+    draw = ImageDraw.Draw(img)
+    for _ in range(12):
+        x, y = rng.integers(0, 200, size=2)
+        draw.rectangle([x, y, x + 56, y + 56], fill=tuple(int(c) for c in rng.integers(0, 255, size=3)))
+    return img.resize((size, size))
+
+
+def jpeg(img: Image.Image) -> bytes:
+    buffer = io.BytesIO()
+    img.save(buffer, "JPEG", quality=90)
+    return buffer.getvalue()
+
+
+@pytest.fixture
+def dedup(tmp_path, monkeypatch):
+    # Catalog images are read from their local copies under data/catalog_images
+    monkeypatch.chdir(tmp_path)
+    CATALOG_IMAGE_DIR.mkdir(parents=True)
+    for url, img in ((URL_A, pattern(1, 256)), (URL_A_SMALL, pattern(1, 128)), (URL_B, pattern(2, 256))):
+        (CATALOG_IMAGE_DIR / f"{catalog_image_key(url)}.jpg").write_bytes(jpeg(img))
+
+    products = ProductService(tmp_path / "catalog", sample_data=False)
+    products._set_catalog(CatalogStore([
+        {"id": "p1", "name": "A", "category": "X", "image_url": URL_A},
+        {"id": "p2", "name": "A small", "category": "X", "image_url": URL_A_SMALL},
+        {"id": "p3", "name": "B", "category": "X", "image_url": URL_B},
+        {"id": "p4", "name": "A again", "category": "X", "image_url": URL_A},
+        {"id": "p5", "name": "Broken", "category": "X", "image_url": URL_BROKEN},
+    ]))
+    return DedupService(ImageService(), products)
+
+
+def wait_for_hashes(service: DedupService):
+    """Query once, which starts hashing in the background, then wait for it"""
+    async def run():
+        with pytest.raises(HashesPending):
+            await service.duplicate_report()
+        assert service.snapshot()["hashing"]
+        await service._refresh_task
+        return await service.duplicate_report(), await service.find_duplicates(
+            hash_image_bytes(jpeg(pattern(1, 200))), max_distance=8
+        )
+    return asyncio.run(run())
+
+
+def test_report_and_check_after_background_hashing(dedup):
+    report, matches = wait_for_hashes(dedup)
+
+    assert len(report) == 1
+    assert sorted(product.id for product in report[0].products) == ["p1", "p2", "p4"]
+    assert sorted(match.product.id for match in matches) == ["p1", "p2", "p4"]
+    assert dedup.snapshot() == {"images": 3, "failed": 1, "hashing": False, "ready": True}
+
+
+def test_hash_cache_lives_in_the_catalog_data_dir(dedup, tmp_path):
+    wait_for_hashes(dedup)
+    assert dedup.hashes_file == tmp_path / "catalog" / "image_hashes_phash.json"
+    assert dedup.hashes_file.exists()
+    assert not (tmp_path / "data" / "image_hashes_phash.json").exists()
+
+
+def test_failed_images_are_retried_after_the_delay(dedup):
+    wait_for_hashes(dedup)
+    assert URL_BROKEN in dedup.failed_urls
+    assert not dedup._needs_refresh()
+
+    dedup.retry_failed_after = 0
+    assert dedup._needs_refresh()
+
+
+def test_catalog_change_triggers_a_refresh(dedup):
+    wait_for_hashes(dedup)
+    dedup.product_service._set_catalog(dedup.product_service.products.deleted(0))
+    assert dedup._needs_refresh()
+
+    async def run():
+        # The previous index keeps answering while the new one is built
+        await dedup.find_duplicates(0, 4)
+        await dedup._refresh_task
+    asyncio.run(run())
+    assert not dedup._needs_refresh()
+
+
+def test_check_rejects_oversized_uploads():
+    pytest.importorskip("torch")
+    from fastapi.testclient import TestClient
+    import main
+
+    big = b"\0" * (main.image_service.max_file_size + 1)
+    response = TestClient(main.app).post("/api/dedup/check", files={"file": ("big.jpg", big, "image/jpeg")})
+    assert response.status_code == 413
+    assert "Max size is 10MB" in response.json()["detail"]
@@ -0,0 +1,131 @@
+import asyncio
+import io
+import os
+
+import pytest
+from PIL import Image
+
+from services.derivative_cache import DerivativeCache
+
+SIZES = [64, 128, 256]
+
+
+def store_original(directory, image_hash, extension="jpg", size=(300, 200)):
+    directory.mkdir(parents=True, exist_ok=True)
+    buffer = io.BytesIO()
+    Image.new("RGB", size, (20, 120, 220)).save(buffer, "JPEG")
+    path = directory / f"{image_hash}.{extension}"
+    path.write_bytes(buffer.getvalue())
+    return path
+
+
+def cache_bytes(directory):
+    return sum(path.stat().st_size for path in directory.iterdir() if not path.name.endswith(".tmp"))
+
+
+@pytest.fixture
+def uploads(tmp_path):
+    return tmp_path / "uploads"
+
+
+def test_snap_rounds_up_to_configured_sizes(tmp_path):
+    cache = DerivativeCache([], tmp_path / "cache", 10 ** 9, [256, 64, 128, 128])
+    assert [cache.snap(size) for size in (1, 64, 65, 200, 256, 2048)] == [64, 64, 128, 256, 256, 256]
+
+
+def test_find_source_skips_temp_files_and_other_extensions(tmp_path, uploads):
+    image_hash = "ab" * 16
+    uploads.mkdir()
+    # An upload still being written, and a stray file sharing the hash prefix
+    (uploads / f"{image_hash}.1234.5678.tmp").write_bytes(b"partial")
+    (uploads / f"{image_hash}.json").write_text("{}")
+    cache = DerivativeCache([uploads], tmp_path / "cache", 10 ** 9, SIZES)
+    assert cache.find_source(image_hash) is None
+
+    original = store_original(uploads, image_hash, "png")
+    assert cache.find_source(image_hash) == original
+    assert cache.find_source("../" + image_hash) is None
+
+
+def test_eviction_measures_the_directory_shared_by_workers(tmp_path, uploads):
+    hashes = [f"{i:02x}" * 16 for i in range(6)]
+    for image_hash in hashes:
+        store_original(uploads, image_hash)
+    probe = DerivativeCache([uploads], tmp_path / "probe", 10 ** 9, SIZES)
+    one_file = asyncio.run(probe.get(hashes[0], 128, 128, "JPEG")).stat().st_size
+
+    # Two workers sharing one directory, each rendering what the other cannot see, re-measuring on every render
+    budget = int(one_file * 2.5)
+    workers = [DerivativeCache([uploads], tmp_path / "cache", budget, SIZES, rescan_seconds=0) for _ in range(2)]
+
+    async def render():
+        for i, image_hash in enumerate(hashes):
+            await workers[i % 2].get(image_hash, 128, 128, "JPEG")
+    asyncio.run(render())
+
+    assert cache_bytes(tmp_path / "cache") <= budget
+    assert sum(cache.stats["evictions"] for cache in workers) == len(hashes) - 2
+    # The newest renders survive, and each worker's accounting matches the disk
+    assert sorted(os.listdir(tmp_path / "cache")) == sorted(f"{h}_128x128.jpg" for h in hashes[-2:])
+    assert workers[1].total_bytes == cache_bytes(tmp_path / "cache")
+
+
+def test_hit_refreshes_recency_across_workers(tmp_path, uploads):
+    hashes = [f"{i:02x}" * 16 for i in range(3)]
+    for image_hash in hashes:
+        store_original(uploads, image_hash)
+    first = DerivativeCache([uploads], tmp_path / "cache", 10 ** 9, SIZES)
+
+    async def run():
+        for image_hash in hashes:
+            await first.get(image_hash, 64, 64, "JPEG")
+        old = os.path.getmtime(first.cache_dir / f"{hashes[0]}_64x64.jpg") - 100
+        for image_hash in hashes:
+            os.utime(first.cache_dir / f"{image_hash}_64x64.jpg", (old, old))
+        await first.get(hashes[0], 64, 64, "JPEG")
+
+        # A worker started now sees hashes[0] as the most recently used
+        second = DerivativeCache([uploads], tmp_path / "cache", 10 ** 9, SIZES)
+        return list(second.entries)
+
+    assert asyncio.run(run()) == [f"{hashes[1]}_64x64.jpg", f"{hashes[2]}_64x64.jpg", f"{hashes[0]}_64x64.jpg"]
+
+
+def test_misses_do_not_rescan_the_directory(tmp_path, uploads, monkeypatch):
+    hashes = [f"{i:02x}" * 16 for i in range(6)]
+    for image_hash in hashes:
+        store_original(uploads, image_hash)
+    probe = DerivativeCache([uploads], tmp_path / "probe", 10 ** 9, SIZES)
+    one_file = asyncio.run(probe.get(hashes[0], 128, 128, "JPEG")).stat().st_size
+
+    budget = int(one_file * 2.5)
+    cache = DerivativeCache([uploads], tmp_path / "cache", budget, SIZES)
+    scans = []
+    monkeypatch.setattr(cache, "_scan", lambda: scans.append(1))
+
+    async def render():
+        for image_hash in hashes:
+            await cache.get(image_hash, 128, 128, "JPEG")
+    asyncio.run(render())
+
+    assert scans == []
+    assert cache.stats["evictions"] == len(hashes) - 2
+    assert cache.total_bytes == cache_bytes(tmp_path / "cache") <= budget
+    assert list(cache.entries) == [f"{h}_128x128.jpg" for h in hashes[-2:]]
+
+
+def test_failed_render_releases_its_lock(tmp_path, uploads, monkeypatch):
+    import services.derivative_cache as derivative_cache
+
+    image_hash = "cd" * 16
+    store_original(uploads, image_hash)
+    cache = DerivativeCache([uploads], tmp_path / "cache", 10 ** 9, SIZES)
+
+    def broken_render(*args):
+        raise OSError("cannot encode")
+
+    monkeypatch.setattr(derivative_cache, "render_derivative", broken_render)
+    with pytest.raises(OSError):
+        asyncio.run(cache.get(image_hash, 64, 64, "JPEG"))
+    assert cache._locks == {}
+    assert os.listdir(tmp_path / "cache") == []
@@ -0,0 +1,96 @@
+import asyncio
+
+import numpy as np
+import pytest
+
+pytest.importorskip("torch")
+
+import faiss
+
+from models.product import ProductFilter
+from services.catalog_store import CatalogStore
+from services.product_service import ProductService
+from services.similarity_service import SimilarityService
+
+CATEGORIES = ["Shoes", "Electronics", "Books", "Toys"]
+
+
+def make_service(tmp_path, monkeypatch, size=400, quantization="none", rerank=0, seed=3):
+    monkeypatch.setenv("INDEX_QUANTIZATION", quantization)
+    monkeypatch.setenv("INDEX_RERANK_CANDIDATES", str(rerank))
+    monkeypatch.setenv("INDEX_SHARDS", "0")
+    rng = np.random.default_rng(seed)
+    records = [
+        {"id": f"p{i}", "name": f"Product {i}", "category": CATEGORIES[i % len(CATEGORIES)],
+         "image_url": f"https://img/{i}.jpg", "price": float(rng.integers(1, 500)),
+         "brand": ["Acme", "Globex"][i % 2], "tags": ["sale"] if i % 5 == 0 else []}
+        for i in range(size)
+    ]
+    service = SimilarityService(tmp_path)
+    service.product_service = ProductService(tmp_path, sample_data=False)
+    service.product_service._set_catalog(CatalogStore(records))
+
+    vectors = rng.standard_normal((size, service.embedding_dim)).astype(np.float32)
+    faiss.normalize_L2(vectors)
+    service.vector_store.write(vectors)
+    service._build_index(vectors)
+    return service, vectors
+
+
+def brute_force(vectors, query, mask, k):
+    query = query / np.linalg.norm(query)
+    scores = vectors @ query
+    rows = np.flatnonzero(mask)
+    return rows[np.argsort(-scores[rows], kind="stable")[:k]].tolist()
+
+
+@pytest.mark.parametrize("filters", [
+    ProductFilter(category="books"),
+    ProductFilter(category="toys", brands=["globex"]),
+    ProductFilter(min_price=100, max_price=200),
+    ProductFilter(tags=["sale"], brands=["Acme"]),
+])
+def test_filtered_search_returns_full_exact_top_k(tmp_path, monkeypatch, filters):
+    service, vectors = make_service(tmp_path, monkeypatch)
+    products = service.product_service.products
+    mask = products.filter_mask(filters)
+    queries = np.random.default_rng(5).standard_normal((3, service.embedding_dim)).astype(np.float32)
+
+    results = asyncio.run(service.search_vectors(queries.copy(), min_similarity=-1.0, max_results=10, filters=filters))
+
+    for query, result in zip(queries, results):
+        expected = brute_force(vectors, query, mask, 10)
+        assert len(result["ids"]) == min(10, int(mask.sum()))
+        assert result["ids"] == [products.ids.get(row) for row in expected]
+
+
+def test_rare_filter_is_not_starved(tmp_path, monkeypatch):
+    # Two matching rows out of 400: post-filtering the global top-k would usually return none
+    service, vectors = make_service(tmp_path, monkeypatch)
+    filters = ProductFilter(min_price=499)
+    mask = service.product_service.products.filter_mask(filters)
+    query = np.random.default_rng(9).standard_normal(service.embedding_dim).astype(np.float32)
+
+    result = asyncio.run(service.search_vectors(query.copy(), min_similarity=-1.0, max_results=5, filters=filters))[0]
+    assert len(result["ids"]) == int(mask.sum()) > 0
+
+
+def test_filter_matching_nothing(tmp_path, monkeypatch):
+    service, _ = make_service(tmp_path, monkeypatch)
+    query = np.ones(service.embedding_dim, dtype=np.float32)
+    result = asyncio.run(service.search_vectors(query, filters=ProductFilter(category="Garden")))[0]
+    assert result == {"ids": [], "scores": []}
+
+
+def test_quantized_rerank_with_filter(tmp_path, monkeypatch):
+    service, vectors = make_service(tmp_path, monkeypatch, quantization="sq8", rerank=50)
+    filters = ProductFilter(category="shoes")
+    mask = service.product_service.products.filter_mask(filters)
+    query = np.random.default_rng(2).standard_normal(service.embedding_dim).astype(np.float32)
+
+    result = asyncio.run(service.search_vectors(query.copy(), min_similarity=-1.0, max_results=10, filters=filters))[0]
+    rows = [service.product_service.products.position(product_id) for product_id in result["ids"]]
+    assert all(mask[row] for row in rows)
+    # Re-ranked scores are exact
+    normalized = query / np.linalg.norm(query)
+    assert np.allclose(result["scores"], vectors[rows] @ normalized, atol=1e-5)
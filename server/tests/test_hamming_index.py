@@ -0,0 +1,74 @@
+import numpy as np
+import pytest
+
+from services.dedup_service import HammingIndex, MAX_DISTANCE
+
+
+def popcount(values: np.ndarray) -> np.ndarray:
+    return np.unpackbits(values.view(np.uint8).reshape(-1, 8), axis=1).sum(axis=1)
+
+
+def brute_force_pairs(hashes: np.ndarray, max_distance: int):
+    pairs = set()
+    for i in range(len(hashes)):
+        distances = popcount(hashes[i] ^ hashes[i + 1:])
+        for offset in np.flatnonzero(distances <= max_distance):
+            pairs.add((i, i + 1 + int(offset), int(distances[offset])))
+    return pairs
+
+
+def near_duplicate_hashes(seed: int = 7, clusters: int = 60, per_cluster: int = 5) -> np.ndarray:
+    """Random hashes plus copies of each with up to MAX_DISTANCE bits flipped"""
+    rng = np.random.default_rng(seed)
+    bases = rng.integers(0, 2 ** 63, size=clusters, dtype=np.uint64) * np.uint64(2) + np.uint64(1)
+    hashes = []
+    for base in bases:
+        hashes.append(base)
+        for _ in range(per_cluster - 1):
+            flips = rng.choice(64, size=rng.integers(0, MAX_DISTANCE + 3), replace=False)
+            mask = np.uint64(0)
+            for bit in flips:
+                mask |= np.uint64(1) << np.uint64(bit)
+            hashes.append(base ^ mask)
+    hashes = np.array(hashes, dtype=np.uint64)
+    return hashes[rng.permutation(len(hashes))]
+
+
+@pytest.mark.parametrize("max_distance", [0, 3, 6, MAX_DISTANCE])
+def test_pairs_match_brute_force(max_distance):
+    hashes = near_duplicate_hashes()
+    index = HammingIndex()
+    index.add(hashes)
+
+    found = {tuple(pair) for pair in index.pairs(hashes, max_distance, batch_size=64).tolist()}
+    assert found == brute_force_pairs(hashes, max_distance)
+
+
+def test_search_matches_brute_force():
+    hashes = near_duplicate_hashes(seed=11)
+    index = HammingIndex()
+    index.add(hashes)
+
+    queries = hashes[:20] ^ np.uint64(0b101)
+    for query, matches in zip(queries, index.search(queries, 6)):
+        distances = popcount(query ^ hashes)
+        expected = {(int(row), int(distances[row])) for row in np.flatnonzero(distances <= 6)}
+        assert set(matches) == expected
+        assert [distance for _, distance in matches] == sorted(distance for _, distance in matches)
+
+
+def test_exact_duplicates_and_empty_index():
+    index = HammingIndex()
+    assert index.pairs(np.zeros(0, dtype=np.uint64), 4).shape == (0, 3)
+
+    hashes = np.array([42, 42, 43], dtype=np.uint64)
+    index.add(hashes)
+    assert len(index) == 3
+    assert sorted(map(tuple, index.pairs(hashes, 0).tolist())) == [(0, 1, 0)]
+
+
+def test_rejects_radius_beyond_tables():
+    index = HammingIndex()
+    index.add(np.array([1], dtype=np.uint64))
+    with pytest.raises(ValueError):
+        index.search(np.array([1], dtype=np.uint64), MAX_DISTANCE + 1)
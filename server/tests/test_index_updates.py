@@ -0,0 +1,110 @@
+import asyncio
+
+import numpy as np
+import pytest
+
+pytest.importorskip("torch")
+
+import faiss
+
+from models.product import Product
+from services.catalog_store import CatalogStore
+from services.product_service import ProductService
+from services.similarity_service import SimilarityService
+
+SIZE = 300
+
+
+class FixedModel:
+    """Stands in for the sentence transformer: every text encodes to one chosen vector"""
+
+    def __init__(self, vector):
+        self.vector = vector
+
+    def encode(self, text, convert_to_numpy=True):
+        return self.vector.copy()
+
+
+def make_service(tmp_path, monkeypatch, quantization="none", shards=0, mmap=False):
+    monkeypatch.setenv("INDEX_QUANTIZATION", quantization)
+    monkeypatch.setenv("INDEX_RERANK_CANDIDATES", "50" if quantization != "none" else "0")
+    monkeypatch.setenv("INDEX_SHARDS", str(shards))
+    records = [{"id": f"p{i}", "name": f"Product {i}", "category": f"c{i % 4}", "image_url": f"u{i}"} for i in range(SIZE)]
+    service = SimilarityService(tmp_path)
+    service.product_service = ProductService(tmp_path, sample_data=False)
+    service.product_service._set_catalog(CatalogStore(records))
+    vectors = np.random.default_rng(0).standard_normal((SIZE, service.embedding_dim)).astype(np.float32)
+    faiss.normalize_L2(vectors)
+    service.vector_store.write(vectors)
+    service._build_index(vectors)
+    if mmap:
+        service.mmap_index = True
+        asyncio.run(service._initialize_faiss_index())
+        assert service.index_mmapped
+    return service
+
+
+def new_vector(service, seed):
+    vector = np.random.default_rng(seed).standard_normal(service.embedding_dim).astype(np.float32)
+    return vector / np.linalg.norm(vector)
+
+
+@pytest.mark.parametrize("quantization, mmap", [("none", False), ("sq8", False), ("fp16", True)])
+def test_update_re_encodes_one_row_in_place(tmp_path, monkeypatch, quantization, mmap):
+    service = make_service(tmp_path, monkeypatch, quantization, mmap=mmap)
+    trained = faiss.vector_to_array(service.index.sq.trained) if quantization == "sq8" else None
+    service.model = FixedModel(new_vector(service, 1))
+    # The index methods log and swallow errors, so record calls rather than raising
+    rebuilds = []
+    monkeypatch.setattr(service, "_build_index", rebuilds.append)
+
+    asyncio.run(service.update_product_in_index(service.product_service.products[42].to_product()))
+
+    assert rebuilds == []
+
+    assert service.index.ntotal == SIZE and not service.index_mmapped
+    np.testing.assert_allclose(service.vector_store.get(np.array([42]))[0], service.model.vector, atol=1e-6)
+    if trained is not None:
+        # The quantizer kept its trained ranges
+        assert np.array_equal(faiss.vector_to_array(service.index.sq.trained), trained)
+    _, indices = service._search(service.model.vector.reshape(1, -1), 1)
+    assert indices[0, 0] == 42
+
+    saved = faiss.read_index(str(service.index_path))
+    np.testing.assert_array_equal(faiss.vector_to_array(saved.codes), faiss.vector_to_array(service.index.codes))
+
+
+def test_add_and_update_push_single_rows_to_shards(tmp_path, monkeypatch):
+    service = make_service(tmp_path, monkeypatch, shards=2)
+    vector = new_vector(service, 2)
+    service.model = FixedModel(vector)
+
+    async def run():
+        await service.load_shards()
+        pids = [client.process.pid for client in service.shards.clients]
+
+        reloads = []
+
+        async def record_reload():
+            reloads.append(1)
+
+        monkeypatch.setattr(service, "load_shards", record_reload)
+        try:
+            product = Product(id="new", name="New", category="c9", image_url="u")
+            service.product_service._set_catalog(service.product_service.products.appended(product))
+            await service.add_product_to_index(product)
+            _, added = await service.shards.search(vector.reshape(1, -1), 1)
+
+            service.model = FixedModel(new_vector(service, 3))
+            await service.update_product_in_index(service.product_service.products[7].to_product())
+            _, updated = await service.shards.search(service.model.vector.reshape(1, -1), 1)
+            assert reloads == []
+            assert [client.process.pid for client in service.shards.clients] == pids
+            return added, updated, sum(len(client.rows) for client in service.shards.clients)
+        finally:
+            service.close_shards()
+
+    added, updated, rows = asyncio.run(run())
+    assert added[0, 0] == SIZE
+    assert updated[0, 0] == 7
+    assert rows == SIZE + 1
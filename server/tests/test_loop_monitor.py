@@ -0,0 +1,56 @@
+import asyncio
+import threading
+
+from services.loop_monitor import LoopMonitor, MonitoredThreadPoolExecutor
+from services.metrics import metrics
+
+
+def test_executor_counts_busy_and_queued_jobs():
+    executor = MonitoredThreadPoolExecutor("test-counts", 2)
+    release = threading.Event()
+    started = threading.Semaphore(0)
+
+    def job():
+        started.release()
+        release.wait()
+
+    try:
+        futures = [executor.submit(job) for _ in range(5)]
+        started.acquire()
+        started.acquire()
+        stats = executor.stats()
+        assert stats["busy"] == 2
+        assert stats["queued"] == 3
+        assert stats["utilization"] == 1.0
+
+        # A job cancelled while waiting leaves the queue
+        assert futures[-1].cancel()
+        assert executor.stats()["queued"] == 2
+    finally:
+        release.set()
+        executor.shutdown(wait=True)
+    assert executor.stats() == {"max_workers": 2, "busy": 0, "queued": 0, "utilization": 0.0}
+
+
+def test_executor_metrics_are_labelled():
+    executor = MonitoredThreadPoolExecutor("test-labels", 1)
+    executor.submit(lambda: None).result()
+    executor.shutdown(wait=True)
+    rendered = metrics.render()
+    assert 'vpm_executor_busy{executor="test-labels"} 0' in rendered
+    assert 'vpm_executor_queued{executor="test-labels"} 0' in rendered
+
+
+def test_snapshot_reports_the_default_executor():
+    monitor = LoopMonitor()
+    executor = MonitoredThreadPoolExecutor("test-default", 2)
+    monitor.watch_executor(executor)
+
+    async def main():
+        asyncio.get_running_loop().set_default_executor(executor)
+        return await asyncio.to_thread(lambda: 42)
+
+    assert asyncio.run(main()) == 42
+    snapshot = monitor.snapshot()
+    assert snapshot["executors"]["test-default"]["busy"] == 0
+    assert not snapshot["overloaded"]
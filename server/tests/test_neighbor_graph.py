@@ -0,0 +1,85 @@
+import faiss
+import numpy as np
+import pytest
+
+from services.neighbor_graph import NeighborGraph
+
+DIM = 16
+
+
+def random_vectors(n, seed):
+    vectors = np.random.default_rng(seed).standard_normal((n, DIM)).astype(np.float32)
+    faiss.normalize_L2(vectors)
+    return vectors
+
+
+def brute_force(vectors, k):
+    scores = vectors @ vectors.T
+    np.fill_diagonal(scores, -np.inf)
+    ids = np.argsort(-scores, axis=1, kind="stable")[:, :k]
+    return ids, np.take_along_axis(scores, ids, axis=1)
+
+
+def full_build(tmp_path, vectors, k):
+    graph = NeighborGraph(tmp_path / "full", k)
+    graph.build(vectors, block_size=64, workers=2)
+    return graph
+
+
+def assert_same_graph(graph, expected):
+    np.testing.assert_array_equal(graph.ids, expected.ids)
+    np.testing.assert_allclose(graph.scores, expected.scores, rtol=1e-5, atol=1e-6)
+
+
+def test_build_matches_brute_force(tmp_path):
+    vectors = random_vectors(300, 1)
+    graph = full_build(tmp_path, vectors, 10)
+    ids, scores = brute_force(vectors, 10)
+    np.testing.assert_array_equal(graph.ids, ids)
+    np.testing.assert_allclose(graph.scores, scores, rtol=1e-5, atol=1e-6)
+
+
+def test_build_with_fewer_rows_than_k_pads_with_empty_slots(tmp_path):
+    graph = full_build(tmp_path, random_vectors(4, 2), 10)
+    assert graph.ids.shape == (4, 10)
+    assert (graph.ids[:, :3] >= 0).all() and (graph.ids[:, 3:] == -1).all()
+
+
+def test_update_after_append_matches_full_build(tmp_path):
+    vectors = random_vectors(300, 3)
+    graph = full_build(tmp_path, vectors[:290], 10)
+    graph.update(vectors, [], block_size=64)
+    assert_same_graph(graph, full_build(tmp_path, vectors, 10))
+
+
+def test_update_after_edit_matches_full_build(tmp_path):
+    vectors = random_vectors(300, 4)
+    graph = full_build(tmp_path, vectors, 10)
+    edited = vectors.copy()
+    # Move two rows right next to others, so many lists gain or lose them
+    edited[[7, 150]] = random_vectors(2, 5)
+    edited[42] = vectors[0] + 0.05 * random_vectors(1, 6)[0]
+    edited[42] /= np.linalg.norm(edited[42])
+    graph.update(edited, [7, 42, 150], block_size=64)
+    assert_same_graph(graph, full_build(tmp_path, edited, 10))
+
+
+def test_update_of_saved_graph_round_trips(tmp_path):
+    vectors = random_vectors(120, 6)
+    full_build(tmp_path, vectors[:100], 5).save()
+
+    graph = NeighborGraph(tmp_path / "full")
+    assert graph.load() and graph.k == 5
+    graph.update(vectors, [3])
+    graph.save()
+
+    reloaded = NeighborGraph(tmp_path / "full")
+    assert reloaded.load()
+    assert_same_graph(reloaded, full_build(tmp_path / "again", vectors, 5))
+
+
+def test_update_cannot_remove_rows(tmp_path):
+    vectors = random_vectors(50, 7)
+    graph = full_build(tmp_path, vectors, 5)
+    with pytest.raises(ValueError):
+        graph.update(vectors[:40], [])
@@ -0,0 +1,74 @@
+import asyncio
+import base64
+
+import numpy as np
+import pytest
+
+pytest.importorskip("torch")
+
+from fastapi import HTTPException
+from starlette.requests import Request
+
+import main
+
+
+def chunked_request(chunks, content_length=None):
+    """Request whose body arrives in ``chunks``, like a chunked upload with no Content-Length"""
+    headers = [] if content_length is None else [(b"content-length", str(content_length).encode())]
+    messages = [{"type": "http.request", "body": chunk, "more_body": True} for chunk in chunks]
+    messages.append({"type": "http.request", "body": b"", "more_body": False})
+    received = []
+
+    async def receive():
+        received.append(1)
+        return messages[len(received) - 1]
+
+    request = Request({"type": "http", "method": "POST", "headers": headers}, receive)
+    return request, received
+
+
+def test_read_body_joins_chunks():
+    request, _ = chunked_request([b"ab", b"cd"])
+    assert asyncio.run(main._read_body(request, 10, "too big")) == b"abcd"
+
+
+def test_read_body_stops_once_the_cap_is_passed():
+    request, received = chunked_request([b"x" * 4] * 10)
+    with pytest.raises(HTTPException) as exc_info:
+        asyncio.run(main._read_body(request, 10, "too big"))
+    assert exc_info.value.status_code == 413
+    # Gave up on the chunk that crossed the cap instead of reading the rest
+    assert len(received) == 3
+
+
+def test_read_body_rejects_large_content_length_unread():
+    request, received = chunked_request([b"x"], content_length=11)
+    with pytest.raises(HTTPException) as exc_info:
+        asyncio.run(main._read_body(request, 10, "too big"))
+    assert exc_info.value.status_code == 413
+    assert received == []
+
+
+def test_parse_query_vectors_raw_and_base64():
+    vectors = np.arange(8, dtype="<f4").reshape(2, 4)
+    raw = main._parse_query_vectors(vectors.tobytes(), "application/octet-stream", 4)
+    encoded = main._parse_query_vectors(base64.b64encode(vectors.tobytes()), "text/plain", 4)
+    assert raw.shape == encoded.shape == (2, 4)
+    np.testing.assert_array_equal(raw, vectors)
+    np.testing.assert_array_equal(encoded, vectors)
+
+
+def test_parse_query_vectors_uses_the_given_dim():
+    body = np.zeros(6, dtype="<f4").tobytes()
+    assert main._parse_query_vectors(body, "application/octet-stream", 3).shape == (2, 3)
+    with pytest.raises(HTTPException) as exc_info:
+        main._parse_query_vectors(body, "application/octet-stream", 4)
+    assert exc_info.value.status_code == 400
+    assert "of 4 values" in exc_info.value.detail
+
+
+def test_parse_query_vectors_rejects_non_finite():
+    body = np.array([1.0, np.nan], dtype="<f4").tobytes()
+    with pytest.raises(HTTPException) as exc_info:
+        main._parse_query_vectors(body, "application/octet-stream", 2)
+    assert exc_info.value.status_code == 400
@@ -0,0 +1,90 @@
+import json
+from datetime import datetime, timezone
+
+import pytest
+
+from services.response_cache import ResponseCache, dumps, etag_matches, make_body
+
+
+def test_hits_until_the_version_changes():
+    cache = ResponseCache(max_bytes=10_000)
+    builds = []
+
+    def build():
+        builds.append(1)
+        return b'{"n":1}'
+
+    first = cache.get(1, "key", build)
+    assert cache.get(1, "key", build) is first
+    assert len(builds) == 1
+
+    cache.get(2, "key", build)
+    assert len(builds) == 2
+    assert cache.snapshot()["hits"] == 1 and cache.snapshot()["misses"] == 2
+
+
+def test_evicts_least_recently_used_by_bytes():
+    cache = ResponseCache(max_bytes=25)
+    for key in "abc":
+        cache.get(1, key, lambda: b"x" * 10)
+    assert list(cache.entries) == ["b", "c"]
+    assert cache.total_bytes == 20
+
+    cache.get(1, "b", lambda: b"")
+    cache.get(1, "d", lambda: b"y" * 10)
+    assert list(cache.entries) == ["b", "d"]
+    assert cache.stats["evictions"] == 2
+
+
+def test_oversized_bodies_are_served_but_not_kept():
+    cache = ResponseCache(max_bytes=5)
+    assert cache.get(1, "big", lambda: b"x" * 10).body == b"x" * 10
+    assert not cache.entries and cache.total_bytes == 0
+
+
+def test_etag_depends_only_on_the_body():
+    assert make_body(b"[1,2]").etag == make_body(b"[1,2]").etag
+    assert make_body(b"[1,2]").etag != make_body(b"[1,3]").etag
+    assert make_body(b"[]").etag.startswith('"') and make_body(b"[]").etag.endswith('"')
+
+
+def test_dumps_matches_api_json():
+    record = {"name": "Lamp", "created_at": datetime(2024, 5, 1, 12, 30, tzinfo=timezone.utc), "tags": []}
+    assert json.loads(dumps(record)) == {"name": "Lamp", "created_at": "2024-05-01T12:30:00+00:00", "tags": []}
+
+
+ETAG = '"abc123"'
+
+
+@pytest.mark.parametrize("header, expected", [
+    (None, False),
+    ("", False),
+    ('"abc123"', True),
+    ('W/"abc123"', True),
+    ('"other", "abc123"', True),
+    (' "other" ,W/"abc123" ', True),
+    ("*", True),
+    ('"abc1234"', False),
+    ('"xabc123"', False),
+    ('"abc12"', False),
+    ('"abc123x", "zz"', False),
+    ("abc123", False),
+])
+def test_etag_matches(header, expected):
+    assert etag_matches(header, ETAG) is expected
+
+
+def test_cached_endpoints_revalidate_with_304():
+    pytest.importorskip("torch")
+    from fastapi.testclient import TestClient
+    import main
+
+    client = TestClient(main.app)
+    response = client.get("/api/categories")
+    etag = response.headers["etag"]
+    assert response.status_code == 200
+
+    assert client.get("/api/categories", headers={"If-None-Match": f'"stale", W/{etag}'}).status_code == 304
+    assert client.get("/api/categories", headers={"If-None-Match": "*"}).status_code == 304
+    # A header that merely contains the ETag as a substring is not a match
+    assert client.get("/api/categories", headers={"If-None-Match": etag[:-1] + 'x"' + etag}).status_code == 200
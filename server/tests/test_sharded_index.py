@@ -0,0 +1,144 @@
+import asyncio
+
+import faiss
+import numpy as np
+import pytest
+
+from services.sharded_index import ShardedIndex, assign_shards
+from services.vector_store import VectorStore
+
+DIM = 32
+
+
+def test_assign_shards_is_deterministic_and_balanced():
+    keys = [f"product-{i}" for i in range(20000)]
+    assignment = assign_shards(keys, 4)
+    assert assignment.dtype == np.int32
+    assert np.array_equal(assignment, assign_shards(keys, 4))
+    counts = np.bincount(assignment, minlength=4)
+    assert counts.min() > 0.9 * len(keys) / 4
+
+
+@pytest.mark.parametrize("shards", [1, 2, 4, 7])
+def test_adding_a_shard_moves_only_keys_it_wins(shards):
+    keys = [f"product-{i}" for i in range(20000)]
+    before = assign_shards(keys, shards)
+    after = assign_shards(keys, shards + 1)
+    moved = before != after
+    # Every moved key went to the new shard, never between old shards
+    assert np.all(after[moved] == shards)
+    assert abs(moved.mean() - 1 / (shards + 1)) < 0.02
+
+
+def test_equal_keys_share_a_shard():
+    keys = ["Shoes", "Books", "Shoes", "Toys", "Books"] * 10
+    assignment = assign_shards(keys, 3)
+    for key in set(keys):
+        assert len(set(assignment[[i for i, k in enumerate(keys) if k == key]])) == 1
+
+
+@pytest.fixture
+def vectors(tmp_path):
+    rng = np.random.default_rng(1)
+    data = rng.standard_normal((600, DIM)).astype(np.float32)
+    faiss.normalize_L2(data)
+    VectorStore(tmp_path / "embeddings.f32", DIM).write(data)
+    return data
+
+
+def flat_search(vectors, queries, k, mask=None):
+    index = faiss.IndexFlatIP(DIM)
+    index.add(vectors)
+    params = None
+    if mask is not None:
+        bitmap = np.packbits(mask, bitorder="little")
+        params = faiss.SearchParameters(sel=faiss.IDSelectorBitmap(len(mask), faiss.swig_ptr(bitmap)))
+    return index.search(queries, k, params=params)
+
+
+def test_sharded_search_matches_in_process(tmp_path, vectors):
+    queries = np.ascontiguousarray(vectors[:5] + 0.1, dtype=np.float32)
+    faiss.normalize_L2(queries)
+    mask = np.zeros(len(vectors), dtype=bool)
+    mask[::7] = True
+
+    async def run():
+        sharded = ShardedIndex(tmp_path / "embeddings.f32", DIM, None, 0, timeout=10.0)
+        try:
+            assignment = assign_shards([f"p{i}" for i in range(len(vectors))], 3)
+            assert await sharded.load(assignment, 3) == len(vectors)
+            assert sorted(len(client.rows) for client in sharded.clients) == sorted(np.bincount(assignment).tolist())
+            unfiltered = await sharded.search(queries, 10)
+            filtered = await sharded.search(queries, 10, mask)
+
+            # Growing to four shards moves only the rows the new shard wins
+            moved = await sharded.load(assign_shards([f"p{i}" for i in range(len(vectors))], 4), 4)
+            regrown = await sharded.search(queries, 10)
+            return unfiltered, filtered, moved, regrown
+        finally:
+            sharded.close()
+
+    (similarities, indices), (masked_similarities, masked_indices), moved, regrown = asyncio.run(run())
+
+    expected_similarities, expected_indices = flat_search(vectors, queries, 10)
+    assert np.array_equal(indices, expected_indices)
+    assert np.allclose(similarities, expected_similarities, atol=1e-5)
+
+    expected_similarities, expected_indices = flat_search(vectors, queries, 10, mask)
+    assert np.array_equal(masked_indices, expected_indices)
+    assert mask[masked_indices].all()
+
+    assert 0 < moved < len(vectors) / 2
+    assert np.array_equal(regrown[1], indices)
+
+
+@pytest.mark.parametrize("qtype, rerank", [(None, 0), (faiss.ScalarQuantizer.QT_8bit, 50)])
+def test_upsert_changes_only_the_given_rows(tmp_path, vectors, qtype, rerank):
+    store = VectorStore(tmp_path / "embeddings.f32", DIM)
+    keys = [f"c{i % 5}" for i in range(len(vectors))]
+    rng = np.random.default_rng(2)
+    edited = vectors.copy()
+    changed = np.array([3, 250, 599])
+    edited[changed] = rng.standard_normal((3, DIM)).astype(np.float32)
+    appended = rng.standard_normal((4, DIM)).astype(np.float32)
+    faiss.normalize_L2(edited)
+    faiss.normalize_L2(appended)
+    final = np.vstack([edited, appended])
+    # Row 3 also changes category, and "moved" hashes to a different shard than "c3"
+    keys[3] = "moved"
+    final_keys = keys + ["c1", "c2", "c3", "c4"]
+    queries = np.ascontiguousarray(final[changed] + 0.05, dtype=np.float32)
+    faiss.normalize_L2(queries)
+    mask = np.zeros(len(final), dtype=bool)
+    mask[::3] = True
+
+    async def run():
+        sharded = ShardedIndex(store.path, DIM, qtype, rerank, timeout=10.0)
+        try:
+            await sharded.load(assign_shards(keys[:3] + ["c3"] + keys[4:], 3), 3)
+            pids = [client.process.pid for client in sharded.clients]
+            for row in changed:
+                store.update(int(row), edited[row])
+            store.append(appended)
+            rows = np.concatenate([changed, np.arange(len(vectors), len(final))])
+            await sharded.upsert(rows, assign_shards([final_keys[row] for row in rows], 3), final[rows])
+
+            assert [client.process.pid for client in sharded.clients] == pids
+            assert np.array_equal(sharded.assignment, assign_shards(final_keys, 3))
+            assert sorted(np.concatenate([client.rows for client in sharded.clients]).tolist()) == list(range(len(final)))
+            return await sharded.search(queries, 10), await sharded.search(queries, 10, mask)
+        finally:
+            sharded.close()
+
+    (_, indices), (_, masked_indices) = asyncio.run(run())
+    index = faiss.IndexFlatIP(DIM)
+    index.add(final)
+    expected = index.search(queries, 10)[1]
+    if qtype is None:
+        assert np.array_equal(indices, expected)
+        assert np.array_equal(masked_indices, flat_search(final, queries, 10, mask)[1])
+    else:
+        # Re-ranked against the exact store; quantization only reorders near-ties outside the top few
+        assert np.array_equal(indices[:, :3], expected[:, :3])
+    assert np.array_equal(indices[:, 0], changed)
+    assert mask[masked_indices[masked_indices >= 0]].all()
@@ -0,0 +1,77 @@
+import asyncio
+
+import numpy as np
+import pytest
+
+pytest.importorskip("torch")
+
+import faiss
+
+from services.catalog_store import CatalogStore
+from services.neighbor_graph import NeighborGraph
+from services.product_service import ProductService
+from services.similarity_service import NEIGHBOR_LOOKUPS, SimilarityService
+
+
+def make_service(tmp_path, monkeypatch, size=200):
+    monkeypatch.setenv("INDEX_QUANTIZATION", "none")
+    monkeypatch.setenv("INDEX_SHARDS", "0")
+    records = [{"id": f"p{i}", "name": f"Product {i}", "category": "c", "image_url": f"u{i}"} for i in range(size)]
+    service = SimilarityService(tmp_path)
+    service.product_service = ProductService(tmp_path, sample_data=False)
+    service.product_service._set_catalog(CatalogStore(records))
+    vectors = np.random.default_rng(0).standard_normal((size, service.embedding_dim)).astype(np.float32)
+    faiss.normalize_L2(vectors)
+    service.vector_store.write(vectors)
+    service._build_index(vectors)
+    return service, vectors
+
+
+def expected_ids(vectors, position, k):
+    scores = vectors @ vectors[position]
+    scores[position] = -np.inf
+    return [f"p{i}" for i in np.argsort(-scores, kind="stable")[:k]]
+
+
+def lookups(result):
+    return NEIGHBOR_LOOKUPS.values.get((result,), 0)
+
+
+def test_served_from_the_neighbor_graph(tmp_path, monkeypatch):
+    service, vectors = make_service(tmp_path, monkeypatch)
+    assert service.precompute_neighbors(k=10) == 200
+
+    async def no_search(*args, **kwargs):
+        raise AssertionError("searched the index instead of the neighbour graph")
+
+    monkeypatch.setattr(service, "_search_any", no_search)
+    hits = lookups("hit")
+    results = asyncio.run(service.find_similar_to_product("p5", min_similarity=-1.0, max_results=10))
+    assert [result.product.id for result in results] == expected_ids(vectors, 5, 10)
+    assert lookups("hit") == hits + 1
+
+
+def test_short_graph_falls_back_to_the_index(tmp_path, monkeypatch):
+    service, vectors = make_service(tmp_path, monkeypatch)
+    service.precompute_neighbors(k=5)
+    short = lookups("short")
+    results = asyncio.run(service.find_similar_to_product("p5", min_similarity=-1.0, max_results=10))
+    assert [result.product.id for result in results] == expected_ids(vectors, 5, 10)
+    assert lookups("short") == short + 1
+
+
+def test_refresh_neighbors_matches_a_rebuilt_graph(tmp_path, monkeypatch):
+    service, vectors = make_service(tmp_path, monkeypatch)
+    service.precompute_neighbors(k=10)
+
+    edited = vectors[0] + 0.05 * vectors[1]
+    edited /= np.linalg.norm(edited)
+    service.vector_store.update(9, edited.reshape(1, -1))
+    vectors[9] = edited
+    service._refresh_neighbors([9], service.index.ntotal)
+
+    saved = NeighborGraph(service.neighbor_graph.path)
+    assert saved.load()
+    rebuilt = NeighborGraph(tmp_path / "rebuilt", 10)
+    rebuilt.build(vectors)
+    np.testing.assert_array_equal(saved.ids, rebuilt.ids)
@@ -0,0 +1,60 @@
+import asyncio
+
+import numpy as np
+import pytest
+
+pytest.importorskip("torch")
+
+import faiss
+
+import main
+import serve
+from services.catalog_store import CatalogStore
+from services.product_service import ProductService
+from services.similarity_service import SimilarityService
+
+
+def make_service(tmp_path, monkeypatch, size=200):
+    monkeypatch.setenv("INDEX_SHARDS", "2")
+    monkeypatch.setenv("INDEX_QUANTIZATION", "none")
+    records = [{"id": f"p{i}", "name": f"Product {i}", "category": "c", "image_url": f"u{i}"} for i in range(size)]
+    service = SimilarityService(tmp_path)
+    service.product_service = ProductService(tmp_path, sample_data=False)
+    service.product_service._set_catalog(CatalogStore(records))
+    vectors = np.random.default_rng(0).standard_normal((size, service.embedding_dim)).astype(np.float32)
+    faiss.normalize_L2(vectors)
+    service.vector_store.write(vectors)
+    service._build_index(vectors)
+    # Only checked for truthiness on reload, which re-reads the saved index instead of embedding
+    service.model = object()
+    assert service.shard_count == 2
+    return service
+
+
+def test_worker_reload_starts_shards(tmp_path, monkeypatch):
+    service = make_service(tmp_path, monkeypatch)
+
+    async def reload():
+        await service.reload()
+        try:
+            return [client.alive for client in service.shards.clients]
+        finally:
+            service.close_shards()
+
+    assert asyncio.run(reload()) == [True, True]
+
+
+def test_parent_reload_leaves_no_shard_processes(tmp_path, monkeypatch):
+    service = make_service(tmp_path, monkeypatch)
+    # Shards left from an earlier loop, as a parent that started them would have
+    asyncio.run(service.load_shards())
+    processes = [client.process for client in service.shards.clients]
+    assert len(processes) == 2
+
+    monkeypatch.setattr(main, "product_service", service.product_service)
+    monkeypatch.setattr(main, "similarity_service", service)
+    serve.Supervisor(None, 0, "info").reload()
+
+    assert service.shards is None
+    assert all(process.poll() is not None for process in processes)
+    assert service.index.ntotal == 200
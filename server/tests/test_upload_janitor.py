@@ -0,0 +1,93 @@
+import asyncio
+import io
+import os
+import time
+
+from fastapi import FastAPI
+from fastapi.testclient import TestClient
+from PIL import Image
+
+from services.derivative_cache import DerivativeCache
+from services.upload_janitor import TrackedStaticFiles, UploadJanitor
+
+HASHES = ["a" * 32, "b" * 32, "c" * 32]
+
+
+def write_uploads(root, size=1000):
+    root.mkdir(exist_ok=True)
+    paths = []
+    for offset, image_hash in enumerate(HASHES):
+        path = root / f"{image_hash}.jpg"
+        buffer = io.BytesIO()
+        Image.new("RGB", (40, 40), (offset * 80, 0, 0)).save(buffer, "JPEG")
+        path.write_bytes(buffer.getvalue() + b"\0" * size)
+        stamp = time.time() - 3600 + offset
+        os.utime(path, (stamp, stamp))
+        paths.append(path)
+    return paths
+
+
+def make_janitor(root, max_bytes):
+    janitor = UploadJanitor(root, max_age_seconds=86400, max_bytes=max_bytes)
+    asyncio.run(janitor.rescan())
+    return janitor
+
+
+def test_touch_protects_a_file_from_eviction(tmp_path):
+    paths = write_uploads(tmp_path / "uploads")
+    janitor = make_janitor(tmp_path / "uploads", max_bytes=os.path.getsize(paths[0]) + os.path.getsize(paths[2]))
+
+    janitor.touch(paths[0])
+    janitor.sweep()
+
+    assert paths[0].exists() and not paths[1].exists() and paths[2].exists()
+
+
+def test_touch_persists_access_time_for_rescans(tmp_path):
+    paths = write_uploads(tmp_path / "uploads")
+    janitor = make_janitor(tmp_path / "uploads", max_bytes=10 ** 9)
+
+    janitor.touch(paths[0])
+    assert os.path.getmtime(paths[0]) > time.time() - 60
+    assert list(make_janitor(tmp_path / "uploads", max_bytes=10 ** 9).entries)[-1] == paths[0].name
+
+
+def test_touch_ignores_paths_outside_root_and_tracks_new_files(tmp_path):
+    (tmp_path / "uploads").mkdir()
+    janitor = make_janitor(tmp_path / "uploads", max_bytes=10 ** 9)
+    janitor.touch(tmp_path / "elsewhere.jpg")
+    assert not janitor.entries
+
+    # A file another worker wrote since the last rescan
+    new_file = tmp_path / "uploads" / "new.jpg"
+    new_file.write_bytes(b"x" * 10)
+    janitor.touch(new_file)
+    assert janitor.entries["new.jpg"][0] == 10
+
+
+def test_derivative_requests_touch_their_source(tmp_path):
+    paths = write_uploads(tmp_path / "uploads")
+    janitor = make_janitor(tmp_path / "uploads", max_bytes=10 ** 9)
+    cache = DerivativeCache([tmp_path / "uploads"], tmp_path / "cache", 10 ** 9, [20], on_source_used=janitor.touch)
+
+    asyncio.run(cache.get(HASHES[0], 20, 20, "JPEG"))
+    assert list(janitor.entries)[-1] == paths[0].name
+
+    janitor.touch(paths[1])
+    # A cache hit does not read the original but still counts as using it
+    asyncio.run(cache.get(HASHES[0], 20, 20, "JPEG"))
+    assert cache.stats["hits"] == 1
+    assert list(janitor.entries)[-1] == paths[0].name
+
+
+def test_served_uploads_are_touched(tmp_path):
+    paths = write_uploads(tmp_path / "uploads")
+    janitor = make_janitor(tmp_path / "uploads", max_bytes=10 ** 9)
+    app = FastAPI()
+    app.mount("/uploads", TrackedStaticFiles(janitor, directory=str(tmp_path / "uploads")), name="uploads")
+
+    with TestClient(app) as client:
+        assert client.get(f"/uploads/{paths[0].name}").status_code == 200
+        assert client.get("/uploads/missing.jpg").status_code == 404
+
+    assert list(janitor.entries)[-1] == paths[0].name